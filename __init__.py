@@ -12,20 +12,37 @@ if "bpy" in locals():
     import importlib
     importlib.reload(op_seams_to_sewingpattern)
     importlib.reload(op_export_sewingpattern)
+    importlib.reload(op_import_sewingpattern)
     importlib.reload(op_quick_clothsim)
     importlib.reload(op_boundary_alinged_remesh)
     importlib.reload(op_clean_up_edges)
     importlib.reload(op_mark_directional_material)
+    importlib.reload(tracing)
+    importlib.reload(pattern_io)
+    importlib.reload(flattenability)
+    importlib.reload(lscm_solver)
+    importlib.reload(symmetry)
+    importlib.reload(island_stream)
+    importlib.reload(op_check_flattenability)
 else:
     from . import op_seams_to_sewingpattern
     from . import op_export_sewingpattern
+    from . import op_import_sewingpattern
     from . import op_quick_clothsim
     from . import op_boundary_alinged_remesh
     from . import op_clean_up_edges
     from . import op_mark_directional_material
+    from . import tracing
+    from . import pattern_io
+    from . import flattenability
+    from . import lscm_solver
+    from . import symmetry
+    from . import island_stream
+    from . import op_check_flattenability
 
 import bpy
-from bpy.types import Menu
+from bpy.types import Menu, AddonPreferences
+from bpy.props import BoolProperty, StringProperty
 
 def clean_up_func(self, context):
     self.layout.separator()
@@ -46,17 +63,59 @@ class VIEW3D_MT_object_seams_to_sewing_pattern_menu(Menu):
     def draw(self, context):
         layout = self.layout
         layout.operator("object.seams_to_sewingpattern", text="Seams to Sewing Pattern", icon="OUTLINER_DATA_SURFACE")
+        layout.operator("object.check_flattenability", text="Check Flattenability", icon="VIEWZOOM")
         layout.separator()
         layout.operator("object.export_sewingpattern", text="Export Sewing Pattern (.svg)", icon="EXPORT")
+        layout.operator("object.import_sewingpattern", text="Import Saved Pattern", icon="IMPORT")
         layout.separator()
         layout.operator("object.quick_clothsim", text="Quick Clothsim", icon="MOD_CLOTH")
 
 
+def update_tracing(self, context):
+    tracing.configure(self.trace, bpy.path.abspath(self.trace_directory), self.trace_memory)
+
+class SeamsToSewingPatternPreferences(AddonPreferences):
+    bl_idname = __name__
+
+    trace: BoolProperty(
+        name="Trace Operators",
+        description="Write the time every operator stage takes to trace files. The S2S_TRACE environment variable does the same",
+        default=False,
+        update=update_tracing,
+    )
+    trace_directory: StringProperty(
+        name="Trace Directory",
+        description="Where trace files are written, the temporary directory if empty",
+        subtype='DIR_PATH',
+        default="",
+        update=update_tracing,
+    )
+    trace_memory: BoolProperty(
+        name="Trace Memory",
+        description="Also record the peak memory of every stage. This makes operators a lot slower",
+        default=False,
+        update=update_tracing,
+    )
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, "trace")
+        row = layout.row()
+        row.prop(self, "trace_directory")
+        row.enabled = self.trace
+        row = layout.row()
+        row.prop(self, "trace_memory")
+        row.enabled = self.trace
+
+
 # Register
 classes = [
+    SeamsToSewingPatternPreferences,
     VIEW3D_MT_object_seams_to_sewing_pattern_menu,
     op_seams_to_sewingpattern.Seams_To_SewingPattern,
+    op_check_flattenability.Check_Flattenability,
     op_export_sewingpattern.Export_Sewingpattern,
+    op_import_sewingpattern.Import_Sewingpattern,
     op_quick_clothsim.QuickClothsim,
     op_boundary_alinged_remesh.Remesher,
     op_clean_up_edges.CleanUpEdges,
@@ -68,6 +127,9 @@ def register():
     from bpy.utils import register_class
     for cls in classes:
         register_class(cls)
+    addon = bpy.context.preferences.addons.get(__name__)
+    if addon is not None:
+        update_tracing(addon.preferences, bpy.context)
     # Adds submenu in View3D > Seams to Sewing Pattern
     bpy.types.VIEW3D_MT_object.append(menu_func)
     bpy.types.VIEW3D_MT_edit_mesh_clean.append(clean_up_func)
@@ -0,0 +1,262 @@
+"""Headless cloth bake for sewing patterns.
+
+Applies the Quick Clothsim setup to a pattern object and bakes its point
+cache to disk, frame by frame, so it can run on a render farm:
+
+    blender -b garment.blend -P bake_runner.py -- --object Pattern --cache-dir /bakes/garment
+
+The working copy of the scene is saved into the cache directory, so the
+disk cache ends up next to it. A JSON report with the solver time of every
+frame, and the peak resident memory of the process up to it, is rewritten
+after each frame. Running the same
+command again resumes from the last frame in the cache instead of starting
+over, which is what makes it safe to kill a worker. It only resumes a bake
+of the same Quick Clothsim options, cloth settings and frames, a cache
+directory holding any other bake is started over.
+
+The add-on has to be enabled, either in the user preferences or with
+--addon <module name>.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import bmesh
+import bpy
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+WORK_FILE = "work.blend"
+REPORT_FILE = "report.json"
+
+
+def parse_arguments(argv):
+    # everything after "--" is ours, the rest belongs to blender
+    if "--" in argv:
+        argv = argv[argv.index("--") + 1:]
+    else:
+        argv = []
+
+    parser = argparse.ArgumentParser(prog="blender -b <file> -P bake_runner.py --", description="Bakes the Quick Clothsim setup of a sewing pattern to a disk cache.")
+    parser.add_argument("--object", help="name of the pattern object, the active object if left out")
+    parser.add_argument("--pattern", help="pattern saved by Seams to Sewing Pattern (.npz or directory) to bake, instead of an object in the .blend")
+    parser.add_argument("--cache-dir", required=True, help="directory for the working copy, the disk cache and the report")
+    parser.add_argument("--frame-start", type=int, help="first frame, the scene start if left out")
+    parser.add_argument("--frame-end", type=int, help="last frame, the scene end if left out")
+    parser.add_argument("--report", help="path of the JSON report, <cache-dir>/" + REPORT_FILE + " if left out")
+    parser.add_argument("--no-resume", action="store_true", help="start over even if the cache directory has a partial bake")
+    parser.add_argument("--addon", help="module name of the add-on to enable, if it isn't enabled in the preferences")
+    parser.add_argument("--clothsim", default="{}", help="JSON object with Quick Clothsim options, for example '{\"pressure_style\": \"HIGH\"}'")
+    parser.add_argument("--cloth-settings", default="{}", help="JSON object with cloth settings to set after Quick Clothsim, for example '{\"air_damping\": 5}'")
+    return parser.parse_args(argv)
+
+
+def process_peak_rss():
+    """ Peak resident memory of this process since it started in bytes, None where unknown.
+
+    It never goes down, a frame only raises it if it needed more than any
+    frame (or the scene loading) before it.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def write_report(path, report):
+    # write and rename, so a killed worker never leaves half a report behind
+    temp = path + ".tmp"
+    with open(temp, "w") as file:
+        json.dump(report, file, indent=1)
+    os.replace(temp, path)
+
+
+def cloth_modifier(obj):
+    for modifier in obj.modifiers:
+        if modifier.type == 'CLOTH':
+            return modifier
+    return None
+
+
+def sewing_gap(bm):
+    """ Mean length of the sewing edges, which the simulation pulls shut """
+    lengths = [e.calc_length() for e in bm.edges if e.is_wire]
+    return sum(lengths) / len(lengths) if lengths else 0.0
+
+
+def measure(obj, rest_gap):
+    """ Volume and sewing gap of the current frame, compared to the unfolded pattern """
+    evaluated = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+    bm = bmesh.new()
+    bm.from_mesh(evaluated.to_mesh())
+    volume = abs(bm.calc_volume())
+    gap = sewing_gap(bm)
+    bm.free()
+    evaluated.to_mesh_clear()
+
+    metrics = {"volume": volume, "sewing_gap": gap}
+    initial_volume = obj.get("S2S_InitialVolume")
+    if initial_volume:
+        metrics["volume_ratio"] = volume / abs(initial_volume)
+    if rest_gap > 0:
+        # 1 when every sewing edge is closed, 0 when nothing moved
+        metrics["gap_closure"] = 1.0 - gap / rest_gap
+    return metrics
+
+
+def rest_sewing_gap(obj):
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    gap = sewing_gap(bm)
+    bm.free()
+    return gap
+
+
+def resumable(report, args):
+    """ Whether the bake in the report was started with the same options as args """
+    return (
+        report.get("clothsim") == json.loads(args.clothsim)
+        and report.get("cloth_settings") == json.loads(args.cloth_settings)
+        and args.frame_start in (None, report.get("frame_start"))
+        and args.frame_end in (None, report.get("frame_end"))
+    )
+
+
+def setup(args):
+    """ Applies Quick Clothsim to the pattern object and saves the working copy, returns the object """
+    if args.addon:
+        import addon_utils
+        addon_utils.enable(args.addon, default_set=True)
+    if not hasattr(bpy.types, "OBJECT_OT_quick_clothsim"):
+        raise RuntimeError("Quick Clothsim is not available, enable the add-on or pass --addon")
+
+    scene = bpy.context.scene
+    if args.pattern:
+        import importlib
+        package = bpy.types.OBJECT_OT_quick_clothsim.__module__.rpartition(".")[0]
+        pattern_io = importlib.import_module(package + ".pattern_io")
+        obj = pattern_io.load_object(args.pattern, bpy.context, args.object)
+    else:
+        obj = scene.objects.get(args.object) if args.object else bpy.context.view_layer.objects.active
+    if obj is None or obj.type != 'MESH':
+        raise RuntimeError("No pattern object found: " + str(args.object))
+
+    if bpy.context.object is not None and bpy.context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    for other in bpy.context.selected_objects:
+        other.select_set(False)
+    obj.select_set(True)
+    bpy.context.view_layer.objects.active = obj
+
+    if cloth_modifier(obj) is None:
+        bpy.ops.object.quick_clothsim(**json.loads(args.clothsim))
+
+    settings = cloth_modifier(obj).settings
+    for name, value in json.loads(args.cloth_settings).items():
+        setattr(settings, name, value)
+
+    cache = cloth_modifier(obj).point_cache
+    cache.use_disk_cache = True
+    cache.use_library_path = False
+    if args.frame_start is not None:
+        cache.frame_start = args.frame_start
+    if args.frame_end is not None:
+        cache.frame_end = args.frame_end
+
+    # the disk cache is written next to the .blend file
+    bpy.ops.wm.save_as_mainfile(filepath=os.path.join(args.cache_dir, WORK_FILE), copy=False)
+    return obj
+
+
+def bake(args):
+    os.makedirs(args.cache_dir, exist_ok=True)
+    work_file = os.path.join(args.cache_dir, WORK_FILE)
+    report_path = args.report or os.path.join(args.cache_dir, REPORT_FILE)
+
+    report = None
+    if not args.no_resume and os.path.exists(work_file) and os.path.exists(report_path):
+        with open(report_path) as file:
+            report = json.load(file)
+        if not resumable(report, args):
+            print("The bake in %s has other settings, starting over" % args.cache_dir)
+            report = None
+    if report is not None:
+        bpy.ops.wm.open_mainfile(filepath=work_file)
+        obj = bpy.context.scene.objects[report["object"]]
+        report["resumed"] = report.get("resumed", 0) + 1
+    else:
+        # frames of an earlier bake in the disk cache would be read back as they are
+        shutil.rmtree(os.path.join(args.cache_dir, "blendcache_" + os.path.splitext(WORK_FILE)[0]), ignore_errors=True)
+        source = bpy.data.filepath
+        obj = setup(args)
+        report = {
+            "object": obj.name,
+            "source": source,
+            "triangles": sum(len(p.vertices) - 2 for p in obj.data.polygons),
+            "rest_sewing_gap": rest_sewing_gap(obj),
+            "clothsim": json.loads(args.clothsim),
+            "cloth_settings": json.loads(args.cloth_settings),
+            "frames": [],
+            "resumed": 0,
+        }
+
+    scene = bpy.context.scene
+    cache = cloth_modifier(obj).point_cache
+    report["frame_start"] = cache.frame_start
+    report["frame_end"] = cache.frame_end
+    done = {entry["frame"] for entry in report["frames"]}
+
+    # Frames that are already in the cache are only read back, which brings
+    # the cloth to the state it was in when the worker stopped. Cloth can
+    # only be simulated from the frame before, so this has to go in order.
+    started = time.perf_counter()
+    for frame in range(cache.frame_start, cache.frame_end + 1):
+        frame_started = time.perf_counter()
+        scene.frame_set(frame)
+        if frame in done:
+            continue
+        report["frames"].append({
+            "frame": frame,
+            "seconds": time.perf_counter() - frame_started,
+            "process_peak_rss": process_peak_rss(),
+        })
+        write_report(report_path, report)
+
+    seconds = [entry["seconds"] for entry in report["frames"]]
+    report["total_seconds"] = sum(seconds)
+    report["max_frame_seconds"] = max(seconds, default=0.0)
+    report["process_peak_rss"] = process_peak_rss()
+    report["wall_seconds"] = time.perf_counter() - started
+    report["metrics"] = measure(obj, report["rest_sewing_gap"])
+    report["complete"] = True
+    write_report(report_path, report)
+
+    # mark the cache as baked, so opening the work file doesn't resimulate
+    if hasattr(bpy.context, "temp_override"):
+        with bpy.context.temp_override(point_cache=cache):
+            bpy.ops.ptcache.bake_from_cache()
+    bpy.ops.wm.save_mainfile()
+
+    print("Baked %d frames of %s in %.1f s, report: %s" % (len(report["frames"]), obj.name, report["wall_seconds"], report_path))
+    return report
+
+
+def main():
+    args = parse_arguments(sys.argv)
+    try:
+        bake(args)
+    except Exception as error:
+        print("Bake failed: " + str(error), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""Benchmarks for the add-on's operators on generated garment meshes.
+
+    blender -b -P benchmark.py -- --sizes 1000 10000 100000 --out results.json
+    blender -b -P benchmark.py -- --baseline baseline.json --threshold 1.25
+
+Every mesh (an open cylinder with one seam, a T-shirt like shape with side
+seams and a UV sphere cut along its equator and a meridian) is generated at
+every size, then unfolded, remeshed, exported and cleaned up. The time of
+every stage comes from the operators' tracing spans. With --baseline, every
+stage that got slower than the threshold is reported and the exit code is 1.
+
+It also runs with the bpy module (python benchmark.py ...), as long as the
+add-on can be imported, see --addon.
+"""
+
+import argparse
+import importlib
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import bmesh
+import bpy
+
+MESHES = ("cylinder", "tshirt", "sphere")
+
+
+def parse_arguments():
+    if "--" in sys.argv:
+        argv = sys.argv[sys.argv.index("--") + 1:]
+    elif os.path.basename(sys.argv[0]).lower().startswith("blender"):
+        argv = []
+    else:
+        argv = sys.argv[1:]
+
+    parser = argparse.ArgumentParser(prog="blender -b -P benchmark.py --", description="Times every stage of the sewing pattern operators on generated meshes.")
+    parser.add_argument("--meshes", nargs="+", choices=MESHES, default=list(MESHES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000], help="approximate face counts")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per mesh and size, the median is kept")
+    parser.add_argument("--remesh", action="store_true", help="also run the boundary aligned remesh while unfolding (slow on big meshes)")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="a stage regresses when it takes this many times as long as in the baseline")
+    parser.add_argument("--stage-threshold", action="append", default=[], metavar="STAGE=RATIO", help="threshold for one stage, for example export_sewingpattern/nesting=2")
+    parser.add_argument("--min-seconds", type=float, default=0.01, help="stages faster than this in the baseline are too noisy to compare")
+    parser.add_argument("--addon", help="module name of the add-on, when it isn't enabled yet")
+    return parser.parse_args(argv)
+
+
+def load_addon(name):
+    """ Enables the add-on if needed and returns its tracing module """
+    if name:
+        import addon_utils
+        addon_utils.enable(name, default_set=False)
+    if not hasattr(bpy.types, "OBJECT_OT_seams_to_sewingpattern"):
+        raise RuntimeError("The add-on is not enabled, pass its module name with --addon")
+    package = name or bpy.types.OBJECT_OT_seams_to_sewingpattern.__module__.rpartition(".")[0]
+    return importlib.import_module(package + ".tracing")
+
+
+def subdivide_to(bm, faces):
+    """ Subdivides all edges evenly until there are about `faces` faces """
+    cuts = max(0, math.ceil(math.sqrt(faces / max(len(bm.faces), 1))) - 1)
+    if cuts > 0:
+        bmesh.ops.subdivide_edges(bm, edges=bm.edges[:], cuts=cuts, use_grid_fill=True)
+
+
+def mark_seams(bm, on_seam):
+    for e in bm.edges:
+        e.seam = on_seam(e.verts[0].co) and on_seam(e.verts[1].co)
+
+
+def create_mesh(kind, faces):
+    """ One of the test garments as a new object, made active and selected """
+    bm = bmesh.new()
+    epsilon = 1e-5
+    if kind == 'cylinder':
+        # open tube, cut open along one line
+        _create(bmesh.ops.create_cone, bm, cap_ends=False, cap_tris=False, segments=32, radius1=0.15, radius2=0.15, depth=0.6)
+        subdivide_to(bm, faces)
+        mark_seams(bm, lambda co: abs(co.y) < epsilon and co.x > 0)
+    elif kind == 'sphere':
+        # two hemispheres, each cut open along half a meridian
+        _create(bmesh.ops.create_uvsphere, bm, u_segments=32, v_segments=16, radius=0.2)
+        subdivide_to(bm, faces)
+        mark_seams(bm, lambda co: abs(co.z) < epsilon or (abs(co.y) < epsilon and co.x > 0))
+    else:
+        # torso box with two sleeves, open at the hem, neck and cuffs, front
+        # and back split by side seams
+        bmesh.ops.create_cube(bm, size=1.0)
+        bmesh.ops.scale(bm, vec=(0.45, 0.25, 0.65), verts=bm.verts)
+        bmesh.ops.delete(bm, geom=[f for f in bm.faces if abs(f.normal.z) > 0.5], context='FACES_ONLY')
+        for side in (-1, 1):
+            face = next(f for f in bm.faces if f.normal.x * side > 0.5)
+            extruded = bmesh.ops.extrude_face_region(bm, geom=[face])
+            verts = [v for v in extruded["geom"] if isinstance(v, bmesh.types.BMVert)]
+            for v in verts:
+                v.co.x += 0.3 * side
+                v.co.z = 0.15 + (v.co.z - 0.15) * 0.5
+            bmesh.ops.delete(bm, geom=[face], context='FACES_ONLY')
+            cuff = [f for f in extruded["geom"] if isinstance(f, bmesh.types.BMFace) and f.normal.x * side > 0.5]
+            bmesh.ops.delete(bm, geom=cuff, context='FACES_ONLY')
+        bmesh.ops.bisect_plane(bm, geom=bm.verts[:] + bm.edges[:] + bm.faces[:], plane_co=(0, 0, 0), plane_no=(0, 1, 0))
+        subdivide_to(bm, faces)
+        mark_seams(bm, lambda co: abs(co.y) < epsilon)
+
+    mesh = bpy.data.meshes.new("bench_" + kind)
+    bm.to_mesh(mesh)
+    bm.free()
+    obj = bpy.data.objects.new(mesh.name, mesh)
+    bpy.context.collection.objects.link(obj)
+    for other in bpy.context.selected_objects:
+        other.select_set(False)
+    obj.select_set(True)
+    bpy.context.view_layer.objects.active = obj
+    return obj
+
+
+def _create(op, bm, radius1=None, radius2=None, radius=None, **kwargs):
+    # radius arguments were called diameter before Blender 3.0, but meant the radius
+    try:
+        if radius is not None:
+            return op(bm, radius=radius, **kwargs)
+        return op(bm, radius1=radius1, radius2=radius2, **kwargs)
+    except TypeError:
+        if radius is not None:
+            return op(bm, diameter=radius, **kwargs)
+        return op(bm, diameter1=radius1, diameter2=radius2, **kwargs)
+
+
+def remove(obj):
+    mesh = obj.data
+    bpy.data.objects.remove(obj)
+    bpy.data.meshes.remove(mesh)
+
+
+class TraceReader:
+    """ Reads the spans written by the operators since the last call """
+    def __init__(self, tracing):
+        self.directory = tempfile.mkdtemp(prefix="s2s-bench-")
+        os.environ[tracing.ENV_DIRECTORY] = self.directory
+        self.path = os.path.join(self.directory, tracing.JSONL_FILE)
+        self.offset = 0
+        self.tracing = tracing
+
+    def stages(self):
+        seconds, self.offset = self.tracing.read_spans(self.path, self.offset)
+        return seconds
+
+
+def run_once(kind, faces, args, reader, export_path):
+    obj = create_mesh(kind, faces)
+    face_count = len(obj.data.polygons)
+    stages = dict()
+
+    def timed(name, operator, **kwargs):
+        started = time.perf_counter()
+        operator(**kwargs)
+        stages[name] = time.perf_counter() - started
+        stages.update(reader.stages())
+
+    # clean up the seams of a copy, so it doesn't change what gets unfolded
+    copy = obj.copy()
+    copy.data = obj.data.copy()
+    bpy.context.collection.objects.link(copy)
+    bpy.context.view_layer.objects.active = copy
+    bpy.ops.object.mode_set(mode='EDIT')
+    bpy.ops.mesh.select_mode(type="EDGE")
+    bm = bmesh.from_edit_mesh(copy.data)
+    for e in bm.edges:
+        e.select_set(e.seam)
+    bmesh.update_edit_mesh(copy.data)
+    timed("clean_up_knife_cut (total)", bpy.ops.mesh.clean_up_knife_cut)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    remove(copy)
+    bpy.context.view_layer.objects.active = obj
+    obj.select_set(True)
+
+    timed("seams_to_sewingpattern (total)", bpy.ops.object.seams_to_sewingpattern, keep_original=False, apply_modifiers=False, use_remesh=args.remesh, target_tris=face_count)
+    timed("export_sewingpattern (total)", bpy.ops.object.export_sewingpattern, filepath=export_path, file_format='SVG', also_export={'DXF', 'HPGL'})
+
+    # unfolded in place, so this is the pattern now
+    remove(bpy.context.active_object)
+    return face_count, stages
+
+
+def run(args, tracing):
+    reader = TraceReader(tracing)
+    export_path = os.path.join(reader.directory, "pattern.svg")
+    results = []
+    for kind in args.meshes:
+        for size in args.sizes:
+            runs = []
+            for _ in range(args.repeat):
+                face_count, stages = run_once(kind, size, args, reader, export_path)
+                runs.append(stages)
+            for stage in sorted(set(s for r in runs for s in r)):
+                values = [r[stage] for r in runs if stage in r]
+                results.append({
+                    "mesh": kind,
+                    "size": size,
+                    "faces": face_count,
+                    "stage": stage,
+                    "seconds": statistics.median(values),
+                    "runs": len(values),
+                })
+            print("%s %d faces: %.2f s" % (kind, face_count, sum(r.get("seams_to_sewingpattern (total)", 0.0) + r.get("export_sewingpattern (total)", 0.0) + r.get("clean_up_knife_cut (total)", 0.0) for r in runs) / len(runs)))
+    return results
+
+
+def compare(results, baseline, args):
+    """ Returns the stages that got slower than their threshold """
+    thresholds = dict()
+    for item in args.stage_threshold:
+        stage, _, ratio = item.rpartition("=")
+        thresholds[stage] = float(ratio)
+
+    previous = {(r["mesh"], r["size"], r["stage"]): r["seconds"] for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        before = previous.get((r["mesh"], r["size"], r["stage"]))
+        if before is None or before < args.min_seconds:
+            continue
+        ratio = r["seconds"] / before
+        if ratio > thresholds.get(r["stage"], args.threshold):
+            regressions.append(dict(r, baseline=before, ratio=ratio))
+    return regressions
+
+
+def main():
+    args = parse_arguments()
+    tracing = load_addon(args.addon)
+    results = run(args, tracing)
+    report = {
+        "blender": bpy.app.version_string,
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args)
+        report["regressions"] = regressions
+        for r in regressions:
+            print("REGRESSION %s %d %s: %.3f s, was %.3f s (x%.2f)" % (r["mesh"], r["size"], r["stage"], r["seconds"], r["baseline"], r["ratio"]))
+
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump(report, file, indent=1)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""DXF and HPGL writers for the sewing pattern exporter.
+
+Both writers take the pieces extracted by Export_Sewingpattern.extract_pieces,
+so any number of formats can be written from a single extraction pass.
+Piece coordinates are in millimeters with y pointing down (like SVG), both
+DXF and HPGL have y pointing up, so everything is moved by the piece
+transform (from nesting) and then flipped against the document height.
+"""
+
+from . import pattern_geometry
+
+# AAMA / ASTM D6673 layer numbers
+LAYER_BOUNDARY = "1"
+LAYER_NOTCH = "4"
+LAYER_GRAIN = "7"
+LAYER_SEW = "14"
+LAYER_ANNOTATION = "15"
+
+LAYERS = (
+    (LAYER_BOUNDARY, 7),
+    (LAYER_NOTCH, 1),
+    (LAYER_GRAIN, 3),
+    (LAYER_SEW, 5),
+    (LAYER_ANNOTATION, 2),
+)
+
+# HPGL plotter units per millimeter
+HPGL_UNITS = 40.0
+
+
+class _DXFWriter:
+    def __init__(self, precision):
+        self.precision = precision
+        self.lines = []
+
+    def pair(self, code, value):
+        if isinstance(value, float):
+            value = pattern_geometry.format_number(value, self.precision)
+        self.lines.append("%3d" % code)
+        self.lines.append(str(value))
+
+    def point(self, x, y, offset=0):
+        self.pair(10 + offset, x)
+        self.pair(20 + offset, y)
+        self.pair(30 + offset, 0.0)
+
+    def polyline(self, layer, points):
+        self.pair(0, "POLYLINE")
+        self.pair(8, layer)
+        self.pair(66, 1)
+        self.pair(70, 1) # closed
+        self.point(0.0, 0.0)
+        for x, y in points:
+            self.pair(0, "VERTEX")
+            self.pair(8, layer)
+            self.point(x, y)
+        self.pair(0, "SEQEND")
+        self.pair(8, layer)
+
+    def line(self, layer, start, end):
+        self.pair(0, "LINE")
+        self.pair(8, layer)
+        self.point(start[0], start[1])
+        self.point(end[0], end[1], 1)
+
+    def text(self, layer, position, height, text):
+        self.pair(0, "TEXT")
+        self.pair(8, layer)
+        self.point(position[0], position[1])
+        self.pair(40, height)
+        self.pair(1, text)
+
+
+def write_dxf(pieces, document_height, filepath, precision=3, alignment_numbers=True):
+    """ Writes an AAMA style DXF, with every piece as a block on the standard layers """
+
+    dxf = _DXFWriter(precision)
+
+    dxf.pair(0, "SECTION")
+    dxf.pair(2, "HEADER")
+    dxf.pair(9, "$ACADVER")
+    dxf.pair(1, "AC1009")
+    dxf.pair(9, "$MEASUREMENT")
+    dxf.pair(70, 1) # metric
+    dxf.pair(0, "ENDSEC")
+
+    dxf.pair(0, "SECTION")
+    dxf.pair(2, "TABLES")
+    dxf.pair(0, "TABLE")
+    dxf.pair(2, "LAYER")
+    dxf.pair(70, len(LAYERS))
+    for name, color in LAYERS:
+        dxf.pair(0, "LAYER")
+        dxf.pair(2, name)
+        dxf.pair(70, 0)
+        dxf.pair(62, color)
+        dxf.pair(6, "CONTINUOUS")
+    dxf.pair(0, "ENDTAB")
+    dxf.pair(0, "ENDSEC")
+
+    dxf.pair(0, "SECTION")
+    dxf.pair(2, "BLOCKS")
+    for piece in pieces:
+        def flip(point):
+            x, y = piece.transform_point(point)
+            return (x, document_height - y)
+
+        dxf.pair(0, "BLOCK")
+        dxf.pair(8, "0")
+        dxf.pair(2, piece.name)
+        dxf.pair(70, 0)
+        dxf.point(0.0, 0.0)
+        dxf.pair(3, piece.name)
+
+        for outline in piece.cut_outlines():
+            dxf.polyline(LAYER_BOUNDARY, [flip(p) for p in outline])
+
+        if piece.allowance_outlines:
+            for outline in piece.outlines:
+                dxf.polyline(LAYER_SEW, [flip(p) for p in outline])
+
+        for start, end in piece.grainline:
+            dxf.line(LAYER_GRAIN, flip(start), flip(end))
+
+        for marker in piece.markers:
+            dxf.line(LAYER_NOTCH, flip(marker.line[0]), flip(marker.line[1]))
+            if alignment_numbers:
+                dxf.text(LAYER_ANNOTATION, flip((marker.x, marker.y)), marker.fontSize * 0.7, marker.id)
+
+        dxf.text(LAYER_ANNOTATION, flip(piece.center), 5.0, "Piece Name: " + piece.name)
+        if len(piece.copies) > 1:
+            x, y = flip(piece.center)
+            dxf.text(LAYER_ANNOTATION, (x, y - 7.0), 5.0, "Quantity: " + str(len(piece.copies)))
+
+        dxf.pair(0, "ENDBLK")
+        dxf.pair(8, "0")
+    dxf.pair(0, "ENDSEC")
+
+    dxf.pair(0, "SECTION")
+    dxf.pair(2, "ENTITIES")
+    for piece in pieces:
+        dxf.pair(0, "INSERT")
+        dxf.pair(8, "0")
+        dxf.pair(2, piece.name)
+        dxf.point(0.0, 0.0)
+    dxf.pair(0, "ENDSEC")
+    dxf.pair(0, "EOF")
+
+    with open(filepath, "w") as file:
+        file.write("\n".join(dxf.lines))
+        file.write("\n")
+
+
+def write_hpgl(pieces, document_height, filepath, alignment_numbers=True):
+    """ Writes HPGL/1, cut lines with pen 1, notches with pen 2, labels and grainlines with pen 3 and sew lines with pen 4 """
+
+    def units(piece, point):
+        x, y = piece.transform_point(point)
+        return "%d,%d" % (round(x * HPGL_UNITS), round((document_height - y) * HPGL_UNITS))
+
+    commands = ["IN", "PA"]
+
+    def plot(piece, outline):
+        if len(outline) < 2:
+            return
+        commands.append("PU" + units(piece, outline[0]))
+        commands.append("PD" + ",".join(units(piece, p) for p in outline[1:] + outline[:1]))
+
+    commands.append("SP1")
+    for piece in pieces:
+        for outline in piece.cut_outlines():
+            plot(piece, outline)
+
+    commands.append("SP2")
+    for piece in pieces:
+        for marker in piece.markers:
+            commands.append("PU" + units(piece, marker.line[0]))
+            commands.append("PD" + units(piece, marker.line[1]))
+
+    commands.append("SP3")
+    for piece in pieces:
+        # SI takes the character width and height in centimeters
+        commands.append("SI0.35,0.5")
+        commands.append("PU" + units(piece, piece.center))
+        commands.append("LB" + piece.label() + "\x03")
+        for start, end in piece.grainline:
+            commands.append("PU" + units(piece, start))
+            commands.append("PD" + units(piece, end))
+        if alignment_numbers:
+            commands.append("SI0.15,0.2")
+            for marker in piece.markers:
+                commands.append("PU" + units(piece, (marker.x, marker.y)))
+                commands.append("LB" + str(marker.id) + "\x03")
+
+    if any(piece.allowance_outlines for piece in pieces):
+        commands.append("SP4")
+        for piece in pieces:
+            if piece.allowance_outlines:
+                for outline in piece.outlines:
+                    plot(piece, outline)
+
+    commands.append("PU")
+    commands.append("SP0")
+
+    with open(filepath, "w") as file:
+        file.write(";".join(commands))
+        file.write(";\n")
@@ -0,0 +1,257 @@
+"""Checks whether the pieces of a seamed mesh can be flattened, before unfolding it.
+
+The mesh is cut along its seams (on paper, nothing is changed) and every
+resulting piece gets
+- its Euler characteristic V - E + F, counted after the cut, so vertices on
+  seams count once for every side they're on
+- the number of boundary loops
+- the integrated Gaussian curvature, the sum of the angle defects of its
+  inner vertices, and the same sum of absolute values
+
+Only pieces that are topological disks (Euler characteristic 1, one boundary
+loop) can be unfolded. Closed pieces (no boundary), tubes (two boundaries) and
+pieces with handles are missing seams. A disk with a lot of curvature can be
+unfolded, but will be stretched a lot.
+
+Everything but the seam suggestions runs as numpy over all faces at once.
+"""
+
+import heapq
+import math
+
+import numpy as np
+
+
+def connected_components(count, a, b):
+    """ Labels 0..n-1 for count nodes connected by the pairs (a[i], b[i]) """
+    labels = np.arange(count)
+    if len(a):
+        # every node takes the lowest label of its neighbors, with pointer
+        # jumping so long chains don't need as many rounds as they are long
+        while True:
+            updated = labels.copy()
+            np.minimum.at(updated, a, labels[b])
+            np.minimum.at(updated, b, labels[a])
+            updated = updated[updated]
+            if np.array_equal(updated, labels):
+                break
+            labels = updated
+    _, labels = np.unique(labels, return_inverse=True)
+    return labels.ravel()
+
+
+def mesh_arrays(mesh):
+    """ The arrays analyze() needs, from a mesh in object mode """
+    positions = np.empty(len(mesh.vertices) * 3)
+    mesh.vertices.foreach_get("co", positions)
+    loop_starts = np.empty(len(mesh.polygons), dtype=np.int64)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    face_verts = np.empty(len(mesh.loops), dtype=np.int64)
+    mesh.loops.foreach_get("vertex_index", face_verts)
+    loop_edges = np.empty(len(mesh.loops), dtype=np.int64)
+    mesh.loops.foreach_get("edge_index", loop_edges)
+    edge_verts = np.empty(len(mesh.edges) * 2, dtype=np.int64)
+    mesh.edges.foreach_get("vertices", edge_verts)
+    seams = np.zeros(len(mesh.edges), dtype=bool)
+    mesh.edges.foreach_get("use_seam", seams)
+    return {
+        "positions": positions.reshape(-1, 3),
+        "face_offsets": np.append(loop_starts, len(mesh.loops)),
+        "face_verts": face_verts,
+        "loop_edges": loop_edges,
+        "edge_verts": edge_verts.reshape(-1, 2),
+        "seams": seams,
+    }
+
+
+class Analysis:
+    """ Per piece topology and curvature of a mesh cut along its seams """
+
+    def __init__(self, positions, face_offsets, face_verts, loop_edges, edge_verts, seams):
+        self.positions = positions
+        self.face_verts = face_verts
+        self.loop_edges = loop_edges
+        self.edge_verts = edge_verts
+
+        face_count = len(face_offsets) - 1
+        loop_count = len(face_verts)
+        sizes = np.diff(face_offsets)
+        loop_face = np.repeat(np.arange(face_count), sizes)
+        next_loop = np.arange(1, loop_count + 1)
+        next_loop[face_offsets[1:] - 1] = face_offsets[:-1]
+        prev_loop = np.arange(-1, loop_count - 1)
+        prev_loop[face_offsets[:-1]] = face_offsets[1:] - 1
+
+        # edges that hold two faces together: manifold and not a seam
+        face_counts = np.bincount(loop_edges, minlength=len(edge_verts))
+        joined = (face_counts == 2) & ~seams
+        order = np.argsort(loop_edges, kind='stable')
+        first = np.concatenate(([0], np.cumsum(face_counts)[:-1]))
+        joined_edges = np.flatnonzero(joined)
+        l1 = order[first[joined_edges]]
+        l2 = order[first[joined_edges] + 1]
+
+        self.face_islands = connected_components(face_count, loop_face[l1], loop_face[l2])
+        self.island_count = int(self.face_islands.max(initial=-1)) + 1
+        loop_island = self.face_islands[loop_face]
+
+        # corners around a vertex that are joined by one of those edges belong
+        # to the same vertex after cutting, whichever way the faces wind
+        same_way = face_verts[l2] != face_verts[l1]
+        n1 = next_loop[l1]
+        n2 = next_loop[l2]
+        corner_a = np.concatenate((l1, n1))
+        corner_b = np.concatenate((np.where(same_way, n2, l2), np.where(same_way, l2, n2)))
+        self.split_verts = connected_components(loop_count, corner_a, corner_b)
+        split_count = int(self.split_verts.max(initial=-1)) + 1
+        self.split_vert_origin = np.zeros(split_count, dtype=np.int64)
+        self.split_vert_origin[self.split_verts] = face_verts
+        split_island = np.zeros(split_count, dtype=np.int64)
+        split_island[self.split_verts] = loop_island
+
+        # every loop on an edge that isn't joined is a boundary edge of its piece
+        boundary_loops = np.flatnonzero(~joined[loop_edges])
+        islands = self.island_count
+        self.faces = np.bincount(self.face_islands, minlength=islands)
+        self.edges = (np.bincount(loop_island[l1], minlength=islands)
+                      + np.bincount(loop_island[boundary_loops], minlength=islands))
+        self.verts = np.bincount(split_island, minlength=islands)
+        self.euler = self.verts - self.edges + self.faces
+
+        # boundary loops, as components of the split vertices on the boundary
+        start = self.split_verts[boundary_loops]
+        end = self.split_verts[next_loop[boundary_loops]]
+        boundary_labels = connected_components(split_count, start, end)
+        self.on_boundary = np.zeros(split_count, dtype=bool)
+        self.on_boundary[start] = True
+        self.boundary_loop_of = np.where(self.on_boundary, boundary_labels, -1)
+        loops = np.unique(boundary_labels[self.on_boundary])
+        loop_island_of = np.zeros(int(boundary_labels.max(initial=-1)) + 1, dtype=np.int64)
+        loop_island_of[boundary_labels] = split_island
+        self.boundaries = np.bincount(loop_island_of[loops], minlength=islands)
+        self.genus = (2 - self.euler - self.boundaries) // 2
+
+        # corner angles, then the angle defect of every inner split vertex
+        corner = positions[face_verts]
+        u = positions[face_verts[next_loop]] - corner
+        w = positions[face_verts[prev_loop]] - corner
+        angles = np.arctan2(np.linalg.norm(np.cross(u, w), axis=1), np.einsum('ij,ij->i', u, w))
+        angle_sums = np.bincount(self.split_verts, weights=angles, minlength=split_count)
+        self.defects = np.where(self.on_boundary, 0.0, 2 * math.pi - angle_sums)
+        self.curvature = np.bincount(split_island, weights=self.defects, minlength=islands)
+        self.abs_curvature = np.bincount(split_island, weights=np.abs(self.defects), minlength=islands)
+        self.split_island = split_island
+        self.joined_edges = joined_edges
+        self.joined_island = loop_island[l1]
+
+    def is_disk(self):
+        """ Per piece, whether it can be unfolded at all """
+        return (self.euler == 1) & (self.boundaries == 1)
+
+    def problems(self, max_curvature):
+        """ (pieces that can't be unfolded, disks curved more than max_curvature radians) """
+        disk = self.is_disk()
+        return np.flatnonzero(~disk), np.flatnonzero(disk & (self.abs_curvature > max_curvature))
+
+    def describe(self, island):
+        if self.boundaries[island] == 0:
+            return "closed"
+        if self.genus[island] > 0:
+            return "%d handle(s)" % self.genus[island]
+        if self.boundaries[island] > 1:
+            return "%d boundaries" % self.boundaries[island]
+        return "%.0f° of curvature" % math.degrees(self.abs_curvature[island])
+
+    def _graph(self, island):
+        """ The joined edges of a piece as adjacency lists, with their lengths and edge indices """
+        edges = self.joined_edges[self.joined_island == island]
+        a, b = self.edge_verts[edges].T
+        lengths = np.linalg.norm(self.positions[a] - self.positions[b], axis=1)
+        graph = dict()
+        for va, vb, length, e in zip(a.tolist(), b.tolist(), lengths.tolist(), edges.tolist()):
+            graph.setdefault(va, []).append((vb, length, e))
+            graph.setdefault(vb, []).append((va, length, e))
+        return graph
+
+    def suggest_seams(self, island):
+        """ Edge indices that would make a piece easier to unfold, when cut.
+
+        Closed pieces get a cut between the most curved vertex and the vertex
+        farthest from it, pieces with several boundaries get cuts that join
+        them all, and curved disks get a dart from their most curved vertex
+        to the boundary.
+        """
+        graph = self._graph(island)
+        in_island = self.split_island == island
+        origin = self.split_vert_origin
+        if not graph:
+            return []
+
+        if self.boundaries[island] == 0:
+            peak = int(origin[in_island][np.argmax(np.abs(self.defects[in_island]))])
+            distance, previous, _ = _dijkstra(graph, [peak])
+            end = max(distance, key=distance.get)
+            return _path(previous, end)
+
+        loops = dict()
+        for split_vert in np.flatnonzero(in_island & self.on_boundary).tolist():
+            loops.setdefault(int(self.boundary_loop_of[split_vert]), set()).add(int(origin[split_vert]))
+        loops = list(loops.values())
+
+        if len(loops) > 1:
+            seams = []
+            connected = set(loops[0])
+            remaining = loops[1:]
+            while remaining:
+                targets = set().union(*remaining)
+                _, previous, end = _dijkstra(graph, connected, targets)
+                if end is None:
+                    break
+                path = _path(previous, end)
+                seams += path
+                for e in path:
+                    connected.update(self.edge_verts[e].tolist())
+                for loop in [l for l in remaining if end in l]:
+                    connected |= loop
+                    remaining.remove(loop)
+            return seams
+
+        inner = in_island & ~self.on_boundary
+        if not inner.any():
+            return []
+        peak = int(origin[inner][np.argmax(self.defects[inner])])
+        _, previous, end = _dijkstra(graph, loops[0], {peak})
+        return _path(previous, end) if end is not None else []
+
+
+def _dijkstra(graph, sources, targets=None):
+    """ Distances from the nearest source, stops at the first target reached and returns it """
+    distance = {s: 0.0 for s in sources}
+    previous = dict()
+    heap = [(0.0, s) for s in distance]
+    heapq.heapify(heap)
+    while heap:
+        d, v = heapq.heappop(heap)
+        if d > distance[v]:
+            continue
+        if targets is not None and v in targets:
+            return distance, previous, v
+        for neighbor, length, edge in graph.get(v, ()):
+            nd = d + length
+            if nd < distance.get(neighbor, math.inf):
+                distance[neighbor] = nd
+                previous[neighbor] = (v, edge)
+                heapq.heappush(heap, (nd, neighbor))
+    return distance, previous, None
+
+
+def _path(previous, end):
+    edges = []
+    while end in previous:
+        end, edge = previous[end]
+        edges.append(edge)
+    return edges[::-1]
+
+
+def analyze_mesh(mesh):
+    return Analysis(**mesh_arrays(mesh))
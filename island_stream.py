@@ -0,0 +1,406 @@
+"""Unfolds a mesh one piece at a time, for garments too big to unfold at once.
+
+The normal unfold cuts, flattens and remeshes the whole mesh in one BMesh.
+Here the mesh is read into flat arrays and cut on paper
+(flattenability.Analysis), then every piece gets a small BMesh of its own: it
+is built from the arrays, flattened, placed, remeshed, read back into arrays
+and freed. The pieces go through this in batches of about BATCH_VERTICES
+vertices, so lscm_solver can flatten the pieces of a batch in parallel.
+Besides the input arrays and the finished pieces, only one batch (or the
+largest piece) is ever held as BMeshes. Pieces lscm_solver can't solve are
+flattened by the unwrap callback unfold() gets, or fail with a PieceError.
+
+The pieces are scaled and their UV's packed once all of them are done. The
+sewing edges join the copies of every vertex the seams split, and the points
+added on a seam edge, which are matched by their edge and their place on it.
+"""
+
+import math
+
+import bmesh
+import mathutils
+import numpy as np
+
+from . import flattenability
+from . import lscm_solver
+from .op_boundary_alinged_remesh import BoundaryAlignedRemesher, FAILED_MESSAGE
+
+# between pieces in UV space, like the margin of the unwrap
+UV_MARGIN = 0.02
+
+# pieces are built and flattened together until they have this many vertices
+BATCH_VERTICES = 50000
+
+# what flattenability.Analysis takes from read_mesh()
+ANALYSIS_ARRAYS = ("positions", "face_offsets", "face_verts", "loop_edges", "edge_verts", "seams")
+
+
+class PieceError(Exception):
+    """ A piece that couldn't be flattened or remeshed """
+    def __init__(self, piece, message):
+        super().__init__("%s (piece %d)" % (message, piece))
+        self.piece = piece
+
+
+def read_mesh(mesh):
+    """ The arrays unfold() needs, from a mesh in object mode """
+    arrays = flattenability.mesh_arrays(mesh)
+    if mesh.uv_layers.active is not None:
+        uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+        mesh.uv_layers.active.data.foreach_get("uv", uvs)
+        arrays["uvs"] = uvs.reshape(-1, 2)
+    materials = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", materials)
+    arrays["materials"] = materials
+
+    attributes = mesh.attributes
+    if "material_direction" in attributes and attributes["material_direction"].domain == 'FACE':
+        grain = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+        attributes["material_direction"].data.foreach_get("vector", grain)
+        arrays["grain"] = grain.reshape(-1, 3)
+    if "seam_allowance" in attributes and attributes["seam_allowance"].domain == 'EDGE':
+        allowances = np.empty(len(mesh.edges), dtype=np.float32)
+        attributes["seam_allowance"].data.foreach_get("value", allowances)
+        arrays["allowances"] = allowances
+    return arrays
+
+
+def surface(positions, face_offsets, face_verts):
+    """ (area, enclosed volume) of a mesh, the volume like BMesh.calc_volume() """
+    triangles, _ = lscm_solver.fan_triangles(face_offsets)
+    p0, p1, p2 = (positions[face_verts[triangles[:, i]]] for i in range(3))
+    area = np.linalg.norm(np.cross(p1 - p0, p2 - p0), axis=1).sum() / 2
+    volume = abs(np.einsum('ij,ij->i', p0, np.cross(p1, p2)).sum()) / 6
+    return area, volume
+
+
+class Piece:
+    """ One piece of the cut mesh in its own BMesh, from 3D to flat and back into arrays """
+
+    def __init__(self, arrays, analysis, faces):
+        face_offsets = arrays["face_offsets"]
+        edge_verts = arrays["edge_verts"]
+        split_verts = analysis.split_verts
+        origin = analysis.split_vert_origin
+        sizes = np.diff(face_offsets)[faces]
+        loops = np.repeat(face_offsets[faces] - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        members, local = np.unique(split_verts[loops], return_inverse=True)
+        local = local.ravel()
+
+        self.bm = bm = bmesh.new()
+        self.uv_layer = bm.loops.layers.uv.new()
+        grain_layer = None
+        if "grain" in arrays and hasattr(bm.faces.layers, "float_vector"):
+            grain_layer = bm.faces.layers.float_vector.new("material_direction")
+        allowance_layer = bm.edges.layers.float.new("seam_allowance") if "allowances" in arrays else None
+
+        verts = [bm.verts.new(co) for co in arrays["positions"][origin[members]].tolist()]
+        # the original vertex of every BMesh vertex, its copies on the other
+        # side of a seam have the same one
+        self.keys = {v: ('v', o) for v, o in zip(verts, origin[members].tolist())}
+        self.uvs = None
+        if "uvs" in arrays:
+            corner_count = np.maximum(np.bincount(local, minlength=len(members)), 1)[:, None]
+            self.uvs = [np.bincount(local, weights=arrays["uvs"][loops, i], minlength=len(members)) for i in range(2)]
+            self.uvs = (np.stack(self.uvs, axis=1) / corner_count).tolist()
+
+        seams = arrays["seams"]
+        self.seam_edges = dict()
+        start = 0
+        for f, size in zip(faces.tolist(), sizes.tolist()):
+            corners = local[start:start + size].tolist()
+            face_loops = loops[start:start + size].tolist()
+            start += size
+            try:
+                face = bm.faces.new([verts[c] for c in corners])
+            except ValueError:
+                # a face on the same vertices as another one
+                continue
+            face.material_index = int(arrays["materials"][f])
+            if grain_layer is not None:
+                face[grain_layer] = arrays["grain"][f].tolist()
+            for i, loop in enumerate(face_loops):
+                source_edge = int(arrays["loop_edges"][loop])
+                edge = bm.edges.get((verts[corners[i]], verts[corners[(i + 1) % size]]))
+                if allowance_layer is not None:
+                    edge[allowance_layer] = float(arrays["allowances"][source_edge])
+                if seams[source_edge]:
+                    # numbered from the lower original vertex on both sides
+                    low = verts[corners[i]] if origin[members[corners[i]]] == edge_verts[source_edge].min() else verts[corners[(i + 1) % size]]
+                    self.seam_edges[edge] = (low, source_edge)
+        self.area_3d = sum(f.calc_area() for f in bm.faces)
+
+    def free(self):
+        if self.bm.is_valid:
+            self.bm.free()
+
+    def subdivide_seams(self, max_length):
+        """ Splits the seam edges on the boundary so none is longer than max_length, and triangulates """
+        self.bm.verts.index_update()
+        for edge, (start, source_edge) in self.seam_edges.items():
+            if not edge.is_valid or not edge.is_boundary:
+                continue
+            cuts = math.floor(edge.calc_length() / max_length)
+            end = edge.other_vert(start)
+            a, b = start.co.copy(), end.co.copy()
+            uv_a = uv_b = None
+            if self.uvs is not None:
+                uv_a, uv_b = self.uvs[start.index], self.uvs[end.index]
+            for i in range(1, cuts + 1):
+                t = i / (cuts + 1)
+                _, vert = bmesh.utils.edge_split(edge, start, 1.0 / (cuts + 2 - i))
+                vert.co = a.lerp(b, t)
+                vert.index = len(self.bm.verts) - 1
+                self.keys[vert] = ('e', source_edge, i)
+                if self.uvs is not None:
+                    self.uvs.append([uv_a[0] + (uv_b[0] - uv_a[0]) * t, uv_a[1] + (uv_b[1] - uv_a[1]) * t])
+                edge = self.bm.edges.get((vert, end))
+                start = vert
+        bmesh.ops.triangulate(
+            self.bm, faces=self.bm.faces, quad_method='BEAUTY', ngon_method='BEAUTY'
+        )
+
+    def job(self):
+        """ The lscm_solver.solve() arguments of the piece, starting from its existing UV's """
+        bm = self.bm
+        bm.verts.index_update()
+        positions = np.array([v.co[:] for v in bm.verts]).reshape(-1, 3)
+        triangles = [(f.verts[0].index, f.verts[i].index, f.verts[i + 1].index) for f in bm.faces for i in range(1, len(f.verts) - 1)]
+        job = {"positions": positions, "triangles": np.array(triangles, dtype=np.int64).reshape(-1, 3)}
+        if self.uvs is not None:
+            job["initial"] = np.array(self.uvs)
+        return job
+
+    def unwrap(self, unwrap):
+        """ UV's from an unwrap(bm) callback, scaled to the area of the piece like lscm_solver's """
+        self.bm.verts.index_update()
+        uvs = np.asarray(unwrap(self.bm), dtype=np.float64)
+        triangles = [(f.verts[0].index, f.verts[i].index, f.verts[i + 1].index) for f in self.bm.faces for i in range(1, len(f.verts) - 1)]
+        a, b, c = (uvs[np.array(triangles, dtype=np.int64).reshape(-1, 3)[:, i]] for i in range(3))
+        area = np.abs(np.cross(b - a, c - a)).sum() / 2
+        return uvs * math.sqrt(self.area_3d / area) if area > 0 else uvs
+
+    def flatten(self, uvs):
+        """ Sets the UV's of the piece, one per vertex """
+        for f in self.bm.faces:
+            for loop in f.loops:
+                loop[self.uv_layer].uv = uvs[loop.vert.index]
+
+    def place(self, uvs):
+        """ Lays the piece flat by its UV's, oriented like the normal unfold does. Returns the flat area """
+        bm = self.bm
+        positions = np.array([v.co[:] for v in bm.verts])
+        loop_verts = np.array([v.index for f in bm.faces for v in f.verts], dtype=np.int64)
+        sizes = np.array([len(f.verts) for f in bm.faces], dtype=np.int64)
+        starts = np.cumsum(sizes) - sizes
+        centers = np.add.reduceat(positions[loop_verts], starts) / sizes[:, None]
+        average_position = centers.mean(axis=0)
+        loop_uvs = uvs[loop_verts]
+        average_uv = loop_uvs.mean(axis=0)
+
+        # a rough tangent and bitangent, then straightened out around their half vector
+        delta = positions[loop_verts] - average_position
+        tangent = mathutils.Vector((delta * (loop_uvs[:, :1] - average_uv[0])).sum(axis=0)).normalized()
+        bitangent = mathutils.Vector((delta * (loop_uvs[:, 1:] - average_uv[1])).sum(axis=0)).normalized()
+        normal = tangent.cross(bitangent).normalized()
+        halfvector = ((tangent + bitangent) / 2).normalized()
+        halfvector = normal.cross(normal.cross(halfvector))
+        tangent = halfvector.copy()
+        tangent.rotate(mathutils.Matrix.Rotation(math.radians(-45.0), 4, normal))
+        bitangent = halfvector.copy()
+        bitangent.rotate(mathutils.Matrix.Rotation(math.radians(45.0), 4, normal))
+
+        self.frame = (np.array(average_position), average_uv, np.array(tangent), np.array(bitangent))
+        flat = (average_position - (uvs[:, :1] - average_uv[0]) * self.frame[2]
+                - (uvs[:, 1:] - average_uv[1]) * self.frame[3] + np.array(normal) * 0.3)
+        for v, co in zip(bm.verts, flat.tolist()):
+            v.co = co
+        return sum(f.calc_area() for f in bm.faces)
+
+    def remesh(self, edge_length, iterations):
+        bm = self.bm
+        bmesh.ops.dissolve_limited(
+            bm, angle_limit=0.01,
+            verts=[v for v in bm.verts if not v.is_boundary],
+            edges=[e for e in bm.edges if not e.is_boundary],
+        )
+        remesher = BoundaryAlignedRemesher(None, bm)
+        for _ in remesher.remesh_steps(edge_length, iterations, quads=False, reproject=False):
+            pass
+
+    def arrays(self, grain_angles):
+        """ The flat piece as arrays, with UV's from where its vertices ended up in the plane """
+        bm = self.bm
+        bm.verts.index_update()
+        positions = np.array([v.co[:] for v in bm.verts]).reshape(-1, 3)
+        average_position, average_uv, tangent, bitangent = self.frame
+        delta = positions - average_position
+        uvs = np.stack((average_uv[0] - delta @ tangent, average_uv[1] - delta @ bitangent), axis=1)
+        face_verts = np.array([v.index for f in bm.faces for v in f.verts], dtype=np.int64)
+        piece = {
+            "positions": positions,
+            "sizes": np.array([len(f.verts) for f in bm.faces], dtype=np.int64),
+            "face_verts": face_verts,
+            "uvs": uvs[face_verts],
+            "materials": np.array([f.material_index for f in bm.faces], dtype=np.int32),
+            "keys": [(v.index, key) for v, key in self.keys.items() if v.is_valid and v.is_boundary],
+        }
+        angle_layer = bm.faces.layers.float.get("S2S_grain_angle") if grain_angles else None
+        if angle_layer is not None:
+            piece["grain_angles"] = np.array([f[angle_layer] for f in bm.faces], dtype=np.float32)
+        if hasattr(bm.faces.layers, "float_vector"):
+            grain_layer = bm.faces.layers.float_vector.get("material_direction")
+            if grain_layer is not None:
+                piece["grain"] = np.array([f[grain_layer][:] for f in bm.faces], dtype=np.float32).reshape(-1, 3)
+        allowance_layer = bm.edges.layers.float.get("seam_allowance")
+        if allowance_layer is not None:
+            allowances = [(e.verts[0].index, e.verts[1].index, e[allowance_layer]) for e in bm.edges if e[allowance_layer] != 0]
+            piece["allowance_edges"] = np.array([a[:2] for a in allowances], dtype=np.int64).reshape(-1, 2)
+            piece["allowance_values"] = np.array([a[2] for a in allowances], dtype=np.float32)
+        return piece
+
+
+def shelf_pack(sizes, margin):
+    """ Offsets that put boxes of the given (n, 2) sizes next to each other in rows, and the size of the whole """
+    offsets = np.zeros_like(sizes)
+    width = max(math.sqrt(((sizes + margin).prod(axis=1)).sum()), sizes[:, 0].max(initial=0.0))
+    x = y = row_height = 0.0
+    for i in np.argsort(-sizes[:, 1], kind='stable').tolist():
+        w, h = sizes[i]
+        if x > 0 and x + w > width:
+            x = 0.0
+            y += row_height + margin
+            row_height = 0.0
+        offsets[i] = (x, y)
+        x += w + margin
+        row_height = max(row_height, h)
+    return offsets, (offsets + sizes).max(axis=0, initial=0.0)
+
+
+def unfold(arrays, remesh=True, target_tris=5000, iterations=10, keep_uvs=False, grain_angles=None, unwrap=None):
+    """ Unfolds the mesh read by read_mesh(), one batch of pieces at a time, as a generator.
+
+    Yields (pieces done, piece count) after every piece and returns the
+    pattern arrays (like pattern_io's, plus per face materials) and the S2S_*
+    properties. grain_angles(bm, face_groups, uv_layer) stores the grain
+    angle of the pieces, if given. unwrap(bm) returns the UV's of every
+    vertex of a piece lscm_solver can't solve. Raises PieceError if a piece
+    can't be flattened (without unwrap) or can't be remeshed.
+    """
+    analysis = flattenability.Analysis(**{name: arrays[name] for name in ANALYSIS_ARRAYS})
+    area, volume = surface(arrays["positions"], arrays["face_offsets"], arrays["face_verts"])
+    # edges of a surface of equilateral triangles
+    max_edge_length = math.sqrt(area / target_tris / (math.sqrt(3) / 4))
+
+    count = analysis.island_count
+    order = np.argsort(analysis.face_islands, kind='stable')
+    bounds = np.searchsorted(analysis.face_islands[order], np.arange(count + 1))
+
+    vertex_counts = np.bincount(analysis.split_island, minlength=count).tolist()
+    batches = [[]]
+    batch_size = 0
+    for island in range(count):
+        if batch_size and batch_size + vertex_counts[island] > BATCH_VERTICES:
+            batches.append([])
+            batch_size = 0
+        batches[-1].append(island)
+        batch_size += vertex_counts[island]
+
+    pieces = []
+    area_before = 0.0
+    area_after = 0.0
+    for batch in batches:
+        built = []
+        try:
+            for island in batch:
+                built.append(Piece(arrays, analysis, order[bounds[island]:bounds[island + 1]]))
+                if remesh:
+                    # a bias to compensate for stretching
+                    built[-1].subdivide_seams(max_edge_length * 0.8)
+            solve = [piece for piece in built if not (keep_uvs and piece.uvs is not None) and len(piece.bm.verts) <= lscm_solver.MAX_VERTICES]
+            solved = dict(zip(solve, lscm_solver.solve_islands([piece.job() for piece in solve])))
+
+            for island, piece in zip(batch, built):
+                piece.bm.verts.index_update()
+                if keep_uvs and piece.uvs is not None:
+                    uvs = np.array(piece.uvs)
+                elif piece in solved and solved[piece][1] < lscm_solver.MAX_ITERATIONS:
+                    uvs = solved[piece][0]
+                elif unwrap is not None:
+                    uvs = piece.unwrap(unwrap)
+                else:
+                    raise PieceError(island, "The piece is too big for the built-in solver, or it didn't converge")
+                piece.flatten(uvs)
+                if grain_angles is not None:
+                    # needs the 3D positions, so before the piece gets flattened
+                    grain_angles(piece.bm, [piece.bm.faces], piece.uv_layer)
+                area_before += piece.area_3d
+                area_after += piece.place(uvs)
+                if remesh:
+                    try:
+                        piece.remesh(max_edge_length, iterations)
+                    except Exception as error:
+                        raise PieceError(island, FAILED_MESSAGE) from error
+                pieces.append(piece.arrays(grain_angles is not None))
+                piece.free()
+                yield island + 1, count
+        finally:
+            for piece in built:
+                piece.free()
+
+    return join(pieces, math.sqrt(area_before / area_after) if area_after > 0 else 1.0, volume)
+
+
+def join(pieces, area_ratio, volume):
+    """ Scales the pieces to their 3D area, packs their UV's and puts them into one set of pattern arrays """
+    # scaled around their own centers, like individual origins
+    for piece in pieces:
+        center = piece["positions"].mean(axis=0)
+        piece["positions"] = center + (piece["positions"] - center) * area_ratio
+
+    low = np.array([p["uvs"].min(axis=0) if len(p["uvs"]) else np.zeros(2) for p in pieces]).reshape(-1, 2)
+    high = np.array([p["uvs"].max(axis=0) if len(p["uvs"]) else np.zeros(2) for p in pieces]).reshape(-1, 2)
+    sizes = high - low
+    margin = UV_MARGIN * math.sqrt(max(sizes.prod(axis=1).sum(), 1e-12))
+    offsets, extent = shelf_pack(sizes, margin)
+    uv_scale = 1.0 / max(extent.max(initial=0.0), 1e-12)
+
+    vertex_offsets = np.cumsum([0] + [len(p["positions"]) for p in pieces])
+    copies = dict()
+    for piece, start in zip(pieces, vertex_offsets.tolist()):
+        for v, key in piece["keys"]:
+            copies.setdefault(key, []).append(start + v)
+    wires = []
+    for verts in copies.values():
+        if len(verts) > 1:
+            wires += list(zip(verts, verts[1:]))
+            if len(verts) > 2:
+                wires.append((verts[-1], verts[0]))
+
+    def concatenate(name, dtype, shift=False, shape=(0,)):
+        parts = [p[name] + start if shift else p[name] for p, start in zip(pieces, vertex_offsets.tolist()) if name in p]
+        return np.concatenate(parts).astype(dtype) if parts else np.zeros(shape, dtype=dtype)
+
+    sizes_per_face = concatenate("sizes", np.int32)
+    pattern = {
+        "positions": concatenate("positions", np.float32, shape=(0, 3)),
+        "face_offsets": np.append(0, np.cumsum(sizes_per_face)).astype(np.int32),
+        "face_verts": concatenate("face_verts", np.int32, shift=True),
+        "uvs": np.concatenate([(p["uvs"] - low[i] + offsets[i]) * uv_scale for i, p in enumerate(pieces)] or [np.zeros((0, 2))]).astype(np.float32),
+        "wires": np.array(wires, dtype=np.int32).reshape(-1, 2),
+        "wire_seams": np.zeros(len(wires), dtype=bool),
+        "materials": concatenate("materials", np.int32),
+    }
+    if pieces and "grain_angles" in pieces[0]:
+        pattern["grain_angles"] = concatenate("grain_angles", np.float32)
+    if pieces and "grain" in pieces[0]:
+        pattern["grain"] = concatenate("grain", np.float32, shape=(0, 3))
+    if pieces and "allowance_edges" in pieces[0]:
+        pattern["allowance_edges"] = concatenate("allowance_edges", np.int32, shift=True, shape=(0, 2))
+        pattern["allowance_values"] = concatenate("allowance_values", np.float32)
+    properties = {
+        "S2S_InitialVolume": float(volume),
+        # the pieces were placed with unpacked UV's as world units, then scaled
+        "S2S_UVtoWORLDscale": float(area_ratio / uv_scale),
+    }
+    return pattern, properties
@@ -0,0 +1,323 @@
+"""Least squares conformal maps (LSCM), one island at a time, with numpy only.
+
+Every triangle adds two rows to a sparse system A x = b, whose least squares
+solution is the most conformal flattening of the island. Two vertices are
+pinned, which fixes where the island goes and how big it is. A is kept as
+coordinate arrays (row, column, value) and the system is solved with CGLS,
+conjugate gradients on the normal equations, so it never needs a matrix
+library: a product with A or A^T is one np.bincount.
+
+CGLS starts from the previous UVs when they're given, an island that didn't
+change then takes a handful of iterations instead of hundreds. It needs more
+iterations the bigger the island is though, so islands of more than
+MAX_VERTICES aren't solved here, and neither are the ones that reach
+MAX_ITERATIONS: unwrap_mesh leaves both to the caller, which can use
+Blender's own conformal unwrap for them.
+
+Big islands can be solved in worker processes. Those import this file on its
+own (not as part of the add-on, which needs bpy), so only unwrap_mesh, which
+runs in Blender, may import from the add-on. Only the workers get this
+directory on their sys.path, in Blender the add-on's top level modules
+must not become importable by their own names.
+"""
+
+import importlib.util
+import math
+import os
+import site
+import sys
+
+import numpy as np
+
+TOLERANCE = 1e-7
+MAX_ITERATIONS = 5000
+
+# islands bigger than this take thousands of iterations
+MAX_VERTICES = 10000
+
+# islands smaller than this are solved in this process, a worker costs more
+PARALLEL_MIN_VERTICES = 2000
+
+
+def triangle_frames(positions, triangles):
+    """ The corners of every triangle in 2D coordinates of its own plane, and twice its area """
+    p0, p1, p2 = (positions[triangles[:, i]] for i in range(3))
+    e1 = p1 - p0
+    e2 = p2 - p0
+    length = np.linalg.norm(e1, axis=1)
+    x_axis = e1 / np.where(length > 0, length, 1.0)[:, None]
+    normal = np.cross(e1, e2)
+    double_area = np.linalg.norm(normal, axis=1)
+    y_axis = np.cross(normal / np.where(double_area > 0, double_area, 1.0)[:, None], x_axis)
+    x = np.stack((np.zeros(len(triangles)), length, np.einsum('ij,ij->i', e2, x_axis)), axis=1)
+    y = np.stack((np.zeros(len(triangles)), np.zeros(len(triangles)), np.einsum('ij,ij->i', e2, y_axis)), axis=1)
+    return x, y, double_area
+
+
+def lscm_matrix(positions, triangles):
+    """ Coordinate arrays of A, with the u of vertex i in column i and its v in column n + i """
+    x, y, double_area = triangle_frames(positions, triangles)
+    keep = double_area > 1e-12 * max(double_area.max(initial=0.0), 1e-30)
+    triangles, x, y, double_area = triangles[keep], x[keep], y[keep], double_area[keep]
+    n = len(positions)
+    scale = 1.0 / np.sqrt(double_area)
+
+    # W_j = (x_k - x_l) + i (y_k - y_l) for the other two corners k, l of j,
+    # and sum W_j (u_j + i v_j) is 0 for a conformal map
+    rows = []
+    columns = []
+    values = []
+    triangle_rows = np.arange(len(triangles)) * 2
+    for j in range(3):
+        k, l = (j + 1) % 3, (j + 2) % 3
+        real = (x[:, l] - x[:, k]) * scale
+        imaginary = (y[:, l] - y[:, k]) * scale
+        u = triangles[:, j]
+        v = triangles[:, j] + n
+        rows += [triangle_rows, triangle_rows, triangle_rows + 1, triangle_rows + 1]
+        columns += [u, v, u, v]
+        values += [real, -imaginary, imaginary, real]
+    return np.concatenate(rows), np.concatenate(columns), np.concatenate(values), len(triangles) * 2
+
+
+def cgls(rows, columns, values, row_count, column_count, b, x0, tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS):
+    """ Least squares solution of A x = b, with the columns of A scaled to unit length first """
+    norms = np.sqrt(np.bincount(columns, weights=values * values, minlength=column_count))
+    norms[norms == 0] = 1.0
+    values = values / norms[columns]
+
+    def multiply(x):
+        return np.bincount(rows, weights=values * x[columns], minlength=row_count)
+
+    def multiply_transposed(y):
+        return np.bincount(columns, weights=values * y[rows], minlength=column_count)
+
+    x = x0 * norms
+    r = b - multiply(x)
+    s = multiply_transposed(r)
+    p = s.copy()
+    gamma = s @ s
+    stop = tolerance * tolerance * max(multiply_transposed(b) @ multiply_transposed(b), 1e-30)
+    iterations = 0
+    while gamma > stop and iterations < max_iterations:
+        q = multiply(p)
+        alpha = gamma / max(q @ q, 1e-300)
+        x += alpha * p
+        r -= alpha * q
+        s = multiply_transposed(r)
+        gamma, previous = s @ s, gamma
+        p = s + (gamma / previous) * p
+        iterations += 1
+    return x / norms, iterations
+
+
+def pick_pins(positions):
+    """ Two vertices far apart, the extremes along the longest axis of the island """
+    axis = np.argmax(positions.max(axis=0) - positions.min(axis=0))
+    return int(np.argmin(positions[:, axis])), int(np.argmax(positions[:, axis]))
+
+
+def solve(positions, triangles, initial=None, tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS):
+    """ Flattens one island, returns (uvs, iterations).
+
+    positions are the (n, 3) vertices of the island and triangles (t, 3)
+    indices into them. initial are the (n, 2) previous UVs, if any: the pins
+    keep their previous place and CGLS starts from there. The result has the
+    area of the 3D island.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    triangles = np.asarray(triangles, dtype=np.int64)
+    n = len(positions)
+    if n < 3 or len(triangles) == 0:
+        return np.zeros((n, 2)), 0
+
+    pins = pick_pins(positions)
+    if initial is not None:
+        initial = np.asarray(initial, dtype=np.float64)
+        if np.linalg.norm(initial[pins[0]] - initial[pins[1]]) == 0:
+            initial = None
+    if initial is not None:
+        pin_uvs = initial[list(pins)]
+    else:
+        pin_uvs = np.array([[0.0, 0.0], [np.linalg.norm(positions[pins[1]] - positions[pins[0]]), 0.0]])
+
+    rows, columns, values, row_count = lscm_matrix(positions, triangles)
+    pinned = np.zeros(2 * n, dtype=bool)
+    pinned[[pins[0], pins[1], pins[0] + n, pins[1] + n]] = True
+    pinned_values = np.zeros(2 * n)
+    pinned_values[[pins[0], pins[1]]] = pin_uvs[:, 0]
+    pinned_values[[pins[0] + n, pins[1] + n]] = pin_uvs[:, 1]
+
+    # move the pinned columns to the right hand side, renumber the others
+    b = -np.bincount(rows, weights=values * pinned_values[columns], minlength=row_count)
+    free = ~pinned[columns]
+    index = np.cumsum(~pinned) - 1
+    x0 = np.concatenate((initial[:, 0], initial[:, 1]))[~pinned] if initial is not None else np.zeros((~pinned).sum())
+    x, iterations = cgls(rows[free], index[columns[free]], values[free], row_count, int((~pinned).sum()), b, x0, tolerance, max_iterations)
+
+    result = pinned_values.copy()
+    result[~pinned] = x
+    uvs = np.stack((result[:n], result[n:]), axis=1)
+
+    # mirrored if the UV triangles wind the other way round than in 3D
+    t = triangles
+    signed = np.cross(uvs[t[:, 1]] - uvs[t[:, 0]], uvs[t[:, 2]] - uvs[t[:, 0]]).sum()
+    if signed < 0:
+        uvs[:, 0] = 2 * uvs[pins[0], 0] - uvs[:, 0]
+
+    area_3d = np.linalg.norm(np.cross(positions[t[:, 1]] - positions[t[:, 0]], positions[t[:, 2]] - positions[t[:, 0]]), axis=1).sum()
+    area_uv = abs(np.cross(uvs[t[:, 1]] - uvs[t[:, 0]], uvs[t[:, 2]] - uvs[t[:, 0]]).sum())
+    if area_uv > 0:
+        uvs = uvs[pins[0]] + (uvs - uvs[pins[0]]) * math.sqrt(area_3d / area_uv)
+    return uvs, iterations
+
+
+def fan_triangles(face_offsets):
+    """ Fan triangles (first, i, i + 1) of every face as loop indices, and the face of every triangle """
+    counts = np.maximum(np.diff(face_offsets) - 2, 0)
+    triangle_face = np.repeat(np.arange(len(counts)), counts)
+    step = np.arange(len(triangle_face)) - (np.cumsum(counts) - counts)[triangle_face]
+    first = face_offsets[:-1][triangle_face]
+    return np.stack((first, first + step + 1, first + step + 2), axis=1), triangle_face
+
+
+def _solve_job(job):
+    return solve(**job)
+
+
+def _standalone():
+    """ This file as a top level module, so worker processes don't have to import the add-on.
+
+    Returns the module and whether it was added to sys.modules, where pickle
+    looks it up to send its functions to the workers.
+    """
+    name = os.path.splitext(os.path.basename(__file__))[0]
+    module = sys.modules.get(name)
+    if module is not None:
+        if os.path.abspath(getattr(module, "__file__", "") or "") != os.path.abspath(__file__):
+            raise ImportError("another %s module is loaded" % name)
+        return module, False
+    spec = importlib.util.spec_from_file_location(name, __file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules[name] = module
+    return module, True
+
+
+def solve_islands(jobs, workers=None):
+    """ Solves a list of islands, given as keyword arguments of solve(), and returns the results in the same order.
+
+    Islands of PARALLEL_MIN_VERTICES or more go to up to `workers` processes
+    (all cores if None, 0 or 1 solves everything here). If the processes can't be
+    started, they are solved here as well.
+    """
+    results = [None] * len(jobs)
+    big = [i for i, job in enumerate(jobs) if len(job["positions"]) >= PARALLEL_MIN_VERTICES]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(big) > 1:
+        try:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawned, forking all of Blender isn't safe
+            context = multiprocessing.get_context("spawn")
+            module, added = _standalone()
+            try:
+                # the workers import this file by its name from its directory
+                with ProcessPoolExecutor(
+                    max_workers=min(workers, len(big)), mp_context=context,
+                    initializer=site.addsitedir, initargs=(os.path.dirname(os.path.abspath(__file__)),),
+                ) as executor:
+                    for i, result in zip(big, executor.map(module._solve_job, [jobs[i] for i in big])):
+                        results[i] = result
+            finally:
+                if added:
+                    del sys.modules[module.__name__]
+        except (OSError, RuntimeError, ImportError) as error:
+            print("Solving islands in this process, worker processes failed: %s" % error)
+    for i, job in enumerate(jobs):
+        if results[i] is None:
+            results[i] = solve(**job)
+    return results
+
+
+class IslandJobs:
+    """ The solve() arguments of every island of a mesh cut by a flattenability.Analysis """
+
+    def __init__(self, positions, face_offsets, analysis, previous=None):
+        self.positions = positions
+        self.analysis = analysis
+        self.previous = previous
+        loop_triangles, triangle_face = fan_triangles(face_offsets)
+        self.triangles = analysis.split_verts[loop_triangles]
+        triangle_island = analysis.face_islands[triangle_face]
+        self.triangle_order = np.argsort(triangle_island, kind='stable')
+        self.triangle_bounds = np.searchsorted(triangle_island[self.triangle_order], np.arange(analysis.island_count + 1))
+        island_of_split = analysis.split_island
+        self.vert_order = np.argsort(island_of_split, kind='stable')
+        self.vert_bounds = np.searchsorted(island_of_split[self.vert_order], np.arange(analysis.island_count + 1))
+        self.local = np.empty(len(island_of_split), dtype=np.int64)
+
+    def verts(self, island):
+        """ The split vertices of an island, in ascending order """
+        return self.vert_order[self.vert_bounds[island]:self.vert_bounds[island + 1]]
+
+    def job(self, island):
+        verts = self.verts(island)
+        self.local[verts] = np.arange(len(verts))
+        triangles = self.triangles[self.triangle_order[self.triangle_bounds[island]:self.triangle_bounds[island + 1]]]
+        job = {
+            "positions": self.positions[self.analysis.split_vert_origin[verts]],
+            "triangles": self.local[triangles],
+        }
+        if self.previous is not None:
+            job["initial"] = self.previous[verts]
+        return job
+
+
+def corner_average(split_verts, loop_values, split_count):
+    """ The average of per loop values (UVs) over the loops of every split vertex """
+    corner_count = np.maximum(np.bincount(split_verts, minlength=split_count), 1)
+    return np.stack([np.bincount(split_verts, weights=loop_values[:, i], minlength=split_count) for i in range(loop_values.shape[1])], axis=1) / corner_count[:, None]
+
+
+def unwrap_mesh(mesh, workers=None):
+    """ Unwraps the islands of a mesh in object mode into its active UV layer, starting from the UVs it has.
+
+    Islands are the pieces the seams cut the mesh into, faces are fan
+    triangulated. The islands keep the area they have in 3D, they aren't packed.
+    Returns the number of CGLS iterations of every island (None for the ones
+    that weren't solved) and which faces belong to an island that wasn't
+    solved, because it's bigger than MAX_VERTICES or didn't converge. Those
+    keep the UVs they had.
+    """
+    from . import flattenability
+
+    arrays = flattenability.mesh_arrays(mesh)
+    analysis = flattenability.Analysis(**arrays)
+    split_verts = analysis.split_verts
+    split_count = len(analysis.split_vert_origin)
+
+    had_uvs = mesh.uv_layers.active is not None
+    if not had_uvs:
+        mesh.uv_layers.new()
+    uv_layer = mesh.uv_layers.active
+    loop_uvs = np.zeros(len(mesh.loops) * 2, dtype=np.float32)
+    uv_layer.data.foreach_get("uv", loop_uvs)
+    loop_uvs = loop_uvs.reshape(-1, 2).astype(np.float64)
+    previous = corner_average(split_verts, loop_uvs, split_count)
+
+    jobs = IslandJobs(arrays["positions"], arrays["face_offsets"], analysis, previous if had_uvs else None)
+    islands = [i for i in range(analysis.island_count) if len(jobs.verts(i)) <= MAX_VERTICES]
+
+    uvs = previous
+    iterations = [None] * analysis.island_count
+    for island, (island_uvs, island_iterations) in zip(islands, solve_islands([jobs.job(i) for i in islands], workers)):
+        if island_iterations < MAX_ITERATIONS:
+            uvs[jobs.verts(island)] = island_uvs
+            iterations[island] = island_iterations
+    unsolved_faces = np.array([i is None for i in iterations], dtype=bool)[analysis.face_islands]
+    solved_loops = ~np.repeat(unsolved_faces, np.diff(arrays["face_offsets"]))
+    loop_uvs[solved_loops] = uvs[split_verts[solved_loops]]
+    uv_layer.data.foreach_set("uv", loop_uvs.astype(np.float32).ravel())
+    return iterations, unsolved_faces
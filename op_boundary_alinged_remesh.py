@@ -15,14 +15,20 @@ import bmesh
 from mathutils import Vector
 from mathutils.bvhtree import BVHTree
 from mathutils.kdtree import KDTree
+from . import tracing
+
+FAILED_MESSAGE = "Remeshing failed, probably because there is a piece that can't be flattened out.\nThat usually means there are seams missing from a piece."
 
 # Main Remesher class, this stores all the needed data
 class BoundaryAlignedRemesher:
     
-    def __init__(self, obj):
+    def __init__(self, obj, bm=None):
+        """ Remeshes obj's mesh, or bm in place when it's given """
         self.obj = object
-        self.bm = bmesh.new()
-        self.bm.from_mesh(obj.data)
+        if bm is None:
+            bm = bmesh.new()
+            bm.from_mesh(obj.data)
+        self.bm = bm
         self.bvh = BVHTree.FromBMesh(self.bm)
         
         # Boundary_data is a list of directions and locations of boundaries.
@@ -124,23 +130,32 @@ class BoundaryAlignedRemesher:
         wm.progress_begin(0, 99)
 
         """ Coordenates remeshing """
+        for i in self.remesh_steps(edge_length, iterations, quads, reproject):
+            wm.progress_update((i + 1)/iterations)
+        return self.bm
+    
+    def remesh_steps(self, edge_length=0.05, iterations=30, quads=True, reproject=True):
+        """ Same as remesh, but yields the iteration after every iteration so callers can pause in between """
         if quads:
             rule = (-1,-2, 0, 1)
         else:
             rule = (0, 1, 2, 3)
         
         for i in range(iterations):
-            wm.progress_update(i/iterations)
-            self.enforce_edge_length(edge_length=edge_length)
-            self.align_verts(rule=rule)
+            with tracing.span("enforce_edge_length", iteration=i) as span:
+                self.enforce_edge_length(edge_length=edge_length)
+                span.count(faces=len(self.bm.faces))
+            with tracing.span("align_verts", iteration=i):
+                self.align_verts(rule=rule)
             if reproject:
-                self.reproject()
+                with tracing.span("reproject", iteration=i):
+                    self.reproject()
+            yield i
         
         if quads:
             bmesh.ops.join_triangles(self.bm, faces=self.bm.faces,
                                      angle_face_threshold=3.14,
                                      angle_shape_threshold=3.14)
-        return self.bm
 
 class Remesher(bpy.types.Operator):
     bl_idname = "remesh.boundary_aligned_remesh"
@@ -170,18 +185,20 @@ class Remesher(bpy.types.Operator):
     )
     
     def execute(self, context):
-        obj = bpy.context.active_object
-        print(f"Remeshing {obj.name}")
-        
-        remesher = BoundaryAlignedRemesher(obj)
-        try:
-            bm = remesher.remesh(self.edge_length, self.iterations, self.quads, self.reproject)
-        except:
-            self.report({'ERROR'}, "Remeshing failed, probably because there is a piece that can't be flattened out.\nThat usually means there are seams missing from a piece.")
-            return {'CANCELLED'}
-        bm.to_mesh(obj.data)
-        context.area.tag_redraw()
-        return {"FINISHED"}
+        with tracing.span("boundary_aligned_remesh"):
+            obj = bpy.context.active_object
+
+            with tracing.span("build", faces=len(obj.data.polygons)):
+                remesher = BoundaryAlignedRemesher(obj)
+            try:
+                bm = remesher.remesh(self.edge_length, self.iterations, self.quads, self.reproject)
+            except:
+                self.report({'ERROR'}, FAILED_MESSAGE)
+                return {'CANCELLED'}
+            bm.to_mesh(obj.data)
+            if context.area is not None:
+                context.area.tag_redraw()
+            return {"FINISHED"}
 
 def draw(self, context):
     self.layout.operator("remesh.boundary_aligned_remesh", text="Boundary Aligned Remesh")
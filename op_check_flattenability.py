@@ -0,0 +1,131 @@
+import bpy
+import math
+import numpy as np
+from bpy.types import Operator
+from bpy.props import (
+    BoolProperty,
+    FloatProperty,
+)
+from . import flattenability
+from . import tracing
+
+# a hemisphere has 360°, a cylinder 0°
+MAX_CURVATURE = math.radians(270)
+
+
+def check(obj, max_curvature, mesh=None):
+    """ Analyzes the pieces of obj (or of mesh, like its evaluated one) as it would be cut.
+
+    Returns the analysis, the pieces that can't be unfolded and the ones that are very curved.
+    """
+    if mesh is None:
+        if obj.mode == 'EDIT':
+            obj.update_from_editmode()
+        mesh = obj.data
+    with tracing.span("flattenability", faces=len(mesh.polygons)) as span:
+        analysis = flattenability.analyze_mesh(mesh)
+        broken, curved = analysis.problems(max_curvature)
+        span.count(islands=analysis.island_count, broken=len(broken), curved=len(curved))
+    return analysis, broken, curved
+
+
+def summary(analysis, islands, limit=4):
+    text = ", ".join("piece %d: %s" % (i, analysis.describe(i)) for i in islands[:limit])
+    if len(islands) > limit:
+        text += ", ..."
+    return text
+
+
+def select_faces(obj, analysis, islands):
+    """ Selects the faces of the given pieces and nothing else, in object mode """
+    select_face_mask(obj.data, np.isin(analysis.face_islands, islands))
+
+
+def select_face_mask(mesh, selected):
+    """ Selects the faces where selected is True, with their edges and vertices, in object mode """
+    mesh.polygons.foreach_set("select", selected)
+    loop_starts = np.empty(len(mesh.polygons), dtype=np.int64)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    loop_selected = np.repeat(selected, np.diff(np.append(loop_starts, len(mesh.loops))))
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int64)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+    loop_edges = np.empty(len(mesh.loops), dtype=np.int64)
+    mesh.loops.foreach_get("edge_index", loop_edges)
+    verts = np.zeros(len(mesh.vertices), dtype=bool)
+    verts[loop_verts[loop_selected]] = True
+    mesh.vertices.foreach_set("select", verts)
+    edges = np.zeros(len(mesh.edges), dtype=bool)
+    edges[loop_edges[loop_selected]] = True
+    mesh.edges.foreach_set("select", edges)
+
+
+def select_edges(obj, edges):
+    mesh = obj.data
+    mesh.polygons.foreach_set("select", np.zeros(len(mesh.polygons), dtype=bool))
+    selected = np.zeros(len(mesh.edges), dtype=bool)
+    selected[edges] = True
+    mesh.edges.foreach_set("select", selected)
+    verts = np.zeros(len(mesh.vertices), dtype=bool)
+    edge_verts = np.empty(len(mesh.edges) * 2, dtype=np.int64)
+    mesh.edges.foreach_get("vertices", edge_verts)
+    verts[edge_verts.reshape(-1, 2)[selected].ravel()] = True
+    mesh.vertices.foreach_set("select", verts)
+
+
+class Check_Flattenability(Operator):
+    """Find the pieces this mesh would be cut into that can't be unfolded, because seams are missing"""
+    bl_idname = "object.check_flattenability"
+    bl_label = "Check Flattenability"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    max_curvature: FloatProperty(
+        name="Max curvature",
+        description=(
+            "Pieces whose inner vertices add up to more curvature than this"
+            " (a hemisphere has 360°) are reported, they would be stretched a"
+            " lot when unfolded"
+        ),
+        subtype='ANGLE',
+        min=0,
+        default=MAX_CURVATURE,
+    )
+    suggest_seams: BoolProperty(
+        name="Suggest seams",
+        description=(
+            "Select edges that would fix the reported pieces when marked as"
+            " seam, instead of selecting the pieces"
+        ),
+        default=True,
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.type == 'MESH'
+
+    def execute(self, context):
+        with tracing.span("check_flattenability"):
+            obj = context.active_object
+            mode = obj.mode
+            bpy.ops.object.mode_set(mode='OBJECT')
+            analysis, broken, curved = check(obj, self.max_curvature)
+            reported = np.concatenate((broken, curved))
+
+            if self.suggest_seams:
+                with tracing.span("suggest_seams"):
+                    edges = [e for island in reported.tolist() for e in analysis.suggest_seams(island)]
+                select_edges(obj, edges)
+            else:
+                select_faces(obj, analysis, reported)
+
+            bpy.ops.object.mode_set(mode='EDIT')
+            bpy.ops.mesh.select_mode(type='EDGE' if self.suggest_seams else 'FACE')
+            if mode != 'EDIT' and len(reported) == 0:
+                bpy.ops.object.mode_set(mode=mode)
+
+            if len(broken):
+                self.report({'ERROR'}, "%d of %d pieces can't be unfolded (%s)" % (len(broken), analysis.island_count, summary(analysis, broken)))
+            elif len(curved):
+                self.report({'WARNING'}, "%d of %d pieces will stretch a lot (%s)" % (len(curved), analysis.island_count, summary(analysis, curved)))
+            else:
+                self.report({'INFO'}, "All %d pieces can be unfolded" % analysis.island_count)
+            return {'FINISHED'}
@@ -1,5 +1,8 @@
 import bpy
 import bmesh
+import heapq
+import numpy as np
+from . import tracing
 import random
 import mathutils
 from bpy.types import Operator
@@ -11,14 +14,6 @@ from bpy.props import (
     IntProperty,
 )
 
-class FakeEdge:
-  v1 = None
-  v2 = None
-
-class FakeVert:
-  pos = None
-  verts = None
-
 class CleanUpEdges(bpy.types.Operator):
     """Clean up selected edges, for example after using the knife tool"""
     bl_idname = "mesh.clean_up_knife_cut"
@@ -55,13 +50,13 @@ class CleanUpEdges(bpy.types.Operator):
         soft_max=0.5
     )
 
-    '''
     relax_iterations: IntProperty(
+        name="Edge Relax",
+        description="Relax the cleaned up edges along themselves this many times",
         default=0,
         min=0,
         soft_max=20
     )
-    '''
 
     neighbor_selection_radius: IntProperty(
         name="Neighbor Relax Radius",
@@ -79,176 +74,262 @@ class CleanUpEdges(bpy.types.Operator):
         max=1
     )
 
-    def execute(self, context):
-        bpy.ops.mesh.select_mode(type="EDGE")
-
-
-        obj = bpy.context.active_object
-        bm = bmesh.from_edit_mesh(obj.data)
-
-        bm.verts.ensure_lookup_table()
-        bm.edges.ensure_lookup_table()
-        bm.faces.ensure_lookup_table()
+    neighbor_relax_iterations: IntProperty(
+        name="Neighbor Relax Iterations",
+        description="Maximum number of times neighboring vertices are relaxed",
+        default=10,
+        min=1,
+        soft_max=100
+    )
 
+    relax_tolerance: FloatProperty(
+        name="Relax Tolerance",
+        description="Stop relaxing once no vertex moves more than this",
+        default=0.00001,
+        min=0,
+        soft_max=0.01,
+        precision=6
+    )
 
-        if self.remove_poles_beforehand:
-            selection = list(filter(lambda e: e.select, bm.edges))
-            #clean up possible non-manifold mesh parts
-            selected_verts = list(filter(lambda v: v.select, bm.verts))
-            bpy.ops.mesh.select_more(use_face_step=True)
-            neighboring_verts = list(filter(lambda v: v.select, bm.verts))
-            bpy.ops.mesh.select_mode(type="VERT")
-            bpy.ops.mesh.region_to_loop()
-            boundary_verts = list(filter(lambda v: v.select, bm.verts))
-            invalid_verts = list((set(neighboring_verts) - set(boundary_verts)) - set(selected_verts))
-            bmesh.ops.dissolve_verts(bm, verts=invalid_verts)
-            bpy.ops.mesh.select_all(action='DESELECT')
+    def execute(self, context):
+        with tracing.span("clean_up_knife_cut"):
             bpy.ops.mesh.select_mode(type="EDGE")
-            for e in selection:
-                e.select = True
-
-        max_it = len(list(filter(lambda e: e.select, bm.edges)))
-        edges = list(filter(lambda e: e.select, bm.edges))
-
-        if self.delimit_intersections:
-            for e in edges:
-                for v in e.verts:
-                    star_count = 0
-                    for le in v.link_edges:
-                        if le.select:
-                            star_count += 1
-                    if star_count > 2:
-                        e.select = False
-                        break
 
-        if self.delimit_existing_seams:
-            for e in edges:
-                for v in e.verts:
-                    for le in v.link_edges:
-                        if le.seam and not (le in edges):
-                            e.select = False
-                            break
 
+            obj = bpy.context.active_object
+            bm = bmesh.from_edit_mesh(obj.data)
 
-        if self.delimit_boundary:
-            for e in edges:
-                for v in e.verts:
-                    if v.is_boundary:
-                        e.select = False
-                        break
+            bm.verts.ensure_lookup_table()
+            bm.edges.ensure_lookup_table()
+            bm.faces.ensure_lookup_table()
 
-        edges = list(filter(lambda e: e.select, bm.edges))
 
-        fake_verts = dict()
-        for e in edges:
-            for v in e.verts:
-                fake_vert = FakeVert()
-                fake_vert = FakeVert()
-                fake_vert.verts = []
-                fake_vert.verts.append(v)
-                fake_vert.pos = v.co
-                fake_verts[v] = fake_vert
+            if self.remove_poles_beforehand:
+                selection = list(filter(lambda e: e.select, bm.edges))
+                #clean up possible non-manifold mesh parts
+                selected_verts = list(filter(lambda v: v.select, bm.verts))
+                bpy.ops.mesh.select_more(use_face_step=True)
+                neighboring_verts = list(filter(lambda v: v.select, bm.verts))
+                bpy.ops.mesh.select_mode(type="VERT")
+                bpy.ops.mesh.region_to_loop()
+                boundary_verts = list(filter(lambda v: v.select, bm.verts))
+                invalid_verts = list((set(neighboring_verts) - set(boundary_verts)) - set(selected_verts))
+                bmesh.ops.dissolve_verts(bm, verts=invalid_verts)
+                bpy.ops.mesh.select_all(action='DESELECT')
+                bpy.ops.mesh.select_mode(type="EDGE")
+                for e in selection:
+                    e.select = True
 
-        fake_vert_list = []
-        fake_vert_list.extend(fake_verts.values())
-
-        fake_edges = []
-        for e in edges:
-            fake_edge = FakeEdge()
-            fake_edge.v1 = fake_verts[e.link_loops[0].vert]
-            fake_edge.v2 = fake_verts[e.link_loops[0]. link_loop_next.vert]
-            fake_edges.append(fake_edge)
-
-        for _ in range(max_it):
-            if (len(fake_edges) <= 1):
-                break;
-            shortest = min(fake_edges, key=lambda e: (e.v1.pos - e.v2.pos).length)
-            if ((shortest.v1.pos - shortest.v2.pos).length < self.min_length):
-                fake_vert_list.remove(shortest.v1)
-                fake_vert_list.remove(shortest.v2)
-                new_fake_vert = FakeVert()
-                new_fake_vert.pos = (shortest.v1.pos + shortest.v2.pos)/2
-                new_fake_vert.verts = []
-                new_fake_vert.verts.extend(shortest.v1.verts)
-                new_fake_vert.verts.extend(shortest.v2.verts)
-                fake_vert_list.append(new_fake_vert)
-                fake_edges.remove(shortest)
-                for fe in fake_edges:
-                    if (fe.v1 is shortest.v1):
-                        fe.v1 = new_fake_vert
-                    if (fe.v2 is shortest.v2):
-                        fe.v2 = new_fake_vert
-                    if (fe.v1 is shortest.v2):
-                        fe.v1 = new_fake_vert
-                    if (fe.v2 is shortest.v1):
-                        fe.v2 = new_fake_vert
-
-        for fv in fake_vert_list:
-            for v in fv.verts:
-                v.co = fv.pos
-
-        fake_vert_list.clear()
-        fake_edges.clear()
-        fake_verts.clear()
-
-        bpy.ops.mesh.remove_doubles(threshold=0.0001)
-        bm = bmesh.from_edit_mesh(bpy.context.active_object.data)
-
-        selection = list(filter(lambda e: e.select, bm.edges))
-
-        '''
-        for _ in range(self.relax_iterations):
-            verts = list(filter(lambda v: v.select, bm.verts))
-            locations = dict()
-            for v in verts:
-                locations[v] = v.co.copy()
-
-            for v in verts:
-                neighbors = []
-                for l in v.link_loops:
-                    if (l.edge.select):
-                        neighbors.append(l.link_loop_next.vert)
-                if (len(neighbors) == 2):
-                    avg_pos = mathutils.Vector()
-                    for n in neighbors:
-                        avg_pos += locations[n]
-                    avg_pos /= len(neighbors)
-                    v.co = v.co.lerp(avg_pos, 0.2)
-        '''
+            max_it = len(list(filter(lambda e: e.select, bm.edges)))
+            edges = list(filter(lambda e: e.select, bm.edges))
 
-        for _ in range(self.neighbor_selection_radius):
-            bpy.ops.mesh.select_more(use_face_step=True)
-
-        if self.delimit_existing_seams:
-            sel = list(filter(lambda e: e.select, bm.edges))
-            for e in sel:
-                if e.seam:
+            if self.delimit_intersections:
+                for e in edges:
                     for v in e.verts:
-                        v.select = False
-
-
-        selected_verts = list(filter(lambda v: v.select, bm.verts))
-        verts_to_smooth = []
+                        star_count = 0
+                        for le in v.link_edges:
+                            if le.select:
+                                star_count += 1
+                        if star_count > 2:
+                            e.select = False
+                            break
 
-        for v in selected_verts:
-            if not(v.is_boundary and self.delimit_boundary):
-                verts_to_smooth.append(v)
+            if self.delimit_existing_seams:
+                selected_edges = set(edges)
+                for e in edges:
+                    for v in e.verts:
+                        for le in v.link_edges:
+                            if le.seam and le not in selected_edges:
+                                e.select = False
+                                break
 
-        for e in selection:
-            for v in e.verts:
-                while v in verts_to_smooth:
-                    verts_to_smooth.remove(v)
 
-        smoothing_factor = self.neighbor_smooth_factor
-        smoothing_factor = pow(smoothing_factor, 4)
-        smoothing_factor /= 2
+            if self.delimit_boundary:
+                for e in edges:
+                    for v in e.verts:
+                        if v.is_boundary:
+                            e.select = False
+                            break
 
-        for x in range(10):
-            bmesh.ops.smooth_vert(bm, verts=verts_to_smooth, factor= smoothing_factor, use_axis_x=True, use_axis_y=True, use_axis_z=True)
+            edges = list(filter(lambda e: e.select, bm.edges))
 
-        bmesh.update_edit_mesh(obj.data, loop_triangles=True, destructive=True)
+            with tracing.span("collapse_short_edges", edges=len(edges)):
+                self.collapse_short_edges(edges, max_it)
 
+            bpy.ops.mesh.remove_doubles(threshold=0.0001)
+            bm = bmesh.from_edit_mesh(bpy.context.active_object.data)
 
-        return {'FINISHED'}
+            selection = list(filter(lambda e: e.select, bm.edges))
 
+            if self.relax_iterations > 0:
+                # only vertices in the middle of a cleaned up edge move, the ends stay put
+                def along_selection(v):
+                    neighbors = [e.other_vert(v) for e in v.link_edges if e.select]
+                    return neighbors if len(neighbors) == 2 else []
+                cut_verts = list(set(v for e in selection for v in e.verts))
+                self.relax(cut_verts, along_selection, 0.2, self.relax_iterations)
+
+            with tracing.span("relax_region") as span:
+                verts_to_smooth = self.relax_region(selection)
+                span.count(verts=len(verts_to_smooth))
+
+            smoothing_factor = self.neighbor_smooth_factor
+            smoothing_factor = pow(smoothing_factor, 4)
+            smoothing_factor /= 2
+
+            def along_edges(v):
+                return [e.other_vert(v) for e in v.link_edges]
+            with tracing.span("relax", verts=len(verts_to_smooth)):
+                self.relax(verts_to_smooth, along_edges, smoothing_factor, self.neighbor_relax_iterations)
+
+            bmesh.update_edit_mesh(obj.data, loop_triangles=True, destructive=True)
+
+
+            return {'FINISHED'}
+
+    def relax(self, verts, neighbors, factor, iterations):
+        """ Jacobi relax of verts towards the average of their neighbors, neighbors outside verts are pinned """
+        if not verts or factor <= 0:
+            return
+
+        # the adjacency is built once, every iteration is then a few array operations
+        index = {v: i for i, v in enumerate(verts)}
+        rows = []
+        columns = []
+        for i, v in enumerate(verts):
+            for n in neighbors(v):
+                if n not in index:
+                    index[n] = len(index)
+                rows.append(i)
+                columns.append(index[n])
+        if not rows:
+            return
+
+        count = len(verts)
+        rows = np.array(rows)
+        columns = np.array(columns)
+        positions = np.array([v.co.to_tuple() for v in index])
+        valence = np.bincount(rows, minlength=count)
+        moving = valence > 0
+
+        for _ in range(iterations):
+            neighborhood = positions[columns]
+            average = np.stack([np.bincount(rows, weights=neighborhood[:, axis], minlength=count) for axis in range(3)], axis=1)
+            delta = average[moving] / valence[moving, None] - positions[:count][moving]
+            delta *= factor
+            positions[:count][moving] += delta
+            if np.abs(delta).max() < self.relax_tolerance:
+                break
+
+        for v, co in zip(verts, positions[:count]):
+            v.co = co
+
+    def relax_region(self, selection):
+        """ Vertices within neighbor_selection_radius face steps of the selected edges, without the edges themselves """
+        # same rings select_more(use_face_step=True) would give, but only
+        # the faces around the cut are visited instead of the whole mesh
+        cut_verts = set()
+        for e in selection:
+            cut_verts.update(e.verts)
 
+        region = set(cut_verts)
+        frontier = cut_verts
+        for _ in range(self.neighbor_selection_radius):
+            ring = set()
+            for v in frontier:
+                for f in v.link_faces:
+                    ring.update(f.verts)
+            ring -= region
+            if not ring:
+                break
+            region |= ring
+            frontier = ring
+
+        excluded = set(cut_verts)
+        if self.delimit_existing_seams:
+            for v in region:
+                for e in v.link_edges:
+                    if e.seam and e.other_vert(v) in region:
+                        excluded.add(v)
+                        break
+        if self.delimit_boundary:
+            excluded.update(v for v in region if v.is_boundary)
+
+        return list(region - excluded)
+
+    def collapse_short_edges(self, edges, max_it):
+        """ Repeatedly merges the shortest edge into its midpoint, until none are shorter than min_length """
+        # Merged vertices are tracked with union-find, the root of every
+        # group holds its position, its edges and a version that changes on
+        # every merge so outdated heap entries can be skipped.
+        node_of = dict()
+        parent = []
+        position = []
+        members = []
+        version = []
+        incident = []
+        for e in edges:
+            for v in e.verts:
+                if v not in node_of:
+                    node_of[v] = len(parent)
+                    parent.append(len(parent))
+                    position.append(v.co.copy())
+                    members.append([v])
+                    version.append(0)
+                    incident.append([])
+
+        edge_nodes = []
+        for i, e in enumerate(edges):
+            a = node_of[e.verts[0]]
+            b = node_of[e.verts[1]]
+            edge_nodes.append((a, b))
+            incident[a].append(i)
+            incident[b].append(i)
+
+        def find(n):
+            while parent[n] != n:
+                parent[n] = parent[parent[n]]
+                n = parent[n]
+            return n
+
+        def entry(i):
+            a = find(edge_nodes[i][0])
+            b = find(edge_nodes[i][1])
+            return ((position[a] - position[b]).length, i, a, version[a], b, version[b])
+
+        # ties are broken by edge order, like min() over the edge list
+        heap = [entry(i) for i in range(len(edges))]
+        heapq.heapify(heap)
+
+        # like before, the last remaining edge is never collapsed
+        merges = 0
+        max_merges = min(max_it, len(edges) - 1)
+        while heap and merges < max_merges:
+            length, i, a, version_a, b, version_b = heapq.heappop(heap)
+            if find(a) != a or find(b) != b or version[a] != version_a or version[b] != version_b:
+                continue # outdated, a fresh entry was pushed when a or b changed
+            if a == b:
+                continue
+            if length >= self.min_length:
+                break
+
+            parent[b] = a
+            position[a] = (position[a] + position[b]) / 2
+            members[a].extend(members[b])
+            version[a] += 1
+            merges += 1
+
+            # the merged vertex moved, so every edge around it has a new length
+            edge_ids = set()
+            for j in incident[a] + incident[b]:
+                if find(edge_nodes[j][0]) != find(edge_nodes[j][1]):
+                    edge_ids.add(j)
+            incident[a] = sorted(edge_ids)
+            incident[b] = []
+            for j in incident[a]:
+                heapq.heappush(heap, entry(j))
+
+        for n in range(len(parent)):
+            if parent[n] == n and len(members[n]) > 1:
+                for v in members[n]:
+                    v.co = position[n]
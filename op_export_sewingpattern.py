@@ -1,17 +1,31 @@
 import bpy
+import gzip
 from os.path import basename
 from xml.sax.saxutils import escape
 from bpy.props import (
     StringProperty,
     BoolProperty,
     EnumProperty,
+    IntProperty,
     IntVectorProperty,
     FloatProperty,
 )
 import bmesh
+import math
 import mathutils
 import random
 
+from . import pattern_geometry
+from . import pattern_nesting
+from . import cutter_writers
+from . import tracing
+
+EXTENSIONS = {
+    'SVG': ".svg",
+    'DXF': ".dxf",
+    'HPGL': ".plt",
+}
+
 class Export_Sewingpattern(bpy.types.Operator):
     """Export Sewingpattern to .SVG file format. This should be called after the Seams to Sewing Pattern operator"""
 
@@ -44,11 +58,135 @@ class Export_Sewingpattern(bpy.types.Operator):
         items=(
             ('SVG', "Scalable Vector Graphic (.svg)",
              "Export the sewing pattern to a .SVG file"),
+            ('DXF', "AAMA/ASTM DXF (.dxf)",
+             "Export the sewing pattern to a .DXF file for fabric cutters"),
+            ('HPGL', "HPGL (.plt)",
+             "Export the sewing pattern to a .PLT file for plotters and cutters"),
         ),
         name="Format",
         description="File format to export the UV layout to",
         default='SVG',
     )
+    also_export: EnumProperty(
+        items=(
+            ('SVG', "Scalable Vector Graphic (.svg)",
+             "Also write a .SVG file"),
+            ('DXF', "AAMA/ASTM DXF (.dxf)",
+             "Also write a .DXF file for fabric cutters"),
+            ('HPGL', "HPGL (.plt)",
+             "Also write a .PLT file for plotters and cutters"),
+        ),
+        name="Also Export",
+        description="More file formats written in the same go, next to the file of the main format",
+        options={'ENUM_FLAG'},
+        default=set(),
+    )
+    coordinate_precision: IntProperty(
+        name="Precision",
+        description="Number of decimals written for each coordinate (in millimeters)",
+        default=2,
+        min=0,
+        max=6,
+    )
+    relative_paths: BoolProperty(
+        name="Relative Paths",
+        description="Write outlines with relative path commands, which are a lot shorter than absolute coordinates",
+        default=True,
+    )
+    simplify_tolerance: FloatProperty(
+        name="Simplify Tolerance",
+        description="Removes outline points that are closer than this to a straight line (in millimeters). Alignment marker vertices are always kept",
+        default=0.05,
+        min=0.0,
+        soft_max=2.0,
+    )
+    compress: BoolProperty(
+        name="Compress (.svgz)",
+        description="Write a gzip compressed .svgz file",
+        default=False,
+    )
+    deduplicate_pieces: BoolProperty(
+        name="Reuse Identical Pieces",
+        description="Writes the outline of identical and mirrored pieces only once, and adds the number of copies to their label",
+        default=True,
+    )
+    congruence_tolerance: FloatProperty(
+        name="Identical Tolerance",
+        description="How far outlines may be apart to still count as identical (in millimeters)",
+        default=0.5,
+        min=0.0,
+        soft_max=5.0,
+    )
+    use_seam_allowance: BoolProperty(
+        name="Seam Allowance",
+        description="Adds a cut line around every piece. A 'seam_allowance' edge attribute (in millimeters) overrides the width per seam, 0 uses the Allowance Width and negative values leave the seam without allowance",
+        default=False,
+    )
+    seam_allowance: FloatProperty(
+        name="Allowance Width",
+        description="Width of the seam allowance (in millimeters)",
+        default=10.0,
+        min=0.0,
+        soft_max=50.0,
+    )
+    allowance_corners: EnumProperty(
+        items=(
+            ('MITER', "Mitred",
+             "Sharp corners, very sharp ones are cut off"),
+            ('ROUND', "Rounded",
+             "Round corners"),
+        ),
+        name="Allowance Corners",
+        description="Shape of the seam allowance around corners",
+        default='MITER',
+    )
+    use_nesting: BoolProperty(
+        name="Nest Pieces",
+        description="Packs the pieces onto a strip of fabric, instead of keeping their UV positions",
+        default=False,
+    )
+    fabric_width: FloatProperty(
+        name="Fabric Width",
+        description="Width of the fabric to nest the pieces on (in millimeters)",
+        default=1500.0,
+        min=1.0,
+    )
+    nesting_spacing: FloatProperty(
+        name="Spacing",
+        description="Minimum distance between nested pieces (in millimeters)",
+        default=5.0,
+        min=0.0,
+    )
+    nesting_rotations: EnumProperty(
+        items=(
+            ('NONE', "None",
+             "Keep the orientation of every piece"),
+            ('HALF', "180°",
+             "Allow turning pieces upside down"),
+            ('QUARTER', "90°",
+             "Allow rotating pieces in steps of 90 degrees"),
+        ),
+        name="Rotations",
+        description="Rotations nesting may use. Pieces with a material direction are never turned sideways, so their grain is kept",
+        default='QUARTER',
+    )
+    align_grain: BoolProperty(
+        name="Align Grain",
+        description="Rotates pieces with a material direction so their grain runs along the length of the fabric (downwards)",
+        default=False,
+    )
+    grainlines: BoolProperty(
+        name="Grainlines",
+        description="Draws a grainline arrow on pieces with a material direction",
+        default=True,
+    )
+    nesting_time_budget: FloatProperty(
+        name="Nesting Time",
+        description="Seconds spent on nesting, after that the remaining pieces are placed in simple rows",
+        default=5.0,
+        min=0.0,
+        soft_max=60.0,
+    )
 
     @classmethod
     def poll(cls, context):
@@ -57,39 +195,54 @@ class Export_Sewingpattern(bpy.types.Operator):
 
     def invoke(self, context, event):
         #stuff to check / set before goes here :)
-        self.filepath = self.get_default_file_name(context) + "." + self.file_format.lower()
+        self.filepath = self.get_default_file_name(context) + self.get_extension()
         context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
 
     def get_default_file_name(self, context):
         return context.active_object.name
 
+    def get_formats(self):
+        # the main format first, that's the file the file browser shows
+        return [self.file_format] + [f for f in EXTENSIONS if f in self.also_export and f != self.file_format]
+
+    def get_extension(self, file_format=None):
+        if file_format is None:
+            file_format = self.get_formats()[0]
+        ext = EXTENSIONS[file_format]
+        if file_format == 'SVG' and self.compress:
+            ext += "z"
+        return ext
+
     def check(self, context):
-        if any(self.filepath.endswith(ext) for ext in (".png", ".eps", ".svg")):
-            self.filepath = self.filepath[:-4]
+        for ext in (".png", ".eps", ".svgz", ".svg", ".dxf", ".plt"):
+            if self.filepath.endswith(ext):
+                self.filepath = self.filepath[:-len(ext)]
+                break
 
-        ext = "." + self.file_format.lower()
-        self.filepath = bpy.path.ensure_ext(self.filepath, ext)
+        self.filepath = bpy.path.ensure_ext(self.filepath, self.get_extension())
         return True
 
     def execute(self, context):
-        obj = context.active_object
-        is_editmode = (obj.mode == 'EDIT')
-        if is_editmode:
-            bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+        with tracing.span("export_sewingpattern"):
+            obj = context.active_object
+            is_editmode = (obj.mode == 'EDIT')
+            if is_editmode:
+                bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
 
-        filepath = self.filepath
-        filepath = bpy.path.ensure_ext(filepath, "." + self.file_format.lower())
-        
-        if (self.alignment_markers == 'AUTO'):
-            self.auto_detect_markers()
+            filepath = self.filepath
+            filepath = bpy.path.ensure_ext(filepath, self.get_extension())
 
-        self.export(filepath)
+            if (self.alignment_markers == 'AUTO'):
+                with tracing.span("auto_detect_markers"):
+                    self.auto_detect_markers()
 
-        if is_editmode:
-            bpy.ops.object.mode_set(mode='EDIT', toggle=False)
+            self.export(filepath)
 
-        return {'FINISHED'}
+            if is_editmode:
+                bpy.ops.object.mode_set(mode='EDIT', toggle=False)
+
+            return {'FINISHED'}
     
     def get_piece_name(self,n):
         result = []
@@ -100,6 +253,155 @@ class Export_Sewingpattern(bpy.types.Operator):
         return ''.join(result[::-1])
 
     def export(self, filepath):
+        # geometry is extracted once, every selected format is written from it
+        with tracing.span("extract_pieces") as span:
+            pieces, document_scale = self.extract_pieces()
+            span.count(pieces=len(pieces), points=sum(len(o) for piece in pieces for o in piece.outlines))
+        document_size = (document_scale, document_scale)
+
+        if self.deduplicate_pieces:
+            with tracing.span("find_identical_pieces", pieces=len(pieces)):
+                self.find_identical_pieces(pieces)
+
+        if self.use_seam_allowance:
+            with tracing.span("seam_allowance", pieces=len(pieces)):
+                self.add_seam_allowances(pieces)
+
+        if self.align_grain:
+            self.align_pieces_to_grain(pieces)
+
+        if self.use_nesting:
+            with tracing.span("nesting", pieces=len(pieces)):
+                document_size = self.nest_pieces(pieces)
+
+        base = filepath
+        for ext in (".svgz", ".svg", ".dxf", ".plt"):
+            if base.endswith(ext):
+                base = base[:-len(ext)]
+                break
+
+        for file_format in self.get_formats():
+            path = base + self.get_extension(file_format)
+            with tracing.span("write_" + file_format.lower()):
+                if file_format == 'SVG':
+                    self.write_svg(pieces, document_size, path)
+                elif file_format == 'DXF':
+                    cutter_writers.write_dxf(pieces, document_size[1], path, self.coordinate_precision, self.alignment_numbers)
+                elif file_format == 'HPGL':
+                    cutter_writers.write_hpgl(pieces, document_size[1], path, self.alignment_numbers)
+
+    def find_identical_pieces(self, pieces):
+        # only pieces with the same or a neighboring signature are compared point by point
+        buckets = dict()
+        for piece in pieces:
+            signature = pattern_geometry.shape_signature(piece.outlines)
+            outline = pattern_geometry.outer_loop(piece.outlines)
+            candidates = [reference for cell in pattern_geometry.neighbor_signatures(signature) for reference in buckets.get(cell, ())]
+            for reference in candidates:
+                transform = pattern_geometry.congruent_transform(pattern_geometry.outer_loop(reference.outlines), outline, self.congruence_tolerance)
+                if transform is not None:
+                    reference.copies.append(piece)
+                    piece.copies = reference.copies
+                    piece.symbol = reference.name
+                    piece.symbol_transform = transform
+                    break
+            else:
+                buckets.setdefault(signature, []).append(piece)
+
+        for piece in pieces:
+            if len(piece.copies) > 1 and piece.symbol is None:
+                piece.symbol = piece.name
+                piece.symbol_transform = (0.0, False, 0.0, 0.0)
+
+    def add_seam_allowances(self, pieces):
+        # all loops of all pieces are offset in one go
+        loops = []
+        distances = []
+        holes = []
+        owners = []
+        for piece in pieces:
+            outer = pattern_geometry.outer_loop(piece.outlines)
+            for outline, allowances in zip(piece.outlines, piece.allowances):
+                loops.append(outline)
+                distances.append([a if a > 0 else self.seam_allowance if a == 0 else 0.0 for a in allowances])
+                holes.append(outline is not outer)
+                owners.append(piece)
+
+        offsets = pattern_geometry.offset_loops(loops, distances, holes, self.allowance_corners == 'ROUND')
+
+        for piece, offset in zip(owners, offsets):
+            piece.allowance_outlines.append(offset)
+
+    def align_pieces_to_grain(self, pieces):
+        # turn every piece around its center until its grain points down
+        for piece in pieces:
+            if piece.grain_angle is None:
+                continue
+            angle = math.pi / 2.0 - piece.grain_angle
+            c = math.cos(angle)
+            s = math.sin(angle)
+            x, y = piece.center
+            piece.transform = (angle, x - (x * c - y * s), y - (x * s + y * c))
+
+    def nest_pieces(self, pieces):
+        steps = {'NONE': 1, 'HALF': 2, 'QUARTER': 4}[self.nesting_rotations]
+        rotations = []
+        for piece in pieces:
+            piece_steps = min(steps, 2) if piece.grain_locked else steps
+            # rotations are on top of a grain alignment, if there is one
+            base = piece.transform[0]
+            rotations.append([base + i * 2.0 * math.pi / piece_steps for i in range(piece_steps)])
+
+        outlines = [[p for outline in piece.cut_outlines() for p in outline] for piece in pieces]
+        transforms, length, oversize = pattern_nesting.nest(outlines, self.fabric_width, rotations, self.nesting_spacing, self.nesting_time_budget)
+        if oversize:
+            self.report({'WARNING'}, "Pieces %s are wider than the fabric" % ", ".join(pieces[i].name for i in oversize))
+
+        for piece, transform in zip(pieces, transforms):
+            piece.transform = transform
+
+        return (self.fabric_width, length)
+
+    class Piece:
+        def __init__(self, name, outlines, allowances, center, markers, grain_locked=False, grain_angle=None):
+            # outlines are closed loops of (x, y) in document millimeters,
+            # y pointing down like in SVG. allowances has the seam allowance
+            # of every outline edge, 0 where the default is used and negative
+            # where there is none.
+            self.name = name
+            self.outlines = outlines
+            self.allowances = allowances
+            self.allowance_outlines = []
+            self.center = center
+            self.markers = markers
+            self.grain_locked = grain_locked
+            # direction of the grain in the document, in radians, None if unknown
+            self.grain_angle = grain_angle
+            # line segments of the grainline arrow
+            self.grainline = []
+            # (angle, dx, dy), rotation around the origin followed by a translation
+            self.transform = (0.0, 0.0, 0.0)
+            # identical pieces share their outline, the symbol transform is
+            # (angle, mirrored, dx, dy) from the symbol's piece to this one
+            self.copies = [self]
+            self.symbol = None
+            self.symbol_transform = None
+
+        def cut_outlines(self):
+            return self.allowance_outlines or self.outlines
+
+        def label(self):
+            if len(self.copies) > 1:
+                return self.name + " x" + str(len(self.copies))
+            return self.name
+
+        def transform_point(self, point):
+            angle, dx, dy = self.transform
+            c = math.cos(angle)
+            s = math.sin(angle)
+            return (point[0] * c - point[1] * s + dx, point[0] * s + point[1] * c + dy)
+
+    def extract_pieces(self):
         #get loops:
         bpy.ops.object.mode_set(mode='EDIT')
         bpy.ops.mesh.select_mode(type="FACE")
@@ -114,14 +416,15 @@ class Export_Sewingpattern(bpy.types.Operator):
         self.current_alignment_number = 0
         alignment_number_dictionary = dict()
         position_dictionary = dict()
-        piece_dictionary = dict()
-        letters = "abcdefghijklmnopqrstuvwyxtuv".upper()
         current_letter = 0
+        pieces = []
 
-        svgstring = '<svg xmlns="http://www.w3.org/2000/svg"\n viewBox="0 0 ' + str(document_scale) + ' ' + str(document_scale) +'"\n'
-        svgstring += 'width="' + str(document_scale) + 'mm" height="' + str(document_scale) + 'mm">'
-        #svgstring += '<!-- Exported using the Seams to Sewing pattern for Blender  -->'
-        svgstring += '\n<defs><style>.seam{stroke: #000; stroke-width:1px; fill:white} .sewinguide{stroke-width:1px;}</style></defs>'
+        allowance_layer = bm.edges.layers.float.get("seam_allowance")
+        grain_layer = None
+        if hasattr(bm.faces.layers, "float_vector"):
+            grain_layer = bm.faces.layers.float_vector.get("material_direction")
+        # grain direction in UV space, per island, stored by Seams to Sewing Pattern
+        angle_layer = bm.faces.layers.float.get("S2S_grain_angle")
 
         face_groups = []
         faces = set(bm.faces[:])
@@ -135,8 +438,6 @@ class Export_Sewingpattern(bpy.types.Operator):
             face_groups.append(selected_faces)
             faces -= selected_faces
 
-        print('Loop groups for sewing pattern export: ' + str(len(face_groups)))
-
         for fg in face_groups:
 
             bpy.ops.mesh.select_all(action='DESELECT')
@@ -177,72 +478,132 @@ class Export_Sewingpattern(bpy.types.Operator):
                 loop_groups.append(temp_group)
 
             uv_layer = bm.loops.layers.uv.active
-            
-            #print border
 
-            svgstring += '\n<g>'
-            svgstring += '<path class="seam" d="'
+            #border
 
             center_x = 0
             center_y = 0
             number_of_points = 0
+            outlines = []
+            outline_allowances = []
 
             for lg in loop_groups:
                 if (len(lg) == 0):
                     continue
-                lg.append(lg[0])
 
-                svgstring += 'M '
-
-                for l in lg:
+                points = []
+                notches = []
+                allowances = []
+                for i, l in enumerate(lg):
                     uv = l[uv_layer].uv.copy()
                     x = uv.x*document_scale
                     y = (1-uv.y)*document_scale
                     center_x += x
                     center_y += y
                     number_of_points += 1
-                    svgstring += str(x)
-                    svgstring += ','
-                    svgstring += str(y)
-                    svgstring += ' '
+                    points.append((x, y))
+                    allowances.append(l.edge[allowance_layer] if allowance_layer is not None else 0.0)
+                    if self.alignment_markers != 'OFF' and self.is_notch(l):
+                        notches.append(i)
+
+                kept = pattern_geometry.simplify_loop(points, self.simplify_tolerance, notches)
+                outlines.append([points[i] for i in kept])
+                outline_allowances.append(pattern_geometry.segment_maximum(allowances, kept))
+                lg.append(lg[0])
 
-            svgstring += '"/>'
-            
             center_x = center_x/number_of_points
             center_y = center_y/number_of_points
 
             current_letter = (current_letter + 1)
             letter = self.get_piece_name(current_letter)
 
-            if self.show_peice_ids:
-                svgstring += self.add_text(center_x,center_y,self.piece_id_font_size,str(letter))
-
-            #print markers
+            #markers
             marker_list = []
 
             for lg in loop_groups:
-                #markers
                 if (self.alignment_markers != 'OFF'):
                     for l in lg:
-                        has_wire = False
                         for w in l.vert.link_edges:
                             if w.is_wire and w.seam:
-                                has_wire = True
                                 maybe_marker = self.add_alignment_marker(l, w, uv_layer, document_scale, alignment_number_dictionary, position_dictionary, marker_list,None)
                                 if maybe_marker[0] is True:
                                     marker_list.append(maybe_marker[1])
 
-            for marker in marker_list:
+            grain_locked = grain_layer is not None and any(f[grain_layer].length > 0 for f in fg)
+
+            grain_angle = None
+            if angle_layer is not None:
+                for f in fg:
+                    if not math.isnan(f[angle_layer]):
+                        # flipped, since y points down in the document
+                        grain_angle = -f[angle_layer]
+                        grain_locked = True
+                        break
+
+            piece = Export_Sewingpattern.Piece(letter, outlines, outline_allowances, (center_x, center_y), marker_list, grain_locked, grain_angle)
+            if self.grainlines and grain_angle is not None:
+                piece.grainline = pattern_geometry.grainline(outlines, piece.center, grain_angle, self.piece_id_font_size)
+            pieces.append(piece)
+
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+        return pieces, document_scale
+
+    def write_svg(self, pieces, document_size, filepath):
+        width = self.format_number(document_size[0])
+        height = self.format_number(document_size[1])
+        svgstring = '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink"\n viewBox="0 0 ' + width + ' ' + height +'"\n'
+        svgstring += 'width="' + width + 'mm" height="' + height + 'mm">'
+        #svgstring += '<!-- Exported using the Seams to Sewing pattern for Blender  -->'
+        svgstring += '\n<defs><style>.seam{stroke: #000; stroke-width:1px; fill:white} .sewinguide{stroke-width:1px;} .allowance{stroke: #000; stroke-width:1px; fill:none} .grainline{stroke: #000; stroke-width:1px; fill:none}</style>'
+        for piece in pieces:
+            if piece.symbol == piece.name:
+                svgstring += '\n<symbol id="piece-' + piece.name + '" style="overflow:visible">'
+                svgstring += '<path class="seam" d="'
+                svgstring += pattern_geometry.loops_to_path_data(piece.outlines, self.coordinate_precision, self.relative_paths)
+                svgstring += '"/></symbol>'
+        svgstring += '</defs>'
+
+        for piece in pieces:
+            angle, dx, dy = piece.transform
+            if piece.transform == (0.0, 0.0, 0.0):
+                svgstring += '\n<g>'
+            else:
+                svgstring += '\n<g transform="translate(' + self.format_number(dx) + ' ' + self.format_number(dy) + ') rotate(' + self.format_number(math.degrees(angle)) + ')">'
+            if piece.allowance_outlines:
+                svgstring += '<path class="allowance" d="'
+                svgstring += pattern_geometry.loops_to_path_data(piece.allowance_outlines, self.coordinate_precision, self.relative_paths)
+                svgstring += '"/>'
+
+            if piece.symbol is None:
+                svgstring += '<path class="seam" d="'
+                svgstring += pattern_geometry.loops_to_path_data(piece.outlines, self.coordinate_precision, self.relative_paths)
+                svgstring += '"/>'
+            else:
+                svgstring += '<use xlink:href="#piece-' + piece.symbol + '"' + self.svg_symbol_transform(piece.symbol_transform) + '/>'
+
+            if piece.grainline:
+                svgstring += '<path class="grainline" d="'
+                for start, end in piece.grainline:
+                    svgstring += 'M' + self.format_number(start[0]) + ' ' + self.format_number(start[1]) + 'L' + self.format_number(end[0]) + ' ' + self.format_number(end[1])
+                svgstring += '"/>'
+
+            if self.show_peice_ids:
+                svgstring += self.add_text(piece.center[0],piece.center[1],self.piece_id_font_size,piece.label())
+
+            for marker in piece.markers:
                 svgstring += marker.text
 
             svgstring += '</g>'
 
         svgstring += '\n</svg>'
-        
-        with open(filepath, "w") as file:
-            file.write(svgstring)
-            
-        bpy.ops.object.mode_set(mode='OBJECT')
+
+        if self.compress:
+            with gzip.open(filepath, "wt", encoding="utf-8") as file:
+                file.write(svgstring)
+        else:
+            with open(filepath, "w") as file:
+                file.write(svgstring)
     
     class Marker:
         def __init__(self, parent, x, y, fontSize, text, id, loop, wire, uv_layer, document_scale, alignment_number_dictionary, position_dictionary, marker_list):
@@ -310,13 +671,28 @@ class Export_Sewingpattern(bpy.types.Operator):
             #ignore top_left_intersects intersection, since we're not going to move the points
             return lower_right_intersects or upper_right_intersects or lower_left_intersects
 
+    def svg_symbol_transform(self, symbol_transform):
+        angle, mirrored, dx, dy = symbol_transform
+        if symbol_transform == (0.0, False, 0.0, 0.0):
+            return ''
+        transform = 'translate(' + self.format_number(dx) + ' ' + self.format_number(dy) + ') rotate(' + self.format_number(math.degrees(angle)) + ')'
+        if mirrored:
+            transform += ' scale(1 -1)'
+        return ' transform="' + transform + '"'
+
+    def is_notch(self, loop):
+        return any(w.is_wire and w.seam for w in loop.vert.link_edges)
+
+    def format_number(self, value):
+        return pattern_geometry.format_number(value, self.coordinate_precision)
+
     def add_text(self,x,y,fontSize,text):
         returnstring = ''
 
         returnstring += '<text x="'
-        returnstring += str(x)
+        returnstring += self.format_number(x)
         returnstring += 'px" y="'
-        returnstring += str(y)
+        returnstring += self.format_number(y)
         returnstring += 'px" style="font-family:\'Consolas\', \'Courier New\';font-size:'
         returnstring += str(fontSize)
         returnstring += 'px;">'
@@ -379,14 +755,14 @@ class Export_Sewingpattern(bpy.types.Operator):
             positionDictionary[alternateLineHash] = True
 
         returnstring = '<path class="sewinguide" stroke="' + sew_color_hex + '" d="M '
-        returnstring += str(x_position)
+        returnstring += self.format_number(x_position)
         returnstring += ','
-        returnstring += str(y_position)
+        returnstring += self.format_number(y_position)
         returnstring += ' '
 
-        returnstring += str(x1_position)
+        returnstring += self.format_number(x1_position)
         returnstring += ','
-        returnstring += str(y1_position)
+        returnstring += self.format_number(y1_position)
         returnstring += ' '
         returnstring += '"/>\n'  
 
@@ -410,6 +786,8 @@ class Export_Sewingpattern(bpy.types.Operator):
                         )
         
         result.text = returnstring
+        result.line = ((x_position, y_position), (x1_position, y1_position))
+        result.color = sew_color_hex
 
         # make sure the none of the markers collide, and if they do resize them so they no longer collide
         i = 0
@@ -0,0 +1,45 @@
+import os
+
+import bpy
+from bpy.types import Operator
+from bpy.props import StringProperty
+
+from . import pattern_io
+from . import tracing
+
+
+class Import_Sewingpattern(Operator):
+    """Load a pattern saved by Seams to Sewing Pattern (.npz, or the meta.json of a pattern directory) as a new object, ready to export or remesh"""
+    bl_idname = "object.import_sewingpattern"
+    bl_label = "Import Sewing Pattern"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    filepath: StringProperty(
+        subtype='FILE_PATH',
+    )
+    filter_glob: StringProperty(
+        default="*.npz;" + pattern_io.META_FILE,
+        options={'HIDDEN'},
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT'
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        with tracing.span("import_sewingpattern") as span:
+            path = bpy.path.abspath(self.filepath)
+            # a pattern directory is picked by its meta.json
+            if os.path.basename(path) == pattern_io.META_FILE:
+                path = os.path.dirname(path)
+            try:
+                obj = pattern_io.load_object(path, context)
+            except (OSError, ValueError, KeyError) as error:
+                self.report({'ERROR'}, "Couldn't load the pattern %s: %s" % (path, error))
+                return {'CANCELLED'}
+            span.count(faces=len(obj.data.polygons))
+            return {'FINISHED'}
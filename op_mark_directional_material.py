@@ -1,20 +1,38 @@
 import bpy
 import bmesh
 import gpu
+import numpy as np
+from collections import deque
 from gpu_extras.batch import batch_for_shader
 from mathutils import Vector
+from mathutils.bvhtree import BVHTree
 from bpy_extras import view3d_utils
+from . import tracing
 
 _fur_draw_handle = None  # Global draw handler reference
+_fur_shader = None  # Builtin shader, looked up on first draw
+
+# Mouse moves are only raycast this often, everything in between is coalesced
+RAYCAST_INTERVAL = 1.0 / 60.0
+
+def get_fur_shader():
+    global _fur_shader
+    if _fur_shader is None:
+        _fur_shader = gpu.shader.from_builtin('3D_UNIFORM_COLOR')
+    return _fur_shader
 
 def draw_fur_callback(self, context):
     """Draw a line from the face center to the current mouse intersection point."""
     if not self.face_center or not self.current_point:
         return
 
-    shader = gpu.shader.from_builtin('3D_UNIFORM_COLOR')
-    coords = [self.face_center, self.current_point]
-    batch = batch_for_shader(shader, 'LINES', {"pos": coords})
+    shader = get_fur_shader()
+    # the batch only changes when the end of the line does
+    if self._batch is None or self._batch_point != self.current_point:
+        coords = [self.face_center, self.current_point]
+        self._batch = batch_for_shader(shader, 'LINES', {"pos": coords})
+        self._batch_point = self.current_point.copy()
+    batch = self._batch
     shader.bind()
     # Draw in a bright color (magenta)
     shader.uniform_float("color", (1.0, 0.0, 1.0, 1.0))
@@ -35,53 +53,122 @@ class Mark_Directional_Material_Dialog(bpy.types.Operator):
 
     face_index: bpy.props.IntProperty()
 
+    mode: bpy.props.EnumProperty(
+        name="Apply To",
+        items=(
+            ('FACE', "Face", "Only the marked face"),
+            ('SELECTED', "Selected Faces", "All selected faces get the same direction"),
+            ('ISLAND', "Island", "Flood fill the direction over the seam bounded island of the marked face, following its curvature"),
+        ),
+        default='FACE'
+    )
+
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "direction", text="Direction")
+        layout.prop(self, "mode")
+
+    def face_directions(self, bm, dir_norm):
+        """ Returns {face index: direction} for every face the direction should be written to """
+        bm.faces.ensure_lookup_table()
+        if self.mode == 'SELECTED':
+            directions = {f.index: dir_norm for f in bm.faces if f.select}
+            directions[self.face_index] = dir_norm
+            return directions
+
+        if self.mode == 'FACE' or self.face_index >= len(bm.faces):
+            return {self.face_index: dir_norm}
+
+        # Flood fill over non seam edges, the direction is parallel transported
+        # from face to face by the rotation between their normals, so it keeps
+        # following the surface around curves instead of sticking out of it
+        start = bm.faces[self.face_index]
+        directions = {start.index: dir_norm}
+        queue = deque([start])
+        while queue:
+            face = queue.popleft()
+            direction = directions[face.index]
+            for e in face.edges:
+                if e.seam:
+                    continue
+                for other in e.link_faces:
+                    if other.index in directions:
+                        continue
+                    transported = face.normal.rotation_difference(other.normal) @ direction
+                    # remove what is left of the normal component, on degenerate faces
+                    transported -= other.normal * transported.dot(other.normal)
+                    if transported.length_squared == 0:
+                        transported = direction
+                    directions[other.index] = transported.normalized()
+                    queue.append(other)
+        return directions
 
     def execute(self, context):
-        obj = context.active_object
-        if not obj or obj.type != 'MESH':
-            self.report({'ERROR'}, "Active object is not a mesh.")
-            return {'CANCELLED'}
-
-        # Switch to Object Mode to ensure attribute data is allocated.
-        bpy.ops.object.mode_set(mode='OBJECT')
-        mesh = obj.data
+        with tracing.span("material_direction"):
+            obj = context.active_object
+            if not obj or obj.type != 'MESH':
+                self.report({'ERROR'}, "Active object is not a mesh.")
+                return {'CANCELLED'}
+
+            from mathutils import Vector
+            dir_norm = Vector(self.direction).normalized()
+
+            # Work out all faces while still in Edit Mode, so the mode only has
+            # to be switched once no matter how many faces are written
+            mode = obj.mode
+            if mode == 'EDIT':
+                directions = self.face_directions(bmesh.from_edit_mesh(obj.data), dir_norm)
+            else:
+                bm = bmesh.new()
+                bm.from_mesh(obj.data)
+                directions = self.face_directions(bm, dir_norm)
+                bm.free()
+
+            # Switch to Object Mode to ensure attribute data is allocated.
+            bpy.ops.object.mode_set(mode='OBJECT')
+            mesh = obj.data
+
+            # If the attribute already exists, check if its data length is valid.
+            if "material_direction" in mesh.attributes:
+                attr = mesh.attributes["material_direction"]
+                # If data is empty, remove and recreate it.
+                if len(attr.data) == 0:
+                    mesh.attributes.remove(attr)
+                    attr = mesh.attributes.new(name="material_direction", type='FLOAT_VECTOR', domain='FACE')
+            else:
+                attr = mesh.attributes.new(name="material_direction", type='FLOAT_VECTOR', domain='FACE')
 
-        from mathutils import Vector
-        dir_norm = Vector(self.direction).normalized()
+            # Force a mesh update (if needed)
+            mesh.update()
 
-        # If the attribute already exists, check if its data length is valid.
-        if "material_direction" in mesh.attributes:
-            attr = mesh.attributes["material_direction"]
-            # If data is empty, remove and recreate it.
-            if len(attr.data) == 0:
+            # Check that the attribute data length matches the number of polygons.
+            if len(attr.data) < len(mesh.polygons):
+                # If for some reason it's still not populated, remove and re-create.
                 mesh.attributes.remove(attr)
                 attr = mesh.attributes.new(name="material_direction", type='FLOAT_VECTOR', domain='FACE')
-        else:
-            attr = mesh.attributes.new(name="material_direction", type='FLOAT_VECTOR', domain='FACE')
-
-        # Force a mesh update (if needed)
-        mesh.update()
-
-        # Check that the attribute data length matches the number of polygons.
-        if len(attr.data) < len(mesh.polygons):
-            # If for some reason it's still not populated, remove and re-create.
-            mesh.attributes.remove(attr)
-            attr = mesh.attributes.new(name="material_direction", type='FLOAT_VECTOR', domain='FACE')
 
-        if self.face_index >= len(attr.data):
-            self.report({'ERROR'}, f"Face index {self.face_index} is out of range for attribute data (size {len(attr.data)}).")
-            return {'CANCELLED'}
-
-        # Set the value for the given face.
-        attr.data[self.face_index].vector = dir_norm
-        self.report({'INFO'}, f"Material direction set to {dir_norm} on face {self.face_index}.")
+            if self.face_index >= len(attr.data):
+                self.report({'ERROR'}, f"Face index {self.face_index} is out of range for attribute data (size {len(attr.data)}).")
+                bpy.ops.object.mode_set(mode=mode)
+                return {'CANCELLED'}
+
+            # Set the values for all faces in one go.
+            values = np.empty(len(attr.data) * 3, dtype=np.float32)
+            attr.data.foreach_get("vector", values)
+            values = values.reshape(-1, 3)
+            indices = np.fromiter(directions.keys(), dtype=np.int64, count=len(directions))
+            values[indices] = np.array([tuple(d) for d in directions.values()], dtype=np.float32).reshape(-1, 3)
+            attr.data.foreach_set("vector", values.ravel())
+            mesh.update()
+
+            if len(directions) == 1:
+                self.report({'INFO'}, f"Material direction set to {dir_norm} on face {self.face_index}.")
+            else:
+                self.report({'INFO'}, f"Material direction set on {len(directions)} faces.")
 
-        # (Optionally switch back to Edit Mode if needed)
-        bpy.ops.object.mode_set(mode='EDIT')
-        return {'FINISHED'}
+            # Go back to the mode the operator was called from
+            bpy.ops.object.mode_set(mode=mode)
+            return {'FINISHED'}
 
 
     def invoke(self, context, event):
@@ -109,6 +196,11 @@ class Mark_Directional_Material(bpy.types.Operator):
         self.face_center = None
         self.current_point = None
         self._handle = None
+        self._timer = None
+        self._bvh = None
+        self._batch = None
+        self._batch_point = None
+        self._mouse = None
 
     def invoke(self, context, event):
         # Verify active mesh in Edit Mode and an active face is selected
@@ -132,12 +224,17 @@ class Mark_Directional_Material(bpy.types.Operator):
         local_center = face.calc_center_median()
         self.face_center = obj.matrix_world @ local_center
 
+        # Raycasting the whole scene on every mouse move is far too slow on
+        # dense meshes, only the target object is needed
+        self._bvh = BVHTree.FromBMesh(bm)
+
         # Add draw handler to display the temporary line
         global _fur_draw_handle
         _fur_draw_handle = bpy.types.SpaceView3D.draw_handler_add(
             draw_fur_callback, (self, context), 'WINDOW', 'POST_VIEW'
         )
         self._handle = _fur_draw_handle
+        self._timer = context.window_manager.event_timer_add(RAYCAST_INTERVAL, window=context.window)
 
         context.window_manager.modal_handler_add(self)
         self.report({'INFO'}, "Drag the mouse to define fur direction. Left-click to confirm, right-click/Esc to cancel.")
@@ -150,32 +247,17 @@ class Mark_Directional_Material(bpy.types.Operator):
             return {'CANCELLED'}
 
         if event.type == 'MOUSEMOVE':
-            region = context.region
-            rv3d = context.region_data
-            coord = (event.mouse_region_x, event.mouse_region_y)
-            ray_origin = view3d_utils.region_2d_to_origin_3d(region, rv3d, coord)
-            ray_target = view3d_utils.region_2d_to_location_3d(region, rv3d, coord, Vector((0, 0, 1)))
-            direction = (ray_target - ray_origin).normalized()
-
-            # Raycast onto our object
-            depsgraph = context.evaluated_depsgraph_get()
-
-            result, loc, normal, index, hit_obj, matrix = context.scene.ray_cast(
-                depsgraph,
-                ray_origin,
-                direction,
-                distance=10000.0
-            )
-
-            if result and hit_obj == self.object:
-                self.current_point = loc
-            else:
-                self.current_point = ray_target
+            # only remember where the mouse is, the raycast happens on the next timer tick
+            self._mouse = (event.mouse_region_x, event.mouse_region_y)
 
+        if event.type == 'TIMER' and self._mouse is not None:
+            self.update_point(context)
             context.area.tag_redraw()
 
         # When the user confirms the direction with a left-click release:
         if event.type == 'LEFTMOUSE' and event.value == 'RELEASE':
+            if self._mouse is not None:
+                self.update_point(context)
             if not self.current_point:
                 self.report({'WARNING'}, "No valid point defined.")
                 return {'RUNNING_MODAL'}
@@ -196,8 +278,35 @@ class Mark_Directional_Material(bpy.types.Operator):
 
         return {'RUNNING_MODAL'}
 
+    def update_point(self, context):
+        """ Raycasts the last mouse position against the target object, in its local space """
+        region = context.region
+        rv3d = context.region_data
+        coord = self._mouse
+        self._mouse = None
+        ray_origin = view3d_utils.region_2d_to_origin_3d(region, rv3d, coord)
+        ray_target = view3d_utils.region_2d_to_location_3d(region, rv3d, coord, Vector((0, 0, 1)))
+        direction = (ray_target - ray_origin).normalized()
+
+        matrix = self.object.matrix_world
+        matrix_inv = matrix.inverted_safe()
+        origin_local = matrix_inv @ ray_origin
+        direction_local = (matrix_inv.to_3x3() @ direction).normalized()
+
+        loc, normal, index, distance = self._bvh.ray_cast(origin_local, direction_local)
+
+        if loc is not None:
+            self.current_point = matrix @ loc
+        else:
+            self.current_point = ray_target
+
     def finish(self, context):
         global _fur_draw_handle
+        if self._timer is not None:
+            context.window_manager.event_timer_remove(self._timer)
+            self._timer = None
+        self._bvh = None
+        self._batch = None
         if self._handle is not None:
             bpy.types.SpaceView3D.draw_handler_remove(self._handle, 'WINDOW')
             self._handle = None
@@ -1,5 +1,9 @@
 import bpy
+import bmesh
+import math
+import numpy as np
 from bpy.types import Operator
+from . import tracing
 from bpy.props import (
     BoolProperty,
     EnumProperty,
@@ -9,6 +13,12 @@ from bpy.props import (
 )
 
 
+# rough cloth solver cost of one quality step for one triangle, in seconds
+SECONDS_PER_TRIANGLE_STEP = 2e-7
+# edges across a garment the default cloth settings are tuned for
+REFERENCE_RESOLUTION = 50
+
+
 class ObjectModeOperator:
     @classmethod
     def poll(cls, context):
@@ -44,30 +54,230 @@ class QuickClothsim(ObjectModeOperator, Operator):
         description="Increas Physical Properties > Air Viscosity. Use when the objects collapses in on itself during simulation",
         default=True,
     )
+    reduce_sewing: BoolProperty(
+        name="Reduce Sewing Springs",
+        description="Removes sewing edges that are closer together along a seam than the spacing. Corners, alignment markers and the ends of every seam are kept",
+        default=False,
+    )
+    sewing_spacing: FloatProperty(
+        name="Sewing Spacing",
+        description="Minimum distance along a seam between two sewing edges",
+        subtype='DISTANCE',
+        default=0.02,
+        min=0.0,
+        soft_max=0.2,
+    )
+    sewing_corner_angle: FloatProperty(
+        name="Corner Angle",
+        description="Sewing edges where the outline turns by more than this are always kept",
+        subtype='ANGLE',
+        default=math.radians(30.0),
+        min=0.0,
+        max=math.pi,
+    )
+
+    auto_quality: BoolProperty(
+        name="Auto Quality",
+        description="Derive solver steps, collision settings and sewing force from the mesh density, aiming at the frame time",
+        default=False,
+    )
+    frame_time: FloatProperty(
+        name="Frame Time",
+        description="Simulation time per frame to aim for with Auto Quality (in seconds)",
+        subtype='TIME_ABSOLUTE',
+        default=0.5,
+        min=0.01,
+        soft_max=10.0,
+    )
 
     def execute(self, context):
-        objects = bpy.context.selected_objects
-        if objects is not None :
-            for obj in objects:
-                    cloth_mod = obj.modifiers.new(name = 'Cloth', type = 'CLOTH')
-                    #pressure
-                    if (self.pressure_style != 'OFF'):
-                        cloth_mod.settings.use_pressure = True
-                    if (self.pressure_style == 'MEDIUM'):
-                        cloth_mod.settings.uniform_pressure_force = 10
-                    if (self.pressure_style == 'HIGH'):
-                        cloth_mod.settings.uniform_pressure_force = 50
-                        
-                    #sewing
-                    cloth_mod.settings.use_sewing_springs = self.use_sewing
-                    if (self.pressure_style == 'MEDIUM'):
-                        cloth_mod.settings.sewing_force_max = 5
-                    if (self.pressure_style == 'HIGH'):
-                        cloth_mod.settings.sewing_force_max = 15
-                    
-                    #viscosity
-                    if (self.air_visc == True):
-                        cloth_mod.settings.air_damping = 10
-                    if (self.use_gravity == False):
-                        cloth_mod.settings.effector_weights.gravity = 0
-        return {'FINISHED'}
+        with tracing.span("quick_clothsim"):
+            objects = bpy.context.selected_objects
+            springs_before = 0
+            springs_after = 0
+            if objects is not None :
+                for obj in objects:
+                        if self.use_sewing and self.reduce_sewing and obj.type == 'MESH':
+                            with tracing.span("reduce_sewing", object=obj.name) as span:
+                                before, after = self.reduce_sewing_wires(obj)
+                                span.count(wires_before=before, wires_after=after)
+                            springs_before += before
+                            springs_after += after
+
+                        cloth_mod = obj.modifiers.new(name = 'Cloth', type = 'CLOTH')
+                        #pressure
+                        if (self.pressure_style != 'OFF'):
+                            cloth_mod.settings.use_pressure = True
+                        if (self.pressure_style == 'MEDIUM'):
+                            cloth_mod.settings.uniform_pressure_force = 10
+                        if (self.pressure_style == 'HIGH'):
+                            cloth_mod.settings.uniform_pressure_force = 50
+
+                        #sewing
+                        cloth_mod.settings.use_sewing_springs = self.use_sewing
+                        if (self.pressure_style == 'MEDIUM'):
+                            cloth_mod.settings.sewing_force_max = 5
+                        if (self.pressure_style == 'HIGH'):
+                            cloth_mod.settings.sewing_force_max = 15
+
+                        #viscosity
+                        if (self.air_visc == True):
+                            cloth_mod.settings.air_damping = 10
+                        if (self.use_gravity == False):
+                            cloth_mod.settings.effector_weights.gravity = 0
+
+                        if self.auto_quality and obj.type == 'MESH':
+                            with tracing.span("auto_quality", object=obj.name):
+                                self.apply_auto_quality(obj, cloth_mod)
+
+            if springs_before > 0:
+                self.report({'INFO'}, f"Sewing springs reduced from {springs_before} to {springs_after}.")
+            return {'FINISHED'}
+
+    def apply_auto_quality(self, obj, cloth_mod):
+        """ Sets solver and collision quality from the mesh density and the frame time """
+        mesh = obj.data
+        edge_length = self.mean_edge_length(mesh) * max(obj.matrix_world.to_scale())
+        if edge_length <= 0:
+            return
+        mesh.calc_loop_triangles()
+        triangles = max(len(mesh.loop_triangles), 1)
+
+        # The garment is about as big as one UV unit, so this is roughly the
+        # number of edges across it. Stiff springs on short edges need small
+        # time steps, so the steps grow with the resolution.
+        size = obj.get("S2S_UVtoWORLDscale", edge_length * REFERENCE_RESOLUTION)
+        resolution = size / edge_length
+        wanted_steps = max(5, math.ceil(resolution / 10))
+
+        # a rough cost of one solver step per triangle, self collision triples it
+        seconds_per_step = triangles * SECONDS_PER_TRIANGLE_STEP
+        affordable_steps = int(self.frame_time / seconds_per_step)
+        steps = max(2, min(wanted_steps, affordable_steps, 80))
+        use_self_collision = steps * seconds_per_step * 3 <= self.frame_time
+
+        settings = cloth_mod.settings
+        collision = cloth_mod.collision_settings
+        settings.quality = steps
+        collision.collision_quality = max(2, min(math.ceil(steps / 3), 10))
+        collision.distance_min = max(edge_length * 0.25, 0.001)
+        collision.use_self_collision = use_self_collision
+        collision.self_distance_min = max(edge_length * 0.25, 0.001)
+        # more, shorter sewing springs need less force each
+        if self.use_sewing:
+            force = settings.sewing_force_max if settings.sewing_force_max > 0 else 5
+            settings.sewing_force_max = force * min(max(REFERENCE_RESOLUTION / resolution, 0.2), 1.0)
+
+        if steps < wanted_steps:
+            self.report({'WARNING'}, f"{obj.name}: {steps} quality steps fit the frame time, {wanted_steps} are recommended for this density.")
+
+    def mean_edge_length(self, mesh):
+        """ Mean length of the edges that belong to faces, sewing edges are left out """
+        if len(mesh.edges) == 0 or len(mesh.loops) == 0:
+            return 0.0
+        co = np.empty(len(mesh.vertices) * 3)
+        mesh.vertices.foreach_get("co", co)
+        co = co.reshape(-1, 3)
+        edge_verts = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+        mesh.edges.foreach_get("vertices", edge_verts)
+        edge_verts = edge_verts.reshape(-1, 2)
+        loop_edges = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get("edge_index", loop_edges)
+        face_edges = np.unique(loop_edges)
+        lengths = np.linalg.norm(co[edge_verts[face_edges, 0]] - co[edge_verts[face_edges, 1]], axis=1)
+        return float(lengths.mean())
+
+    def reduce_sewing_wires(self, obj):
+        """ Removes sewing edges (wires) so they are at least sewing_spacing apart along the piece outlines.
+
+        Returns the number of sewing edges before and after.
+        """
+        bm = bmesh.new()
+        bm.from_mesh(obj.data)
+
+        wires_of = dict()
+        wire_count = 0
+        for e in bm.edges:
+            if e.is_wire:
+                wire_count += 1
+                for v in e.verts:
+                    wires_of.setdefault(v, []).append(e)
+
+        if wire_count == 0:
+            bm.free()
+            return (0, 0)
+
+        # walk every outline once, a wire is decided by whichever of its two
+        # ends is reached first
+        decided = set()
+        remove = []
+        visited = set()
+        for start in wires_of:
+            if start in visited or not start.is_boundary:
+                continue
+            outline = self.boundary_loop(start)
+            visited.update(outline)
+            count = len(outline)
+            since_kept = math.inf
+            for i, v in enumerate(outline):
+                if i > 0:
+                    since_kept += (v.co - outline[i - 1].co).length
+                wires = [w for w in wires_of.get(v, ()) if w not in decided]
+                if not wires:
+                    continue
+                previous = outline[i - 1]
+                following = outline[(i + 1) % count]
+                keep = (
+                    since_kept >= self.sewing_spacing
+                    # the ends of a sewn stretch
+                    or previous not in wires_of
+                    or following not in wires_of
+                    or self.is_corner(previous, v, following)
+                )
+                for w in wires:
+                    decided.add(w)
+                    # alignment marker wires are marked as seams, other
+                    # corners are found on the far end of the wire
+                    if keep or w.seam or self.is_outline_corner(w.other_vert(v)):
+                        since_kept = 0.0
+                    else:
+                        remove.append(w)
+
+        bmesh.ops.delete(bm, geom=remove, context='EDGES')
+        bm.to_mesh(obj.data)
+        obj.data.update()
+        bm.free()
+        return (wire_count, wire_count - len(remove))
+
+    def boundary_loop(self, start):
+        """ The vertices of the outline start is on, in order """
+        outline = [start]
+        seen = {start}
+        previous = None
+        v = start
+        while True:
+            following = None
+            for e in v.link_edges:
+                if e.is_boundary:
+                    other = e.other_vert(v)
+                    if other is not previous:
+                        following = other
+                        break
+            # also stops on non manifold outlines that don't return to start
+            if following is None or following in seen:
+                return outline
+            outline.append(following)
+            seen.add(following)
+            previous = v
+            v = following
+
+    def is_outline_corner(self, v):
+        neighbors = [e.other_vert(v) for e in v.link_edges if e.is_boundary]
+        return len(neighbors) != 2 or self.is_corner(neighbors[0], v, neighbors[1])
+
+    def is_corner(self, previous, v, following):
+        incoming = v.co - previous.co
+        outgoing = following.co - v.co
+        if incoming.length_squared == 0 or outgoing.length_squared == 0:
+            return True
+        return incoming.angle(outgoing) > self.sewing_corner_angle
@@ -4,10 +4,21 @@ from bpy.types import Operator
 import bmesh
 import mathutils
 import math
+import time
+import numpy as np
+from . import tracing
+from . import pattern_io
+from . import op_check_flattenability
+from . import lscm_solver
+from . import symmetry
+from . import island_stream
+from .op_boundary_alinged_remesh import BoundaryAlignedRemesher
+from .op_boundary_alinged_remesh import FAILED_MESSAGE as REMESH_FAILED
 from bpy.props import (
     BoolProperty,
     IntProperty,
     EnumProperty,
+    StringProperty,
 )
 
 if bpy.app.version >= (3, 0, 0):
@@ -17,6 +28,16 @@ elif bpy.app.version >= (2, 90, 0):
 else:
     from . import function_wrapper_2_8 as function_wrapper
 
+REMESH_ITERATIONS = 10
+
+# How long the modal mode works before it lets Blender handle events again
+MODAL_STEP_SECONDS = 0.05
+
+# Passed on while unfolding in modal mode, so the view can still be moved
+NAVIGATION_EVENTS = {
+    'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE', 'MOUSEMOVE',
+    'INBETWEEN_MOUSEMOVE', 'TRACKPADPAN', 'TRACKPADZOOM', 'NDOF_MOTION',
+}
 
 class Seams_To_SewingPattern(Operator):
     bl_idname = "object.seams_to_sewingpattern"
@@ -35,6 +56,7 @@ class Seams_To_SewingPattern(Operator):
         items=(
             ('ANGLE_BASED', "Angle based", ""),
             ('CONFORMAL', "Conformal", ""),
+            ('NATIVE', "Conformal per piece", "Built-in conformal solver, starts from the existing UV's and solves big pieces in parallel"),
             ('KEEP', "Keep existing (advanced)", ""),
         ),
         default='ANGLE_BASED',
@@ -62,6 +84,57 @@ class Seams_To_SewingPattern(Operator):
         description="Actual number of triangle migh be a bit off",
         default=5000,
     )
+    pattern_file: StringProperty(
+        name="Save Pattern",
+        description=(
+            "Also write the pattern to this file (.npz) or directory, so"
+            " other processes can load it without opening the .blend"
+        ),
+        subtype='FILE_PATH',
+        default="",
+    )
+    symmetry: EnumProperty(
+        name="Symmetry",
+        description=(
+            "Unfold only one of every pair of mirrored pieces and add the"
+            " other one as its reflection, which is about twice as fast for"
+            " symmetric garments"
+        ),
+        items=(
+            ('NONE', "None", ""),
+            ('AUTO', "Auto", "Find the axis with the most mirrored pieces"),
+            ('X', "X", ""),
+            ('Y', "Y", ""),
+            ('Z', "Z", ""),
+        ),
+        default='NONE',
+    )
+    check_pieces: BoolProperty(
+        name="Check pieces first",
+        description=(
+            "Stop before unfolding if some pieces would be closed or tubes"
+            " because seams are missing, and select them"
+        ),
+        default=True,
+    )
+    run_modal: BoolProperty(
+        name="Keep Blender responsive",
+        description=(
+            "Unfold in small steps with the progress in the status bar."
+            " ESC cancels and restores the original object"
+        ),
+        default=False,
+    )
+    streaming: BoolProperty(
+        name="Low memory",
+        description=(
+            "Unfold one piece at a time in a mesh of its own, so memory use"
+            " depends on the largest piece instead of the whole garment."
+            " Always flattens with the built-in conformal solver (unless"
+            " keeping the existing UV's) and ignores Symmetry"
+        ),
+        default=False,
+    )
 
     def invoke(self, context, event):
         wm = context.window_manager
@@ -95,14 +168,193 @@ class Seams_To_SewingPattern(Operator):
         row = layout.row()
         row.prop(self, "target_tris")
         row.enabled = self.use_remesh
+        row = layout.row()
+        row.prop(self, "pattern_file")
+        row = layout.row()
+        row.prop(self, "symmetry")
+        row.enabled = not self.streaming
+        row = layout.row()
+        row.prop(self, "check_pieces")
+        row = layout.row()
+        row.prop(self, "run_modal")
+        row = layout.row()
+        row.prop(self, "streaming")
         layout.row()
 
     def execute(self, context):
-        if self.keep_original:
+        if self.run_modal and context.window is not None:
+            return self.start_modal(context)
+        self._source = context.active_object
+        self._work = None
+        with tracing.span("seams_to_sewingpattern"):
+            steps = self.unfold(in_place=not self.keep_original)
+            try:
+                while True:
+                    next(steps)
+            except StopIteration as done:
+                if 'CANCELLED' in done.value:
+                    context.window_manager.progress_end()
+                    self.rollback()
+                return done.value
+
+    def start_modal(self, context):
+        self._source = context.active_object
+        self._work = None
+        self._steps = self.unfold(in_place=False)
+        self._span = tracing.span("seams_to_sewingpattern")
+        self._window = context.window
+        self._area = context.area
+        self._region = context.region
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        context.workspace.status_text_set("Seams to Sewing Pattern: starting, ESC to cancel")
+        # off the span stack between events, so other operators aren't traced inside it
+        self._span.suspend()
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._span.count(cancelled=True)
+            self.cancel(context)
+            return {'CANCELLED'}
+        if event.type in NAVIGATION_EVENTS:
+            return {'PASS_THROUGH'}
+        if event.type != 'TIMER':
+            # anything else could change the mesh while it's half unfolded
+            return {'RUNNING_MODAL'}
+
+        deadline = time.perf_counter() + MODAL_STEP_SECONDS
+        self._span.resume()
+        try:
+            while time.perf_counter() < deadline:
+                status = self.step()
+        except StopIteration as done:
+            self.end_modal(context)
+            if 'CANCELLED' in done.value:
+                self.rollback()
+            return done.value
+        except Exception:
+            self.end_modal(context)
+            self.rollback()
+            raise
+        self._span.suspend()
+        context.workspace.status_text_set("Seams to Sewing Pattern: %s, ESC to cancel" % status)
+        return {'RUNNING_MODAL'}
+
+    def step(self):
+        # the timer event can come from any area, the unfold needs the one it was started in
+        if hasattr(bpy.context, "temp_override") and self._area is not None:
+            with bpy.context.temp_override(window=self._window, area=self._area, region=self._region):
+                return next(self._steps)
+        return next(self._steps)
+
+    def cancel(self, context):
+        # ESC, or Blender aborting the operator (loading a file, closing the window)
+        # the spans still open in the unfold end when it's closed
+        self._span.resume()
+        self._steps.close()
+        self.end_modal(context)
+        self.rollback()
+
+    def end_modal(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        self._span.end()
+
+    def rollback(self):
+        """ Removes the copy that was being unfolded and selects the original object again """
+        work = self._work
+        if work is not None and bpy.context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+        if work is not None and work != self._source:
+            mesh = work.data
+            bpy.data.objects.remove(work)
+            if mesh is not None and mesh.users == 0:
+                bpy.data.meshes.remove(mesh)
+        self._source.select_set(True)
+        bpy.context.view_layer.objects.active = self._source
+
+    def adopt(self, src_obj, obj):
+        """ Moves the unfolded mesh of the copy into the original object, for unfolding in place """
+        old_mesh = src_obj.data
+        name = old_mesh.name
+        src_obj.data = obj.data
+        for key in obj.keys():
+            if key.startswith("S2S_"):
+                src_obj[key] = obj[key]
+        if self.apply_modifiers:
+            src_obj.modifiers.clear()
+        bpy.data.objects.remove(obj)
+        if old_mesh.users == 0:
+            bpy.data.meshes.remove(old_mesh)
+        src_obj.data.name = name
+        src_obj.select_set(True)
+        bpy.context.view_layer.objects.active = src_obj
+        return src_obj
+
+    def unfold(self, in_place):
+        """ The whole unfold as a generator, that yields a status text between stages, pieces and remesh iterations.
+
+        Unless in_place, it works on a copy, which execute and the modal mode
+        throw away when cancelled and which moves into the original object
+        when done.
+        Returns the operator result.
+        """
+        src_obj = bpy.context.active_object
+        if self.check_pieces:
+            if src_obj.mode == 'EDIT':
+                bpy.ops.object.mode_set(mode='OBJECT')
+            if self.apply_modifiers and src_obj.modifiers:
+                # the pieces that get unfolded are those of the evaluated mesh
+                evaluated = src_obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+                mesh = evaluated.to_mesh()
+                analysis, broken, curved = op_check_flattenability.check(src_obj, op_check_flattenability.MAX_CURVATURE, mesh)
+                # their faces are only the original ones when the modifiers keep the topology
+                selectable = len(mesh.polygons) == len(src_obj.data.polygons)
+                evaluated.to_mesh_clear()
+            else:
+                analysis, broken, curved = op_check_flattenability.check(src_obj, op_check_flattenability.MAX_CURVATURE)
+                selectable = True
+            if len(broken):
+                if selectable:
+                    op_check_flattenability.select_faces(src_obj, analysis, broken)
+                    bpy.ops.object.mode_set(mode='EDIT')
+                    bpy.ops.mesh.select_mode(type='FACE')
+                self.report(
+                    {'ERROR'},
+                    (
+                        "%d of %d pieces can't be unfolded (%s), seams are"
+                        " missing.%s Check Flattenability can suggest seams"
+                        % (len(broken), analysis.island_count, op_check_flattenability.summary(analysis, broken), " They are selected," if selectable else "")
+                    )
+                )
+                return {'CANCELLED'}
+            if len(curved):
+                self.report({'WARNING'}, "%d pieces will stretch a lot (%s)" % (len(curved), op_check_flattenability.summary(analysis, curved)))
+            yield "checking pieces"
+
+        if self.streaming:
+            return (yield from self.unfold_streaming(src_obj))
+
+        if not in_place:
             # Duplicate selection to keep original.
-            src_obj = bpy.context.active_object
             obj = src_obj.copy()
-            obj.data = src_obj.data.copy()
+            if self.apply_modifiers:
+                # straight from the evaluated mesh, copying the mesh and then
+                # converting it would hold both in memory at once
+                depsgraph = bpy.context.evaluated_depsgraph_get()
+                with tracing.span("evaluated_mesh"):
+                    obj.data = bpy.data.meshes.new_from_object(
+                        src_obj.evaluated_get(depsgraph),
+                        preserve_all_data_layers=True,
+                        depsgraph=depsgraph,
+                    )
+                obj.modifiers.clear()
+            else:
+                obj.data = src_obj.data.copy()
             obj.animation_data_clear()
             bpy.context.collection.objects.link(obj)
 
@@ -110,26 +362,59 @@ class Seams_To_SewingPattern(Operator):
             src_obj.select_set(False)
             bpy.context.view_layer.objects.active = obj
 
-        if self.apply_modifiers:
+        elif self.apply_modifiers:
             bpy.ops.object.convert(target='MESH')
             obj = bpy.context.active_object
 
+        mirror = None
+        if self.symmetry != 'NONE':
+            if symmetry.supported():
+                with tracing.span("symmetry") as span:
+                    mirror = symmetry.detect(bpy.context.active_object.data, self.symmetry)
+                    if mirror is not None:
+                        symmetry.keep_one_side(bpy.context.active_object.data, mirror)
+                        span.count(pairs=mirror.pairs)
+            else:
+                self.report({'WARNING'}, "Symmetry needs Blender 3.0 or newer, unfolding everything")
+
         wm = bpy.context.window_manager
         bpy.ops.object.mode_set(mode='EDIT')
 
         obj = bpy.context.edit_object
+        self._work = obj
         me = obj.data
+        yield "unwrapping"
 
         bpy.ops.mesh.select_mode(type="EDGE")
 
         bpy.ops.mesh.select_all(action='SELECT')
-        if (self.do_unwrap != 'KEEP'):
-            bpy.ops.uv.unwrap(method=self.do_unwrap, margin=0.02)
+        if (self.do_unwrap == 'NATIVE'):
+            with tracing.span("unwrap", faces=len(me.polygons)) as span:
+                bpy.ops.object.mode_set(mode='OBJECT')
+                iterations, unsolved_faces = lscm_solver.unwrap_mesh(me)
+                unsolved = [i for i in iterations if i is None]
+                if unsolved:
+                    # too big for CGLS or didn't converge, Blender's conformal
+                    # unwrap solves those directly
+                    op_check_flattenability.select_face_mask(me, unsolved_faces)
+                    bpy.ops.object.mode_set(mode='EDIT')
+                    bpy.ops.uv.unwrap(method='CONFORMAL', margin=0.02)
+                    bpy.ops.mesh.select_all(action='SELECT')
+                    bpy.ops.uv.select_all(action='SELECT')
+                    bpy.ops.uv.average_islands_scale()
+                    self.report({'WARNING'}, "%d of %d pieces were too big for the built-in solver, unwrapped them with Conformal" % (len(unsolved), len(iterations)))
+                bpy.ops.object.mode_set(mode='EDIT')
+                bpy.ops.uv.select_all(action='SELECT')
+                bpy.ops.uv.pack_islands(margin=0.02)
+                span.count(islands=len(iterations), iterations=sum(i for i in iterations if i is not None), unsolved=len(unsolved))
+        elif (self.do_unwrap != 'KEEP'):
+            with tracing.span("unwrap", faces=len(me.polygons)):
+                bpy.ops.uv.unwrap(method=self.do_unwrap, margin=0.02)
         bpy.ops.mesh.select_all(action='DESELECT')
 
         bm = bmesh.from_edit_mesh(me)
 
-        obj["S2S_InitialVolume"] = bm.calc_volume()
+        obj["S2S_InitialVolume"] = bm.calc_volume() if mirror is None else mirror.volume
 
         function_wrapper.do_update_edit_mesh(me)
 
@@ -143,7 +428,9 @@ class Seams_To_SewingPattern(Operator):
             max_edge_length = math.sqrt(area_per_triangle/(math.sqrt(3)/4))
 
             # A bias to compensate for stretching.
-            self.ensure_edgelength(max_edge_length * 0.8, bm, wm)
+            with tracing.span("subdivide_seams") as span:
+                yield from self.ensure_edgelength(max_edge_length * 0.8, bm, wm)
+                span.count(faces=len(bm.faces))
 
         warn_any_seam = False
 
@@ -162,184 +449,385 @@ class Seams_To_SewingPattern(Operator):
             )
             return {'CANCELLED'}
 
-        function_wrapper.do_bevel()
-
-        #####
-        '''
-        error now because I need to fix the fact that fanning edges dont exist
-        anymore maybe by finding ngons instead?
-        or removing doubled afer
-        '''
-        #####
-
-        # fix fanning seams
-        degenerate_edges = list()
-        for f in list(filter(lambda f: (f.select), bm.faces)):
-            is_degenerate = False
-            for v in f.verts:
-                vert_degenerate = True
-                for e in v.link_edges:
-                    if e.seam:
-                        vert_degenerate = False
-                if vert_degenerate:
-                    is_degenerate = True
-
-            for e in f.edges:
-                if e.is_boundary:
-                    is_degenerate = False
-
-            if is_degenerate:
+        yield "cutting"
+        with tracing.span("cut"):
+            function_wrapper.do_bevel()
+
+            #####
+            '''
+            error now because I need to fix the fact that fanning edges dont exist
+            anymore maybe by finding ngons instead?
+            or removing doubled afer
+            '''
+            #####
+
+            # fix fanning seams
+            degenerate_edges = list()
+            for f in list(filter(lambda f: (f.select), bm.faces)):
+                is_degenerate = False
+                for v in f.verts:
+                    vert_degenerate = True
+                    for e in v.link_edges:
+                        if e.seam:
+                            vert_degenerate = False
+                    if vert_degenerate:
+                        is_degenerate = True
+
                 for e in f.edges:
-                    degenerate_edges.append(e)
+                    if e.is_boundary:
+                        is_degenerate = False
+
+                if is_degenerate:
+                    for e in f.edges:
+                        degenerate_edges.append(e)
 
-        bmesh.ops.collapse(bm, edges=degenerate_edges, uvs=True)
+            bmesh.ops.collapse(bm, edges=degenerate_edges, uvs=True)
 
-        bpy.ops.mesh.delete(type='ONLY_FACE')
+            bpy.ops.mesh.delete(type='ONLY_FACE')
 
         bpy.ops.mesh.select_mode(type="FACE")
         faceGroups = []
 
         # isolate all face islands, and UV unwrap each island
 
-        faces = set(bm.faces[:])
-        wm.progress_begin(0, 99)
-        progress_max = len(faces)
-        progress = 0
-        while faces:
-            bpy.ops.mesh.select_all(action='DESELECT')
-            face = faces.pop()
-            face.select = True
-            bpy.ops.mesh.select_linked()
-            selected_faces = {f for f in faces if f.select}
-            selected_faces.add(face)  # this or bm.faces above?
-            faceGroups.append(selected_faces)
-            faces -= selected_faces
-
-            progress += len(selected_faces)
-            wm.progress_update((progress / progress_max))
+        with tracing.span("island_detection", faces=len(bm.faces)) as island_detection:
+            faces = set(bm.faces[:])
+            wm.progress_begin(0, 99)
+            progress_max = len(faces)
+            progress = 0
+            while faces:
+                bpy.ops.mesh.select_all(action='DESELECT')
+                face = faces.pop()
+                face.select = True
+                bpy.ops.mesh.select_linked()
+                selected_faces = {f for f in faces if f.select}
+                selected_faces.add(face)  # this or bm.faces above?
+                faceGroups.append(selected_faces)
+                faces -= selected_faces
+
+                progress += len(selected_faces)
+                wm.progress_update((progress / progress_max))
+                yield "finding pieces (%d)" % len(faceGroups)
+
+            island_detection.count(islands=len(faceGroups))
 
         uv_layer = bm.loops.layers.uv.active
 
-        progress = 0
-
-        area_before = 0
-        area_after = 0
-
-        for g in faceGroups:
-            progress += 1
-            wm.progress_update((progress / len(faceGroups)))
-            bpy.ops.mesh.select_mode(type='FACE')
-            bpy.ops.mesh.select_all(action='DESELECT')
-            average_position = mathutils.Vector((0, 0, 0))
-            facenum = 0
-
-            # calculate the area, average position
-
-            for f in g:
-                f.select = True
-                area_before += f.calc_area()
-                average_position += f.calc_center_median()
-                facenum += 1
-
-            average_position /= facenum
-
-            average_tangent = mathutils.Vector((0, 0, 0))
-            average_bitangent = mathutils.Vector((0, 0, 0))
-
-            # calculate a rough tangent and a bitangent
-
-            average_uv_position = mathutils.Vector((0, 0))
-            uv_position_samples = 0
-
-            for face in g:
-                for loop in face.loops:
-                    uv = loop[uv_layer].uv
-                    uv_position_samples += 1
-                    average_uv_position += uv
-                    delta = loop.vert.co - average_position
-                    average_tangent += delta * (uv.x - 0.5)
-                    average_bitangent += delta * (uv.y - 0.5)
-
-            # reorient the tangent and bitangent
-
-            average_uv_position /= uv_position_samples
-            average_tangent = average_tangent.normalized()
-            average_bitangent = average_bitangent.normalized()
-            average_normal = average_tangent.cross(
-                average_bitangent
-            ).normalized()
-            halfvector = average_bitangent + average_tangent
-            halfvector /= 2
-            halfvector.normalize()
-            # straighten out half vector
-            halfvector = average_normal.cross(halfvector)
-            halfvector = average_normal.cross(halfvector)
-            cw = mathutils.Matrix.Rotation(
-                math.radians(45.0), 4, average_normal
-            )
-            ccw = mathutils.Matrix.Rotation(
-                math.radians(-45.0), 4, average_normal
-            )
+        # needs the 3D positions, so before the islands get flattened
+        with tracing.span("grain_angles"):
+            self.store_grain_angles(bm, faceGroups, uv_layer)
+
+        with tracing.span("placement", islands=len(faceGroups)):
+            progress = 0
+
+            area_before = 0
+            area_after = 0
+
+            for g in faceGroups:
+                yield "placing pieces %d/%d" % (progress + 1, len(faceGroups))
+                progress += 1
+                wm.progress_update((progress / len(faceGroups)))
+                bpy.ops.mesh.select_mode(type='FACE')
+                bpy.ops.mesh.select_all(action='DESELECT')
+                average_position = mathutils.Vector((0, 0, 0))
+                facenum = 0
+
+                # calculate the area, average position
+
+                for f in g:
+                    f.select = True
+                    area_before += f.calc_area()
+                    average_position += f.calc_center_median()
+                    facenum += 1
+
+                average_position /= facenum
+
+                average_tangent = mathutils.Vector((0, 0, 0))
+                average_bitangent = mathutils.Vector((0, 0, 0))
+
+                # calculate a rough tangent and a bitangent
+
+                average_uv_position = mathutils.Vector((0, 0))
+                uv_position_samples = 0
+
+                for face in g:
+                    for loop in face.loops:
+                        uv = loop[uv_layer].uv
+                        uv_position_samples += 1
+                        average_uv_position += uv
+                        delta = loop.vert.co - average_position
+                        average_tangent += delta * (uv.x - 0.5)
+                        average_bitangent += delta * (uv.y - 0.5)
+
+                # reorient the tangent and bitangent
+
+                average_uv_position /= uv_position_samples
+                average_tangent = average_tangent.normalized()
+                average_bitangent = average_bitangent.normalized()
+                average_normal = average_tangent.cross(
+                    average_bitangent
+                ).normalized()
+                halfvector = average_bitangent + average_tangent
+                halfvector /= 2
+                halfvector.normalize()
+                # straighten out half vector
+                halfvector = average_normal.cross(halfvector)
+                halfvector = average_normal.cross(halfvector)
+                cw = mathutils.Matrix.Rotation(
+                    math.radians(45.0), 4, average_normal
+                )
+                ccw = mathutils.Matrix.Rotation(
+                    math.radians(-45.0), 4, average_normal
+                )
 
-            average_tangent = mathutils.Vector(halfvector)
-            average_tangent.rotate(ccw)
+                average_tangent = mathutils.Vector(halfvector)
+                average_tangent.rotate(ccw)
 
-            average_bitangent = mathutils.Vector(halfvector)
-            average_bitangent.rotate(cw)
+                average_bitangent = mathutils.Vector(halfvector)
+                average_bitangent.rotate(cw)
 
-            # offset each face island by their UV value, using the tangent and
-            # bitangent
+                # offset each face island by their UV value, using the tangent and
+                # bitangent
 
-            for face in g:
-                for loop in face.loops:
-                    uv = loop[uv_layer].uv
-                    vert = loop.vert
-                    pos = mathutils.Vector((0, 0, 0))
-                    pos += average_position
-                    pos += average_tangent * -(uv.x - average_uv_position.x)
-                    pos += average_bitangent * -(uv.y - average_uv_position.y)
-                    # arbitrary - should probably depend on object scale?
-                    pos += average_normal * 0.3
-                    vert.co = pos
+                for face in g:
+                    for loop in face.loops:
+                        uv = loop[uv_layer].uv
+                        vert = loop.vert
+                        pos = mathutils.Vector((0, 0, 0))
+                        pos += average_position
+                        pos += average_tangent * -(uv.x - average_uv_position.x)
+                        pos += average_bitangent * -(uv.y - average_uv_position.y)
+                        # arbitrary - should probably depend on object scale?
+                        pos += average_normal * 0.3
+                        vert.co = pos
 
-            function_wrapper.do_update_edit_mesh(me)
-            area_after += sum(f.calc_area() for f in g)
+                function_wrapper.do_update_edit_mesh(me)
+                area_after += sum(f.calc_area() for f in g)
 
         # done
 
-        area_ratio = math.sqrt(area_before / area_after)
-        bpy.ops.mesh.select_all(action='SELECT')
-        previous_pivot = bpy.context.scene.tool_settings.transform_pivot_point
-        bpy.context.scene.tool_settings.transform_pivot_point = (
-            'INDIVIDUAL_ORIGINS'
-        )
-        bpy.ops.transform.resize(value=(area_ratio, area_ratio, area_ratio))
-        bpy.context.scene.tool_settings.transform_pivot_point = previous_pivot
+        yield "scaling"
+        with tracing.span("scale"):
+            area_ratio = math.sqrt(area_before / area_after)
+            bpy.ops.mesh.select_all(action='SELECT')
+            previous_pivot = bpy.context.scene.tool_settings.transform_pivot_point
+            bpy.context.scene.tool_settings.transform_pivot_point = (
+                'INDIVIDUAL_ORIGINS'
+            )
+            bpy.ops.transform.resize(value=(area_ratio, area_ratio, area_ratio))
+            bpy.context.scene.tool_settings.transform_pivot_point = previous_pivot
 
-        obj["S2S_UVtoWORLDscale"] = area_ratio
+            obj["S2S_UVtoWORLDscale"] = area_ratio
 
-        function_wrapper.do_update_edit_mesh(me)
-        bpy.ops.mesh.select_all(action='SELECT')
+            function_wrapper.do_update_edit_mesh(me)
+            bpy.ops.mesh.select_all(action='SELECT')
 
-        bpy.ops.mesh.remove_doubles(threshold=0.0004, use_unselected=False)
+            bpy.ops.mesh.remove_doubles(threshold=0.0004, use_unselected=False)
 
         if (self.use_remesh):
             bpy.ops.mesh.dissolve_limited(angle_limit=0.01)
             bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
-            bpy.ops.remesh.boundary_aligned_remesh(
-                edge_length=max_edge_length, iterations=10, reproject=False
-            )
+            with tracing.span("boundary_aligned_remesh"):
+                with tracing.span("build", faces=len(obj.data.polygons)):
+                    remesher = BoundaryAlignedRemesher(obj)
+                try:
+                    for i in remesher.remesh_steps(max_edge_length, REMESH_ITERATIONS, quads=False, reproject=False):
+                        wm.progress_update((i + 1) / REMESH_ITERATIONS)
+                        yield "remeshing %d/%d" % (i + 1, REMESH_ITERATIONS)
+                except Exception:
+                    # like the remesh operator: report it and keep the pattern as it was before remeshing
+                    self.report({'ERROR'}, REMESH_FAILED)
+                else:
+                    remesher.bm.to_mesh(obj.data)
 
         bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
 
-        wm.progress_end()
+        if mirror is not None:
+            yield "mirroring pieces"
+            with tracing.span("mirror", pairs=mirror.pairs) as span:
+                wires, uv_scale = symmetry.add_mirrored(obj.data, mirror)
+                obj["S2S_UVtoWORLDscale"] *= uv_scale
+                span.count(wires=wires)
 
-        # fix 2.9 wm.progress problem
-        bpy.context.window.cursor_set('NONE')
-        bpy.context.window.cursor_set('DEFAULT')
+        if obj != src_obj and not self.keep_original:
+            obj = self.adopt(src_obj, obj)
+
+        return self.finish(obj)
+
+    def finish(self, obj):
+        if self.pattern_file:
+            with tracing.span("save_pattern"):
+                pattern_io.save_object(obj, bpy.path.abspath(self.pattern_file))
+
+        bpy.context.window_manager.progress_end()
+
+        # fix 2.9 wm.progress problem, there's no window when running in the background
+        if bpy.context.window is not None:
+            bpy.context.window.cursor_set('NONE')
+            bpy.context.window.cursor_set('DEFAULT')
 
         return{'FINISHED'}
 
+    def unfold_streaming(self, src_obj):
+        """ The low memory unfold, as a generator like unfold(): the pieces go a batch at a time into a new object """
+        if src_obj.mode == 'EDIT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+        with tracing.span("read_mesh") as span:
+            if self.apply_modifiers:
+                depsgraph = bpy.context.evaluated_depsgraph_get()
+                evaluated = src_obj.evaluated_get(depsgraph)
+                arrays = island_stream.read_mesh(evaluated.to_mesh())
+                evaluated.to_mesh_clear()
+            else:
+                arrays = island_stream.read_mesh(src_obj.data)
+            span.count(faces=len(arrays["face_offsets"]) - 1)
+
+        if not arrays["seams"].any():
+            self.report(
+                {'ERROR'},
+                (
+                    'There are no seams in this mesh. Please add seams where'
+                    ' you want to cut the model.'
+                )
+            )
+            return {'CANCELLED'}
+        yield "reading mesh"
+
+        wm = bpy.context.window_manager
+        wm.progress_begin(0, 99)
+        self._unwrapped_pieces = 0
+        steps = island_stream.unfold(
+            arrays,
+            remesh=self.use_remesh,
+            target_tris=self.target_tris,
+            iterations=REMESH_ITERATIONS,
+            keep_uvs=self.do_unwrap == 'KEEP',
+            grain_angles=self.store_grain_angles,
+            unwrap=self.unwrap_piece,
+        )
+        del arrays
+        with tracing.span("unfold_pieces") as span:
+            try:
+                while True:
+                    done, count = next(steps)
+                    wm.progress_update(done / count)
+                    yield "unfolding pieces %d/%d" % (done, count)
+            except StopIteration as result:
+                pattern, properties = result.value
+            except island_stream.PieceError as error:
+                self.report({'ERROR'}, str(error))
+                return {'CANCELLED'}
+            span.count(faces=len(pattern["face_offsets"]) - 1, wires=len(pattern["wires"]), unwrapped=self._unwrapped_pieces)
+        if self._unwrapped_pieces:
+            self.report({'WARNING'}, "%d pieces were too big for the built-in solver, unwrapped them with Conformal" % self._unwrapped_pieces)
+
+        with tracing.span("build_pattern", faces=len(pattern["face_offsets"]) - 1):
+            obj = pattern_io.to_object(pattern, {"name": src_obj.name, "properties": properties}, bpy.context)
+            obj.matrix_world = src_obj.matrix_world
+            for material in src_obj.data.materials:
+                obj.data.materials.append(material)
+            if len(obj.data.polygons) == len(pattern["materials"]):
+                obj.data.polygons.foreach_set("material_index", pattern["materials"])
+        self._work = obj
+
+        if not self.keep_original:
+            obj = self.adopt(src_obj, obj)
+        return self.finish(obj)
+
+    def unwrap_piece(self, bm):
+        """ Unwraps a piece of the low memory unfold with Blender's conformal unwrap, returns the UV of every vertex """
+        self._unwrapped_pieces += 1
+        context = bpy.context
+        active = context.view_layer.objects.active
+        selected = list(context.selected_objects)
+        mesh = bpy.data.meshes.new("S2S_piece")
+        bm.to_mesh(mesh)
+        obj = bpy.data.objects.new(mesh.name, mesh)
+        context.collection.objects.link(obj)
+        for other in selected:
+            other.select_set(False)
+        obj.select_set(True)
+        context.view_layer.objects.active = obj
+        try:
+            bpy.ops.object.mode_set(mode='EDIT')
+            bpy.ops.mesh.select_all(action='SELECT')
+            bpy.ops.uv.unwrap(method='CONFORMAL', margin=0.0)
+            bpy.ops.object.mode_set(mode='OBJECT')
+            loop_uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+            mesh.uv_layers.active.data.foreach_get("uv", loop_uvs)
+            loop_verts = np.empty(len(mesh.loops), dtype=np.int64)
+            mesh.loops.foreach_get("vertex_index", loop_verts)
+            return lscm_solver.corner_average(loop_verts, loop_uvs.reshape(-1, 2).astype(np.float64), len(mesh.vertices))
+        finally:
+            bpy.data.objects.remove(obj)
+            bpy.data.meshes.remove(mesh)
+            for other in selected:
+                other.select_set(True)
+            context.view_layer.objects.active = active
+
+    def store_grain_angles(self, bm, face_groups, uv_layer):
+        """ Stores the grain direction of every island as an angle in UV space, in the S2S_grain_angle face layer.
+
+        The material_direction of every marked face is mapped into UV space
+        with the Jacobian of that face's UV map, the island's grain is the
+        area weighted average of those. Islands without marked faces get NaN,
+        meshes without a material_direction attribute get no layer at all.
+        """
+        grain_layer = None
+        if hasattr(bm.faces.layers, "float_vector"):
+            grain_layer = bm.faces.layers.float_vector.get("material_direction")
+        if grain_layer is None:
+            return
+
+        angle_layer = bm.faces.layers.float.get("S2S_grain_angle")
+        if angle_layer is None:
+            angle_layer = bm.faces.layers.float.new("S2S_grain_angle")
+
+        islands = []
+        positions = []
+        uvs = []
+        grains = []
+        for island, g in enumerate(face_groups):
+            for f in g:
+                grain = f[grain_layer]
+                if grain.length_squared > 0 and len(f.loops) >= 3:
+                    loops = f.loops[:3]
+                    islands.append(island)
+                    positions.append([l.vert.co.to_tuple() for l in loops])
+                    uvs.append([l[uv_layer].uv.to_tuple() for l in loops])
+                    grains.append(grain.to_tuple())
+
+        sums = np.zeros((len(face_groups), 2))
+        if islands:
+            positions = np.array(positions)
+            uvs = np.array(uvs)
+            grains = np.array(grains)
+
+            # Jacobian of the UV map: J = D (E^T E)^-1 E^T, with E the 3D and D
+            # the UV edge vectors of a face, solved for all faces at once
+            edges = (positions[:, 1:] - positions[:, :1]).transpose(0, 2, 1)
+            uv_edges = (uvs[:, 1:] - uvs[:, :1]).transpose(0, 2, 1)
+            gram = np.einsum('nki,nkj->nij', edges, edges)
+            det = gram[:, 0, 0] * gram[:, 1, 1] - gram[:, 0, 1] * gram[:, 1, 0]
+            valid = np.abs(det) > 1e-20
+            rhs = np.einsum('nki,nk->ni', edges, grains)
+            safe_det = np.where(valid, det, 1.0)
+            coefficients = np.stack((
+                (gram[:, 1, 1] * rhs[:, 0] - gram[:, 0, 1] * rhs[:, 1]) / safe_det,
+                (gram[:, 0, 0] * rhs[:, 1] - gram[:, 1, 0] * rhs[:, 0]) / safe_det,
+            ), axis=1)
+            directions = np.einsum('nij,nj->ni', uv_edges, coefficients)
+
+            lengths = np.linalg.norm(directions, axis=1)
+            areas = np.linalg.norm(np.cross(edges[:, :, 0], edges[:, :, 1]), axis=1) / 2
+            weights = np.where(valid & (lengths > 0), areas / np.where(lengths > 0, lengths, 1.0), 0.0)
+            np.add.at(sums, np.array(islands), directions * weights[:, None])
+
+        angles = np.where(np.any(sums != 0, axis=1), np.arctan2(sums[:, 1], sums[:, 0]), np.nan)
+        for g, angle in zip(face_groups, angles):
+            for f in g:
+                f[angle_layer] = angle
+
     def ensure_edgelength(self, max_length, mesh, wm):
         seam_edges = list(filter(lambda e: e.seam, mesh.edges))
         edge_groups = defaultdict(list)
@@ -358,6 +846,8 @@ class Seams_To_SewingPattern(Operator):
             bmesh.ops.subdivide_edges(
                 mesh, edges=eg, cuts=math.floor(edge_length / max_length)
             )
+            progress += 1
+            yield "subdividing seams %d/%d" % (progress, len(edge_groups))
 
         bmesh.ops.triangulate(
             mesh, faces=mesh.faces, quad_method='BEAUTY', ngon_method='BEAUTY'
@@ -0,0 +1,463 @@
+"""2D helpers for the sewing pattern exporters.
+
+All functions in here work on plain lists of (x, y) tuples in document
+millimeters, so they don't depend on bpy and can be shared by every output
+format. Numpy is used where whole outlines are compared at once.
+"""
+
+import math
+
+import numpy as np
+
+
+def format_number(value, precision):
+    """ Formats a coordinate with at most `precision` decimals, without trailing zeros """
+    text = "%.*f" % (precision, value)
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    if text == "-0":
+        text = "0"
+    return text
+
+
+def _segment_distance(p, a, b):
+    dx = b[0] - a[0]
+    dy = b[1] - a[1]
+    length_squared = dx * dx + dy * dy
+    if length_squared == 0.0:
+        return math.hypot(p[0] - a[0], p[1] - a[1])
+    t = ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length_squared
+    t = max(0.0, min(1.0, t))
+    return math.hypot(p[0] - (a[0] + t * dx), p[1] - (a[1] + t * dy))
+
+
+def simplify_loop(points, tolerance, keep=()):
+    """ Douglas-Peucker simplification of a closed loop.
+
+    points should not repeat the first point at the end. Indices in keep
+    (for example alignment marker vertices) always survive. Returns the
+    sorted indices of the points to keep.
+    """
+    count = len(points)
+    if tolerance <= 0.0 or count <= 3:
+        return list(range(count))
+
+    anchors = sorted(set(keep))
+    if not anchors:
+        # A closed loop needs at least two anchors, use the first point and
+        # the point furthest away from it.
+        first = points[0]
+        furthest = max(range(count), key=lambda i: (points[i][0] - first[0]) ** 2 + (points[i][1] - first[1]) ** 2)
+        anchors = [0, furthest] if furthest != 0 else [0]
+
+    kept = set(anchors)
+    for n, start in enumerate(anchors):
+        end = anchors[(n + 1) % len(anchors)]
+        if end <= start:
+            end += count
+
+        # iterative instead of recursive, long knife cuts can have thousands of points
+        stack = [(start, end)]
+        while stack:
+            first, last = stack.pop()
+            if last - first < 2:
+                continue
+            a = points[first % count]
+            b = points[last % count]
+            max_distance = -1.0
+            max_index = first
+            for i in range(first + 1, last):
+                distance = _segment_distance(points[i % count], a, b)
+                if distance > max_distance:
+                    max_distance = distance
+                    max_index = i
+            if max_distance > tolerance:
+                kept.add(max_index % count)
+                stack.append((first, max_index))
+                stack.append((max_index, last))
+
+    return sorted(kept)
+
+
+def loops_to_path_data(loops, precision, relative=False):
+    """ Builds the d attribute of an SVG path out of closed loops.
+
+    Coordinates are rounded to `precision` decimals first, relative offsets
+    are then taken between the rounded points so no error accumulates along
+    the outline.
+    """
+    scale = 10 ** precision
+    commands = []
+    previous_start = None
+    for loop in loops:
+        if len(loop) == 0:
+            continue
+        rounded = [(round(x * scale), round(y * scale)) for x, y in loop]
+        if relative:
+            if previous_start is None:
+                start = rounded[0]
+            else:
+                start = (rounded[0][0] - previous_start[0], rounded[0][1] - previous_start[1])
+            parts = ['m' + format_number(start[0] / scale, precision) + ',' + format_number(start[1] / scale, precision)]
+            last = rounded[0]
+            for point in rounded[1:]:
+                dx = point[0] - last[0]
+                dy = point[1] - last[1]
+                if dx == 0 and dy == 0:
+                    continue
+                parts.append(format_number(dx / scale, precision) + ',' + format_number(dy / scale, precision))
+                last = point
+            parts.append('z')
+            # after z the current point is back at the start of the subpath
+            previous_start = rounded[0]
+        else:
+            parts = ['M']
+            for point in rounded:
+                parts.append(format_number(point[0] / scale, precision) + ',' + format_number(point[1] / scale, precision))
+            parts.append('Z')
+        commands.append(' '.join(parts))
+    return ' '.join(commands)
+
+
+def segment_maximum(values, kept):
+    """ For a loop simplified to the sorted indices in kept, the largest per-edge value each remaining edge covers """
+    values = np.asarray(values, dtype=float)
+    kept = np.asarray(kept, dtype=int)
+    if len(values) == 0 or len(kept) == 0:
+        return []
+    return np.maximum.reduceat(np.roll(values, -kept[0]), kept - kept[0]).tolist()
+
+
+def signed_area(loop):
+    area = 0.0
+    for i in range(len(loop)):
+        x0, y0 = loop[i - 1]
+        x1, y1 = loop[i]
+        area += x0 * y1 - x1 * y0
+    return area / 2.0
+
+
+def outer_loop(loops):
+    """ The loop with the largest area, the others are holes """
+    return max(loops, key=lambda loop: abs(signed_area(loop)))
+
+
+# outlines are compared at this many points spaced evenly along them
+COMPARE_POINTS = 64
+
+# and checked against each other at no more than this many
+CHECK_POINTS = 1024
+
+# relative size of the perimeter and area cells of shape_signature
+SIGNATURE_STEP = 0.02
+
+# iterations that fit the motion found from the samples to the whole outline
+REFINE_ITERATIONS = 4
+
+# rounds that narrow down where the samples of the other outline start
+PHASE_ROUNDS = 3
+
+
+def loop_perimeter(loop):
+    points = np.asarray(loop, dtype=float)
+    return float(np.sum(np.linalg.norm(np.roll(points, -1, axis=0) - points, axis=1)))
+
+
+def resample_loop(loop, count, start=0.0):
+    """ count points spaced evenly along a closed loop by arc length, starting start past its first point """
+    points = np.asarray(loop, dtype=float)
+    edges = np.roll(points, -1, axis=0) - points
+    lengths = np.linalg.norm(edges, axis=1)
+    ends = np.cumsum(lengths)
+    if ends[-1] <= 0.0:
+        return np.repeat(points[:1], count, axis=0)
+    positions = (start + np.arange(count) * (ends[-1] / count)) % ends[-1]
+    edge = np.minimum(np.searchsorted(ends, positions, side='right'), len(points) - 1)
+    along = (positions - (ends[edge] - lengths[edge])) / np.maximum(lengths[edge], 1e-12)
+    return points[edge] + edges[edge] * along[:, None]
+
+
+def shape_signature(loops):
+    """ The cell of a piece by the number of loops and the perimeter and area of its outer loop.
+
+    Congruent pieces, even rotated, mirrored or outlined with other points,
+    land in the same or in a neighboring cell (see neighbor_signatures).
+    They still need to be confirmed with congruent_transform.
+    """
+    outer = outer_loop(loops)
+    step = math.log1p(SIGNATURE_STEP)
+    return (
+        len(loops),
+        round(math.log(max(loop_perimeter(outer), 1e-9)) / step),
+        round(math.log(max(abs(signed_area(outer)), 1e-9)) / step),
+    )
+
+
+def neighbor_signatures(signature):
+    """ The signature and the ones next to it, pieces close to a cell border can be in either """
+    loops, perimeter, area = signature
+    return [(loops, perimeter + i, area + j) for i in (-1, 0, 1) for j in (-1, 0, 1)]
+
+
+def _closest_points(points, loop):
+    """ The closest point on a closed loop to every point """
+    a = np.asarray(loop, dtype=float)
+    edges = np.roll(a, -1, axis=0) - a
+    length_squared = np.maximum(np.einsum('ij,ij->i', edges, edges), 1e-18)
+    relative = points[:, None, :] - a[None, :, :]
+    t = np.clip(np.einsum('pij,ij->pi', relative, edges) / length_squared, 0.0, 1.0)
+    closest = a[None, :, :] + t[:, :, None] * edges[None, :, :]
+    nearest = np.argmin(np.einsum('pik,pik->pi', points[:, None, :] - closest, points[:, None, :] - closest), axis=1)
+    return closest[np.arange(len(points)), nearest]
+
+
+def _fit(source, target):
+    """ The rotation and offset that move source closest to target, point by point """
+    source_center = source.mean(axis=0)
+    target_center = target.mean(axis=0)
+    s = source - source_center
+    t = target - target_center
+    angle = math.atan2(np.sum(s[:, 0] * t[:, 1] - s[:, 1] * t[:, 0]), np.sum(s * t))
+    c = math.cos(angle)
+    si = math.sin(angle)
+    offset = target_center - (source_center[0] * c - source_center[1] * si, source_center[0] * si + source_center[1] * c)
+    return angle, float(offset[0]), float(offset[1])
+
+
+def _transform(points, transform):
+    angle, mirrored, dx, dy = transform
+    if mirrored:
+        points = points * (1.0, -1.0)
+    c = math.cos(angle)
+    s = math.sin(angle)
+    return np.stack((points[:, 0] * c - points[:, 1] * s + dx, points[:, 0] * s + points[:, 1] * c + dy), axis=1)
+
+
+def congruent_transform(reference, other, tolerance):
+    """ Finds the rigid motion (with an optional reflection) that maps reference onto other.
+
+    Both are closed loops, with any points, starting point and direction.
+    The motion is found on COMPARE_POINTS evenly spaced samples of both and
+    then fitted to the whole outlines, which have to stay within tolerance
+    of each other. Returns (angle, mirrored, dx, dy) so that
+    other ~ rotate(angle) * mirror * reference + (dx, dy), or None.
+    """
+    if len(reference) < 3 or len(other) < 3:
+        return None
+    perimeter = loop_perimeter(reference)
+    if abs(perimeter - loop_perimeter(other)) > perimeter * SIGNATURE_STEP * 2 + tolerance * 2:
+        return None
+
+    n = COMPARE_POINTS
+    step = perimeter / n
+    # samples of two congruent outlines can be off by half a step along them
+    slack = tolerance + step
+    a = resample_loop(reference, n)
+    shifts = (np.arange(n)[:, None] + np.arange(n)[None, :]) % n
+    best = None
+
+    for reverse in (False, True):
+        loop = np.asarray(other, dtype=float)[::-1] if reverse else np.asarray(other, dtype=float)
+        b = resample_loop(loop, n)
+        # every cyclic shift of other against reference at once
+        t = (b - b.mean(axis=0))[shifts]
+        for mirrored in (False, True):
+            source = a * (1.0, -1.0) if mirrored else a
+            s = source - source.mean(axis=0)
+            angles = np.arctan2(
+                np.sum(s[None, :, 0] * t[:, :, 1] - s[None, :, 1] * t[:, :, 0], axis=1),
+                np.sum(s[None] * t, axis=(1, 2)),
+            )
+            c = np.cos(angles)[:, None]
+            si = np.sin(angles)[:, None]
+            rotated = np.stack((s[None, :, 0] * c - s[None, :, 1] * si, s[None, :, 0] * si + s[None, :, 1] * c), axis=2)
+            errors = np.max(np.linalg.norm(rotated - t, axis=2), axis=1)
+            shift = int(np.argmin(errors))
+            if errors[shift] <= slack and (best is None or errors[shift] < best[0]):
+                best = (errors[shift], loop, source, mirrored, float(shift))
+
+    if best is None:
+        return None
+    _, loop, source, mirrored, phase = best
+
+    def phase_error(phase):
+        target = resample_loop(loop, n, phase * step)
+        angle, dx, dy = _fit(source, target)
+        return np.max(np.linalg.norm(_transform(source, (angle, False, dx, dy)) - target, axis=1))
+
+    # the samples of other start somewhere between two of the shifts
+    width = 1.0
+    for _ in range(PHASE_ROUNDS):
+        candidates = phase + np.linspace(-width, width, 17)
+        phase = float(candidates[int(np.argmin([phase_error(c) for c in candidates]))])
+        width /= 8.0
+    angle, dx, dy = _fit(source, resample_loop(loop, n, phase * step))
+
+    count = int(min(CHECK_POINTS, max(n, math.ceil(perimeter / max(tolerance, 1e-9)))))
+    samples = resample_loop(reference, count)
+    dense = samples * (1.0, -1.0) if mirrored else samples
+    # then fit the whole reference onto the closest points of other
+    for _ in range(REFINE_ITERATIONS):
+        moved = _transform(samples, (angle, mirrored, dx, dy))
+        angle, dx, dy = _fit(dense, _closest_points(moved, other))
+    transform = (angle, mirrored, dx, dy)
+
+    moved = _transform(samples, transform)
+    if np.max(np.linalg.norm(_closest_points(moved, other) - moved, axis=1)) > tolerance:
+        return None
+    back = resample_loop(other, count)
+    if np.max(np.linalg.norm(_closest_points(back, moved) - back, axis=1)) > tolerance:
+        return None
+    return transform
+
+
+def _loop_neighbors(loop_ids):
+    """ Next and previous index of every point, for points of many loops stored back to back """
+    count = len(loop_ids)
+    index = np.arange(count)
+    starts = np.flatnonzero(np.r_[True, loop_ids[1:] != loop_ids[:-1]])
+    ends = np.r_[starts[1:], count] - 1
+    nxt = index + 1
+    nxt[ends] = starts
+    prv = index - 1
+    prv[starts] = ends
+    return nxt, prv
+
+
+def _intersect(point_a, direction_a, point_b, direction_b):
+    """ Intersections of lines a and b, parallel lines give the point on b """
+    cross = direction_a[:, 0] * direction_b[:, 1] - direction_a[:, 1] * direction_b[:, 0]
+    delta = point_b - point_a
+    parallel = np.abs(cross) < 1e-9
+    s = (delta[:, 0] * direction_b[:, 1] - delta[:, 1] * direction_b[:, 0]) / np.where(parallel, 1.0, cross)
+    return np.where(parallel[:, None], point_b, point_a + direction_a * s[:, None])
+
+
+def _antiparallel(direction_a, direction_b):
+    cross = direction_a[:, 0] * direction_b[:, 1] - direction_a[:, 1] * direction_b[:, 0]
+    dot = np.einsum('ij,ij->i', direction_a, direction_b)
+    return (np.abs(cross) < 1e-9) & (dot < 0.0)
+
+
+def offset_loops(loops, distances, holes, round_corners=False, miter_limit=2.0, max_cleanup=64):
+    """ Offsets closed loops away from the material, for seam allowances.
+
+    loops: lists of (x, y), all loops of all pieces are processed at once
+    distances: for every loop, a distance per edge (edge i goes from point i
+        to point i + 1) or a single distance for the whole loop
+    holes: for every loop, whether it's a hole in its piece. Outer loops
+        grow outwards, holes grow into the hole.
+
+    Convex corners are mitred (bevelled beyond miter_limit) or rounded.
+    Edges that collapse at concave corners, which would make the offset
+    cross itself, are removed until none are left. Returns the offset loops.
+    """
+    loops = [np.asarray(loop, dtype=float).reshape(-1, 2) for loop in loops]
+    sizes = np.array([len(loop) for loop in loops], dtype=int)
+    if sizes.sum() == 0:
+        return [[] for _ in loops]
+
+    points = np.concatenate(loops)
+    loop_ids = np.repeat(np.arange(len(loops)), sizes)
+    distance = np.concatenate([np.broadcast_to(np.asarray(d, dtype=float), (len(loop),)) for loop, d in zip(loops, distances)])
+
+    # drop repeated points, they have no direction
+    nxt, prv = _loop_neighbors(loop_ids)
+    keep = np.linalg.norm(points[nxt] - points, axis=1) > 1e-9
+    points = points[keep]
+    loop_ids = loop_ids[keep]
+    distance = distance[keep]
+
+    nxt, prv = _loop_neighbors(loop_ids)
+    cross = points[:, 0] * points[nxt, 1] - points[nxt, 0] * points[:, 1]
+    area = np.bincount(loop_ids, weights=cross, minlength=len(loops))
+    side = np.sign(area) * np.where(np.asarray(holes, dtype=bool), -1.0, 1.0)
+
+    edges = points[nxt] - points
+    tangent = edges / np.linalg.norm(edges, axis=1)[:, None]
+    # for loops with a positive area, (y, -x) points out of the loop
+    normal = np.stack((tangent[:, 1], -tangent[:, 0]), axis=1) * side[loop_ids][:, None]
+    line_points = points + normal * distance[:, None]
+    pivots = points
+
+    for _ in range(max_cleanup):
+        nxt, prv = _loop_neighbors(loop_ids)
+        corners = _intersect(line_points[prv], tangent[prv], line_points, tangent)
+        collapsed = np.einsum('ij,ij->i', corners[nxt] - corners, tangent) < 0.0
+        # the two sides of a thin notch are parallel, they collapse once they pass each other
+        folded = _antiparallel(tangent[prv], tangent)
+        before = np.einsum('ij,ij->i', pivots - pivots[prv], normal[prv])
+        after = np.einsum('ij,ij->i', line_points - line_points[prv], normal[prv])
+        crossed = folded & (before * after < 0.0)
+        collapsed |= crossed | crossed[nxt]
+        # never take a loop below three edges
+        remaining = np.bincount(loop_ids, minlength=len(loops))
+        collapsed &= remaining[loop_ids] > 3
+        if not collapsed.any():
+            break
+        # removing both neighbors at once can skip over a valid edge
+        collapsed &= ~collapsed[prv] | (np.arange(len(collapsed)) % 2 == 0)
+        alive = ~collapsed
+        line_points = line_points[alive]
+        tangent = tangent[alive]
+        normal = normal[alive]
+        distance = distance[alive]
+        pivots = pivots[alive]
+        loop_ids = loop_ids[alive]
+
+    nxt, prv = _loop_neighbors(loop_ids)
+    corners = _intersect(line_points[prv], tangent[prv], line_points, tangent)
+    # the tip of a thin spike turns back on itself, that's always convex
+    folded = _antiparallel(tangent[prv], tangent)
+    convex = (np.einsum('ij,ij->i', normal[prv], tangent) < -1e-9) | folded
+
+    # arc between the normals of both edges, around the original vertex
+    start_angle = np.arctan2(normal[prv, 1], normal[prv, 0])
+    turn = np.arctan2(
+        normal[prv, 0] * normal[:, 1] - normal[prv, 1] * normal[:, 0],
+        np.einsum('ij,ij->i', normal[prv], normal),
+    )
+    # around a spike tip the arc has to pass the direction the spike points to
+    tip_turn = math.pi * np.sign(normal[prv, 0] * tangent[prv, 1] - normal[prv, 1] * tangent[prv, 0])
+    turn = np.where(folded, tip_turn, turn)
+    if round_corners:
+        counts = np.where(convex, np.maximum(2, np.ceil(np.abs(turn) / (math.pi / 8.0)).astype(int) + 1), 1)
+    else:
+        miter = np.linalg.norm(corners - pivots, axis=1) / np.maximum(np.maximum(distance[prv], distance), 1e-9)
+        counts = np.where(convex & ((miter > miter_limit) | folded), 2, 1)
+
+    owner = np.repeat(np.arange(len(counts)), counts)
+    step = np.arange(owner.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    fraction = step / np.maximum(counts[owner] - 1, 1)
+    radius = distance[prv][owner] + (distance[owner] - distance[prv][owner]) * fraction
+    angle = start_angle[owner] + turn[owner] * fraction
+    arc = pivots[owner] + radius[:, None] * np.stack((np.cos(angle), np.sin(angle)), axis=1)
+    result = np.where((counts[owner] > 1)[:, None], arc, corners[owner])
+
+    result_ids = loop_ids[owner]
+    return [result[result_ids == i].tolist() for i in range(len(loops))]
+
+
+def grainline(loops, center, angle, offset=0.0, head=5.0):
+    """ A double headed grainline arrow through a piece, as a list of line segments.
+
+    The arrow runs along `angle` over 60% of the outer loop's extent in that
+    direction, moved sideways by `offset` so it stays clear of the label.
+    """
+    direction = np.array((math.cos(angle), math.sin(angle)))
+    side = np.array((-direction[1], direction[0]))
+    outer = np.asarray(outer_loop(loops), dtype=float)
+    relative = outer - np.asarray(center, dtype=float)
+    along = relative @ direction
+    middle = np.asarray(center, dtype=float) + direction * (along.min() + along.max()) / 2.0 + side * offset
+    half = 0.3 * (along.max() - along.min())
+
+    start = middle - direction * half
+    end = middle + direction * half
+    barb = head * math.cos(math.radians(25.0))
+    spread = head * math.sin(math.radians(25.0))
+    segments = [(start, end)]
+    for tip, back in ((end, -direction), (start, direction)):
+        segments.append((tip, tip + back * barb + side * spread))
+        segments.append((tip, tip + back * barb - side * spread))
+    return [((float(a[0]), float(a[1])), (float(b[0]), float(b[1]))) for a, b in segments]
@@ -0,0 +1,222 @@
+"""On disk format for unfolded sewing patterns.
+
+A pattern is a handful of flat arrays plus a meta.json, so stages can pass
+patterns between processes without saving whole .blend files, and the data
+can be inspected with numpy alone:
+
+    pattern.s2s/            a directory of .npy files, loaded with numpy.memmap
+        meta.json
+        positions.npy       (V, 3) float32, vertex coordinates
+        face_offsets.npy    (F + 1,) int32, where every face starts in face_verts
+        face_verts.npy      (L,) int32, the vertices of all faces
+        uvs.npy             (L, 2) float32, one UV per face corner
+        islands.npy         (F,) int32, the piece every face belongs to
+        wires.npy           (W, 2) int32, the sewing edges
+        wire_seams.npy      (W,) bool, sewing edges marked as seam (alignment markers)
+        grain.npy           (F, 3) float32, material_direction, if marked
+        grain_angles.npy    (F,) float32, S2S_grain_angle, if unfolded with it
+        allowance_edges.npy (A, 2) int32 and allowance_values.npy (A,) float32,
+                            the seam_allowance edge attribute where it is set
+
+or the same arrays in a single .npz file. meta.json holds the format
+version, the object name and the S2S_* custom properties.
+
+Only from_object and to_object need Blender, save and load work anywhere.
+"""
+
+import json
+import os
+
+import numpy as np
+
+VERSION = 1
+META_FILE = "meta.json"
+
+def save(path, arrays, meta):
+    """ Writes a pattern, as .npz if path ends with it and as a directory of .npy files otherwise """
+    meta = dict(meta, version=VERSION, arrays={name: [str(a.dtype), list(a.shape)] for name, a in arrays.items()})
+    if path.endswith(".npz"):
+        np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+        return
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), np.ascontiguousarray(array))
+    with open(os.path.join(path, META_FILE), "w") as file:
+        json.dump(meta, file, indent=1)
+
+
+def load(path, mmap=True):
+    """ Reads a pattern, returns (arrays, meta). Arrays of a directory are memory mapped unless mmap is False """
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            arrays = {name: data[name] for name in data.files if name != "meta"}
+    else:
+        with open(os.path.join(path, META_FILE)) as file:
+            meta = json.load(file)
+        arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode='r' if mmap else None) for name in meta["arrays"]}
+    if meta.get("version", 0) > VERSION:
+        raise ValueError("Pattern %s was written by a newer version (%d)" % (path, meta["version"]))
+    return arrays, meta
+
+
+def face_islands(face_offsets, face_verts, vertex_count):
+    """ Connected pieces of faces sharing vertices, as one label per face """
+    face_count = len(face_offsets) - 1
+    if face_count == 0:
+        return np.zeros(0, dtype=np.int32)
+    face_of_corner = np.repeat(np.arange(face_count), np.diff(face_offsets))
+    labels = np.arange(vertex_count)
+    # every vertex takes the lowest label of its faces, with pointer jumping
+    # so long strips don't need as many rounds as they are long
+    while True:
+        face_labels = np.minimum.reduceat(labels[face_verts], face_offsets[:-1])
+        updated = labels.copy()
+        np.minimum.at(updated, face_verts, face_labels[face_of_corner])
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    _, islands = np.unique(face_labels, return_inverse=True)
+    return islands.astype(np.int32)
+
+
+def from_object(obj):
+    """ Reads the arrays and meta of a pattern object, in object mode """
+    mesh = obj.data
+    vertex_count = len(mesh.vertices)
+    positions = np.empty(vertex_count * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", positions)
+
+    face_count = len(mesh.polygons)
+    loop_starts = np.empty(face_count, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    face_verts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", face_verts)
+    face_offsets = np.append(loop_starts, len(mesh.loops)).astype(np.int32)
+
+    uvs = np.zeros(len(mesh.loops) * 2, dtype=np.float32)
+    if mesh.uv_layers.active is not None:
+        mesh.uv_layers.active.data.foreach_get("uv", uvs)
+
+    edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edges)
+    edges = edges.reshape(-1, 2)
+    seams = np.zeros(len(mesh.edges), dtype=bool)
+    mesh.edges.foreach_get("use_seam", seams)
+    loop_edges = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("edge_index", loop_edges)
+    is_wire = np.ones(len(mesh.edges), dtype=bool)
+    is_wire[loop_edges] = False
+
+    arrays = {
+        "positions": positions.reshape(-1, 3),
+        "face_offsets": face_offsets,
+        "face_verts": face_verts,
+        "uvs": uvs.reshape(-1, 2),
+        "islands": face_islands(face_offsets, face_verts, vertex_count),
+        "wires": edges[is_wire],
+        "wire_seams": seams[is_wire],
+    }
+
+    attributes = mesh.attributes
+    if "material_direction" in attributes and attributes["material_direction"].domain == 'FACE':
+        grain = np.empty(face_count * 3, dtype=np.float32)
+        attributes["material_direction"].data.foreach_get("vector", grain)
+        arrays["grain"] = grain.reshape(-1, 3)
+    if "S2S_grain_angle" in attributes and attributes["S2S_grain_angle"].domain == 'FACE':
+        angles = np.empty(face_count, dtype=np.float32)
+        attributes["S2S_grain_angle"].data.foreach_get("value", angles)
+        arrays["grain_angles"] = angles
+    if "seam_allowance" in attributes and attributes["seam_allowance"].domain == 'EDGE':
+        allowances = np.empty(len(mesh.edges), dtype=np.float32)
+        attributes["seam_allowance"].data.foreach_get("value", allowances)
+        used = allowances != 0
+        arrays["allowance_edges"] = edges[used]
+        arrays["allowance_values"] = allowances[used]
+
+    meta = {
+        "name": obj.name,
+        "properties": {key: _plain(obj[key]) for key in obj.keys() if key.startswith("S2S_")},
+        "counts": {"vertices": vertex_count, "faces": face_count, "islands": int(arrays["islands"].max(initial=-1)) + 1, "wires": len(arrays["wires"])},
+    }
+    return arrays, meta
+
+
+def _plain(value):
+    # ID property arrays can't go into json as they are
+    return value.to_list() if hasattr(value, "to_list") else value
+
+
+def to_object(arrays, meta, context, name=None):
+    """ Builds a pattern object from loaded arrays, links it and makes it active """
+    import bpy
+
+    face_offsets = np.asarray(arrays["face_offsets"])
+    face_verts = np.asarray(arrays["face_verts"])
+    wires = np.asarray(arrays["wires"])
+
+    mesh = bpy.data.meshes.new(name or meta.get("name", "Pattern"))
+    mesh.vertices.add(len(arrays["positions"]))
+    mesh.vertices.foreach_set("co", np.asarray(arrays["positions"], dtype=np.float32).ravel())
+    mesh.loops.add(len(face_verts))
+    mesh.loops.foreach_set("vertex_index", face_verts)
+    mesh.polygons.add(len(face_offsets) - 1)
+    mesh.polygons.foreach_set("loop_start", face_offsets[:-1])
+    if bpy.app.version < (4, 0, 0):
+        # derived from the loop starts since 4.0
+        mesh.polygons.foreach_set("loop_total", np.diff(face_offsets))
+
+    # sewing edges first, the face edges are added by calc_edges
+    mesh.edges.add(len(wires))
+    mesh.edges.foreach_set("vertices", wires.ravel())
+    mesh.update(calc_edges=True)
+
+    edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edges)
+    edges = edges.reshape(-1, 2)
+    edge_index = {(min(a, b), max(a, b)): i for i, (a, b) in enumerate(edges.tolist())}
+
+    seams = np.zeros(len(mesh.edges), dtype=bool)
+    for (a, b), seam in zip(wires.tolist(), np.asarray(arrays["wire_seams"]).tolist()):
+        seams[edge_index[(min(a, b), max(a, b))]] = seam
+    mesh.edges.foreach_set("use_seam", seams)
+
+    uv_layer = mesh.uv_layers.new()
+    uv_layer.data.foreach_set("uv", np.asarray(arrays["uvs"], dtype=np.float32).ravel())
+
+    if "grain" in arrays:
+        attribute = mesh.attributes.new("material_direction", 'FLOAT_VECTOR', 'FACE')
+        attribute.data.foreach_set("vector", np.asarray(arrays["grain"], dtype=np.float32).ravel())
+    if "grain_angles" in arrays:
+        attribute = mesh.attributes.new("S2S_grain_angle", 'FLOAT', 'FACE')
+        attribute.data.foreach_set("value", np.asarray(arrays["grain_angles"], dtype=np.float32))
+    if "allowance_edges" in arrays:
+        allowances = np.zeros(len(mesh.edges), dtype=np.float32)
+        for (a, b), value in zip(np.asarray(arrays["allowance_edges"]).tolist(), np.asarray(arrays["allowance_values"]).tolist()):
+            allowances[edge_index[(min(a, b), max(a, b))]] = value
+        attribute = mesh.attributes.new("seam_allowance", 'FLOAT', 'EDGE')
+        attribute.data.foreach_set("value", allowances)
+
+    mesh.validate()
+    mesh.update()
+
+    obj = bpy.data.objects.new(mesh.name, mesh)
+    for key, value in meta.get("properties", {}).items():
+        obj[key] = value
+    context.collection.objects.link(obj)
+    for other in context.selected_objects:
+        other.select_set(False)
+    obj.select_set(True)
+    context.view_layer.objects.active = obj
+    return obj
+
+
+def save_object(obj, path):
+    arrays, meta = from_object(obj)
+    save(path, arrays, meta)
+
+
+def load_object(path, context, name=None):
+    arrays, meta = load(path)
+    return to_object(arrays, meta, context, name)
@@ -0,0 +1,264 @@
+"""Fabric nesting for exported sewing patterns.
+
+Pieces are packed onto a strip of fabric with a fixed width and unbounded
+length, using the convex hull of every piece:
+
+1. No-fit polygons (NFP) between the hulls of placed pieces and the piece
+   being placed give all touching positions, the bottom-left most free one
+   wins. Since hulls are convex, every NFP is a Minkowski sum that can be
+   computed for all placed pieces at once with array operations.
+2. Once the time budget is spent, the remaining pieces are placed on
+   bounding box shelves below the nested part, which is instant.
+
+Coordinates are document millimeters with y pointing down, so "bottom-left"
+means the smallest y (the least fabric length) and then the smallest x.
+"""
+
+import math
+import time
+
+import numpy as np
+
+EPSILON = 1e-6
+
+
+def convex_hull(points):
+    """ Monotone chain convex hull, returns the hull with a positive signed area """
+    pts = sorted(set((float(x), float(y)) for x, y in points))
+    if len(pts) <= 2:
+        return pts
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower = []
+    for p in pts:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    upper = []
+    for p in reversed(pts):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return lower[:-1] + upper[:-1]
+
+
+def _lowest(points):
+    """ Index of the point with the smallest y, then the smallest x """
+    return int(np.lexsort((points[:, 0], points[:, 1]))[0])
+
+
+def _edge_angles(edges):
+    angles = np.arctan2(edges[..., 1], edges[..., 0])
+    return np.where(angles < 0.0, angles + 2.0 * math.pi, angles)
+
+
+def minkowski_sums(starts, edges, polygon):
+    """ Minkowski sums of many convex polygons with one convex polygon.
+
+    The polygons are given as their lowest point and their edges, starting
+    at that point, padded with zero length edges. Since both are convex, the
+    sum is found by merging all edges by angle, which is done for all
+    polygons at once. Returns the same start/edges representation.
+    """
+    polygon = np.asarray(polygon, dtype=float)
+    lowest = _lowest(polygon)
+    polygon = np.roll(polygon, -lowest, axis=0)
+    polygon_edges = np.roll(polygon, -1, axis=0) - polygon
+
+    count = len(starts)
+    merged = np.concatenate((edges, np.broadcast_to(polygon_edges, (count,) + polygon_edges.shape)), axis=1)
+    order = np.argsort(_edge_angles(merged), axis=1, kind='stable')
+    merged = np.take_along_axis(merged, order[..., None], axis=1)
+    return starts + polygon[0], merged
+
+
+def _to_edges(polygon, size):
+    polygon = np.asarray(polygon, dtype=float)
+    polygon = np.roll(polygon, -_lowest(polygon), axis=0)
+    edges = np.zeros((size, 2))
+    edges[:len(polygon)] = np.roll(polygon, -1, axis=0) - polygon
+    return polygon[0], edges
+
+
+def _rotate(points, angle):
+    c = math.cos(angle)
+    s = math.sin(angle)
+    return [(x * c - y * s, x * s + y * c) for x, y in points]
+
+
+def _octagon(radius):
+    return [(radius * math.cos(a * math.pi / 4.0), radius * math.sin(a * math.pi / 4.0)) for a in range(8)]
+
+
+class _Orientation:
+    """ One allowed rotation of a piece, with its hull moved to the origin """
+    def __init__(self, hull, angle):
+        rotated = _rotate(hull, angle)
+        min_x = min(p[0] for p in rotated)
+        min_y = min(p[1] for p in rotated)
+        self.angle = angle
+        self.offset = (min_x, min_y)
+        self.hull = [(x - min_x, y - min_y) for x, y in rotated]
+        self.width = max(p[0] for p in self.hull)
+        self.height = max(p[1] for p in self.hull)
+        self.negated = [(-x, -y) for x, y in self.hull]
+
+
+class _NoFitPolygons:
+    """ NFPs of all placed pieces against the piece being placed """
+    def __init__(self, starts, edges):
+        # vertices[:, i] is the start of edges[:, i]
+        self.vertices = starts[:, None, :] + np.cumsum(edges, axis=1) - edges
+        self.edges = edges
+        self.solid = np.einsum('kij,kij->ki', edges, edges) > 0.0
+        self.bounds = np.concatenate((self.vertices.min(axis=1), self.vertices.max(axis=1)), axis=1)
+
+    def candidates(self, max_x, floor):
+        """ Touching positions: NFP vertices and where NFP edges cross the sides of the fabric """
+        points = [self.vertices[self.solid], np.array([[0.0, floor], [max_x, floor]])]
+        a = self.vertices[self.solid]
+        b = a + self.edges[self.solid]
+        for x in (0.0, max_x):
+            crossing = (a[:, 0] - x) * (b[:, 0] - x) < 0.0
+            t = (x - a[crossing, 0]) / (b[crossing, 0] - a[crossing, 0])
+            y = a[crossing, 1] + t * (b[crossing, 1] - a[crossing, 1])
+            points.append(np.stack((np.full_like(y, x), y), axis=1))
+        # always free, no matter what has been placed
+        points.append(np.array([[0.0, max(floor, self.bounds[:, 3].max())]]))
+        candidates = np.concatenate(points)
+        candidates[:, 0] = np.clip(candidates[:, 0], 0.0, max_x)
+        candidates = candidates[candidates[:, 1] >= floor - EPSILON]
+        # least fabric used, then the most to the left
+        return candidates[np.lexsort((candidates[:, 0], candidates[:, 1]))]
+
+    def strictly_inside_any(self, c):
+        in_bounds = (
+            (c[:, None, 0] > self.bounds[None, :, 0] + EPSILON)
+            & (c[:, None, 1] > self.bounds[None, :, 1] + EPSILON)
+            & (c[:, None, 0] < self.bounds[None, :, 2] - EPSILON)
+            & (c[:, None, 1] < self.bounds[None, :, 3] - EPSILON)
+        )
+        inside = np.zeros(len(c), dtype=bool)
+        n, k = np.nonzero(in_bounds)
+        if len(n) == 0:
+            return inside
+        relative = c[n][:, None, :] - self.vertices[k]
+        d = self.edges[k]
+        cross = d[..., 0] * relative[..., 1] - d[..., 1] * relative[..., 0]
+        # padding edges have no length and don't constrain anything
+        cross = np.where(self.solid[k], cross, np.inf)
+        hit = np.all(cross > EPSILON, axis=1)
+        inside[n[hit]] = True
+        return inside
+
+    def first_free(self, candidates, chunk=256):
+        """ Index of the first candidate that isn't inside any NFP, candidates should be sorted """
+        for first in range(0, len(candidates), chunk):
+            inside = self.strictly_inside_any(candidates[first:first + chunk])
+            free = np.flatnonzero(~inside)
+            if len(free):
+                return first + free[0]
+        return None
+
+
+def nest(outlines, fabric_width, rotations, spacing=0.0, time_budget=5.0):
+    """ Packs outlines onto a strip of fabric.
+
+    outlines: the outer outline of every piece, as lists of (x, y)
+    rotations: for every piece, the allowed rotation angles in radians
+
+    Returns a (angle, dx, dy) transform for every piece, the rotation is
+    applied around the origin before translating, the fabric length that
+    was used and the pieces that are wider than the fabric in every allowed
+    rotation, which stick out on the right.
+    """
+    started = time.perf_counter()
+    hulls = [convex_hull(outline) for outline in outlines]
+    pieces = []
+    for hull, angles in zip(hulls, rotations):
+        pieces.append([_Orientation(hull, angle) for angle in (angles or [0.0])])
+
+    def area(hull):
+        return abs(sum(hull[i][0] * hull[i - 1][1] - hull[i - 1][0] * hull[i][1] for i in range(len(hull)))) / 2.0
+
+    order = sorted(range(len(pieces)), key=lambda i: -area(hulls[i]) if len(hulls[i]) > 2 else 0.0)
+
+    # Pieces that end more than this above the current fabric length are
+    # buried and ignored, that keeps every placement proportional to the
+    # pieces around the nesting front instead of everything placed so far.
+    horizon = max((o.height for orientations in pieces for o in orientations), default=0.0) + spacing
+
+    # placed hulls grown by the spacing, as lowest point + padded edges
+    brush = _octagon(spacing) if spacing > 0.0 else [(0.0, 0.0)]
+    edge_count = max((len(h) for h in hulls), default=0) + len(brush)
+    placed_starts = np.zeros((len(pieces), 2))
+    placed_edges = np.zeros((len(pieces), edge_count, 2))
+    placed_bottoms = np.zeros(len(pieces))
+    placed_count = 0
+
+    transforms = [None] * len(pieces)
+    length = 0.0
+
+    def place(index, orientation, x, y):
+        nonlocal length, placed_count
+        transforms[index] = (orientation.angle, x - orientation.offset[0], y - orientation.offset[1])
+        length = max(length, y + orientation.height)
+        if len(orientation.hull) < 3:
+            return
+        start, edges = _to_edges([(px + x, py + y) for px, py in orientation.hull], edge_count - len(brush))
+        if len(brush) > 1:
+            start, edges = minkowski_sums(start[None], edges[None], brush)
+            start, edges = start[0], edges[0]
+        else:
+            edges = np.concatenate((edges, np.zeros((1, 2))))
+        placed_starts[placed_count] = start
+        placed_edges[placed_count] = edges
+        placed_bottoms[placed_count] = y + orientation.height + spacing
+        placed_count += 1
+
+    remaining = list(order)
+    while remaining and time.perf_counter() - started < time_budget:
+        index = remaining.pop(0)
+        best = None
+        floor = max(0.0, length - horizon)
+        active = np.flatnonzero(placed_bottoms[:placed_count] > floor)
+        for orientation in pieces[index]:
+            if len(orientation.hull) < 3:
+                continue
+            max_x = max(0.0, fabric_width - orientation.width)
+            if len(active) == 0:
+                position = (0.0, floor)
+            else:
+                nfps = _NoFitPolygons(*minkowski_sums(placed_starts[active], placed_edges[active], orientation.negated))
+                candidates = nfps.candidates(max_x, floor)
+                pick = nfps.first_free(candidates)
+                if pick is None:
+                    continue
+                position = (float(candidates[pick, 0]), float(candidates[pick, 1]))
+            score = (position[1] + orientation.height, position[0])
+            if best is None or score < best[0]:
+                best = (score, orientation, position)
+        if best is None:
+            best = (None, pieces[index][0], (0.0, length + spacing))
+        place(index, best[1], best[2][0], best[2][1])
+
+    # out of time, fill bounding box shelves below what has been nested
+    shelf_x = 0.0
+    # pieces with less than three hull points take up length without being in the placed hulls
+    shelf_y = length + spacing if length > 0.0 else 0.0
+    shelf_height = 0.0
+    for index in remaining:
+        orientation = min(pieces[index], key=lambda o: o.height)
+        if shelf_x > 0.0 and shelf_x + orientation.width > fabric_width:
+            shelf_y += shelf_height + spacing
+            shelf_x = 0.0
+            shelf_height = 0.0
+        transforms[index] = (orientation.angle, shelf_x - orientation.offset[0], shelf_y - orientation.offset[1])
+        length = max(length, shelf_y + orientation.height)
+        shelf_x += orientation.width + spacing
+        shelf_height = max(shelf_height, orientation.height)
+
+    oversize = [i for i, orientations in enumerate(pieces) if min(o.width for o in orientations) > fabric_width]
+    return transforms, length, oversize
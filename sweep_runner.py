@@ -0,0 +1,148 @@
+"""Parallel sweep over cloth settings.
+
+Bakes every variant of a pattern with bake_runner.py, each in its own
+Blender process, and ranks them by how well the garment kept its volume,
+how far the sewing edges closed, and how long the bake took:
+
+    python sweep_runner.py garment.blend sweep.json --out /bakes/sweep --jobs 8
+
+sweep.json holds either a list of variants, or a grid that is expanded into
+every combination:
+
+    {"grid": {"pressure_style": ["MEDIUM", "HIGH"], "settings.air_damping": [1, 5, 10]}}
+
+Keys starting with "settings." are cloth settings set after Quick Clothsim,
+all other keys are Quick Clothsim options. This script doesn't need Blender
+itself, only the path to it (--blender, or the BLENDER environment variable).
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BAKE_RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bake_runner.py")
+SETTINGS_PREFIX = "settings."
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Bakes cloth setting variants of a sewing pattern in parallel and ranks them.")
+    parser.add_argument("blend", help="the .blend file with the unfolded pattern")
+    parser.add_argument("sweep", help="JSON file with the variants or grid to bake")
+    parser.add_argument("--out", required=True, help="directory for the caches and reports of all variants")
+    parser.add_argument("--object", help="name of the pattern object, the active object if left out")
+    parser.add_argument("--frame-start", type=int, default=1)
+    parser.add_argument("--frame-end", type=int, default=100)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="number of Blender processes at once")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"), help="Blender executable")
+    parser.add_argument("--addon", help="module name of the add-on, passed on to bake_runner.py")
+    return parser.parse_args(argv)
+
+
+def load_variants(path):
+    with open(path) as file:
+        sweep = json.load(file)
+    if isinstance(sweep, list):
+        return sweep
+    if "variants" in sweep:
+        return sweep["variants"]
+    names = list(sweep["grid"])
+    return [dict(zip(names, values)) for values in itertools.product(*(sweep["grid"][name] for name in names))]
+
+
+def split_variant(variant):
+    """ Splits a variant into Quick Clothsim options and cloth settings """
+    clothsim = dict()
+    settings = dict()
+    for name, value in variant.items():
+        if name.startswith(SETTINGS_PREFIX):
+            settings[name[len(SETTINGS_PREFIX):]] = value
+        else:
+            clothsim[name] = value
+    return clothsim, settings
+
+
+def variant_name(args, variant):
+    """ A directory name that only the same variant of the same bake gets, so re-running a sweep reuses it and nothing else """
+    key = json.dumps([os.path.abspath(args.blend), args.object, args.frame_start, args.frame_end, variant], sort_keys=True)
+    return "variant_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def bake_variant(args, index, variant):
+    cache_dir = os.path.join(args.out, variant_name(args, variant))
+    report_path = os.path.join(cache_dir, "report.json")
+    clothsim, settings = split_variant(variant)
+
+    command = [
+        args.blender, "-b", args.blend, "-P", BAKE_RUNNER, "--",
+        "--cache-dir", cache_dir,
+        "--frame-start", str(args.frame_start),
+        "--frame-end", str(args.frame_end),
+        "--clothsim", json.dumps(clothsim),
+        "--cloth-settings", json.dumps(settings),
+    ]
+    if args.object:
+        command += ["--object", args.object]
+    if args.addon:
+        command += ["--addon", args.addon]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    started = time.perf_counter()
+    with open(os.path.join(cache_dir, "blender.log"), "w") as log:
+        process = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT)
+
+    result = {"index": index, "variant": variant, "cache_dir": cache_dir, "returncode": process.returncode, "wall_seconds": time.perf_counter() - started}
+    if process.returncode == 0 and os.path.exists(report_path):
+        with open(report_path) as file:
+            report = json.load(file)
+        result["metrics"] = report.get("metrics", {})
+        result["bake_seconds"] = report.get("total_seconds")
+    return result
+
+
+def score(result):
+    """ Lower is better: how far the volume is off plus how much of the sewing gap is left open """
+    metrics = result.get("metrics")
+    if not metrics:
+        return float("inf")
+    return abs(metrics.get("volume_ratio", 1.0) - 1.0) + (1.0 - metrics.get("gap_closure", 1.0))
+
+
+def rank(results):
+    # bake time only breaks ties between equally good variants
+    return sorted(results, key=lambda r: (round(score(r), 3), r.get("bake_seconds") or float("inf")))
+
+
+def main():
+    args = parse_arguments(sys.argv[1:])
+    variants = load_variants(args.sweep)
+    os.makedirs(args.out, exist_ok=True)
+    print("Baking %d variants with %d jobs" % (len(variants), args.jobs))
+
+    # the work happens in the Blender processes, threads only wait on them
+    with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+        results = list(pool.map(lambda item: bake_variant(args, *item), enumerate(variants)))
+
+    ranking = rank(results)
+    with open(os.path.join(args.out, "ranking.json"), "w") as file:
+        json.dump([dict(r, score=score(r)) for r in ranking], file, indent=1)
+
+    for place, result in enumerate(ranking, 1):
+        metrics = result.get("metrics") or {}
+        if result["returncode"] != 0:
+            print("%3d. variant %03d failed, see %s" % (place, result["index"], os.path.join(result["cache_dir"], "blender.log")))
+            continue
+        print("%3d. variant %03d  score %.3f  volume %.3f  gap closed %.3f  bake %.1f s  %s" % (
+            place, result["index"], score(result),
+            metrics.get("volume_ratio", float("nan")), metrics.get("gap_closure", float("nan")),
+            result.get("bake_seconds") or 0.0, json.dumps(result["variant"]),
+        ))
+
+
+if __name__ == "__main__":
+    main()
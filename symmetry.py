@@ -0,0 +1,265 @@
+"""Mirror symmetric garments, unfolded one side at a time.
+
+detect() finds the pieces (islands cut by the seams) that are mirror images
+of each other across a plane through the middle of the mesh, along one of
+the object's local axes. Vertices are matched with a spatial hash of their
+positions, and a pair of pieces only counts when their faces and seams
+mirror each other exactly. Pieces that cross the plane (like a center back
+panel) and pieces without a partner are unfolded as usual.
+
+keep_one_side() deletes the pieces on the negative side, and clears the
+seams they leave behind as open edges on their neighbours. It also stores
+the position every vertex had on the garment (S2S_rest) and which faces
+belong to a mirrored pair (S2S_mirror); the unfold carries both along while
+it cuts, subdivides and remeshes. add_mirrored() then adds the reflection
+of the finished pieces and their sewing edges, and sews the copies to the
+pieces on the plane and to each other, using those rest positions. The
+copies' UVs are reflected too and moved next to the pattern in UV space, so
+they don't end up on top of the pieces they were copied from, and the whole
+layout is scaled back into 0..1.
+"""
+
+import bmesh
+import numpy as np
+from mathutils import Vector
+from mathutils.kdtree import KDTree
+
+from . import flattenability
+
+AXES = ('X', 'Y', 'Z')
+REST_LAYER = "S2S_rest"
+MIRROR_LAYER = "S2S_mirror"
+
+# vertices closer than this (relative to the size of the mesh) are the same
+TOLERANCE = 1e-4
+
+# between the pattern and the mirrored copies in UV space, like pack_islands' margin
+UV_MARGIN = 0.02
+
+
+class Mirror:
+    """ The mirror plane of a mesh and the faces on its negative side that mirror others """
+    def __init__(self, axis, offset, tolerance, keep_faces, delete_faces, pairs):
+        self.axis = axis
+        self.offset = offset
+        self.tolerance = tolerance
+        self.keep_faces = keep_faces
+        self.delete_faces = delete_faces
+        self.pairs = pairs
+        # of the whole mesh, set by keep_one_side
+        self.volume = None
+
+    def reflect(self, positions):
+        positions = np.array(positions, dtype=np.float64)
+        positions[..., self.axis] = 2 * self.offset - positions[..., self.axis]
+        return positions
+
+
+def supported():
+    # needs generic attributes, which the unfold keeps up to date, in bmesh
+    return hasattr(bmesh.types.BMLayerAccessVert, "float_vector")
+
+
+def vertex_mirror(positions, axis, offset, tolerance):
+    """ For every vertex, the vertex at its reflection, or -1 """
+    mirrored = positions.copy()
+    mirrored[:, axis] = 2 * offset - mirrored[:, axis]
+    keys = np.round(np.concatenate((positions, mirrored)) / tolerance).astype(np.int64)
+    _, cells = np.unique(keys, axis=0, return_inverse=True)
+    cells = cells.ravel()
+    n = len(positions)
+    owner = np.full(cells.max(initial=-1) + 1, -1)
+    owner[cells[:n]] = np.arange(n)
+    mirror = owner[cells[n:]]
+    close = np.linalg.norm(positions[np.maximum(mirror, 0)] - mirrored, axis=1) < tolerance
+    return np.where((mirror >= 0) & close, mirror, -1)
+
+
+def detect(mesh, axis='AUTO'):
+    """ Finds the mirrored pieces of a mesh in object mode. Returns a Mirror, or None without any pairs """
+    arrays = flattenability.mesh_arrays(mesh)
+    positions = arrays["positions"]
+    if len(positions) == 0:
+        return None
+    low = positions.min(axis=0)
+    high = positions.max(axis=0)
+    tolerance = max(np.linalg.norm(high - low), 1e-9) * TOLERANCE
+    face_offsets = arrays["face_offsets"]
+    face_verts = arrays["face_verts"]
+    edge_verts = arrays["edge_verts"]
+    seams = arrays["seams"]
+    analysis = flattenability.Analysis(**arrays)
+
+    faces = [tuple(sorted(face_verts[face_offsets[f]:face_offsets[f + 1]].tolist())) for f in range(len(face_offsets) - 1)]
+    face_index = {key: f for f, key in enumerate(faces)}
+    edge_index = {(min(a, b), max(a, b)): e for e, (a, b) in enumerate(edge_verts.tolist())}
+
+    best = None
+    for candidate in (AXES.index(axis),) if axis in AXES else range(3):
+        offset = (low[candidate] + high[candidate]) / 2
+        mirror = vertex_mirror(positions, candidate, offset, tolerance)
+
+        # the mirror of every face and whether every edge's seam mirrors too
+        face_mirror = np.array([
+            face_index.get(tuple(sorted(mirror[list(key)].tolist())), -1) if min(mirror[list(key)]) >= 0 else -1
+            for key in faces
+        ], dtype=np.int64)
+        edge_mirror = np.array([
+            edge_index.get((min(mirror[a], mirror[b]), max(mirror[a], mirror[b])), -1) if mirror[a] >= 0 and mirror[b] >= 0 else -1
+            for a, b in edge_verts.tolist()
+        ], dtype=np.int64)
+        bad_edge = (edge_mirror < 0) | (seams != seams[np.maximum(edge_mirror, 0)])
+
+        islands = analysis.face_islands
+        bad = np.zeros(analysis.island_count, dtype=bool)
+        bad[islands[face_mirror < 0]] = True
+        loop_island = np.repeat(islands, np.diff(face_offsets))
+        bad[loop_island[bad_edge[arrays["loop_edges"]]]] = True
+        partner = np.full(analysis.island_count, -1)
+        partner[islands] = islands[np.maximum(face_mirror, 0)]
+        # all faces of an island have to land in the same island
+        bad[islands[partner[islands] != islands[np.maximum(face_mirror, 0)]]] = True
+        pairs = [(i, int(partner[i])) for i in range(analysis.island_count)
+                 if not bad[i] and not bad[partner[i]] and partner[i] != i and partner[partner[i]] == i
+                 and analysis.faces[i] == analysis.faces[partner[i]]]
+        if best is None or len(pairs) > len(best[2]):
+            best = (candidate, offset, pairs)
+
+    candidate, offset, pairs = best
+    if not pairs:
+        return None
+    # keep the side of every pair that's on the positive side of the plane
+    centers = np.zeros((analysis.island_count, 3))
+    np.add.at(centers, np.repeat(analysis.face_islands, np.diff(face_offsets)), positions[face_verts])
+    keep = set()
+    delete = set()
+    for i, j in pairs:
+        if centers[i, candidate] / analysis.faces[i] < centers[j, candidate] / analysis.faces[j]:
+            i, j = j, i
+        keep.add(i)
+        delete.add(j)
+    keep_faces = np.isin(analysis.face_islands, list(keep))
+    delete_faces = np.isin(analysis.face_islands, list(delete))
+    return Mirror(candidate, offset, tolerance, keep_faces, delete_faces, len(keep))
+
+
+def keep_one_side(mesh, mirror):
+    """ Deletes the mirrored pieces on the negative side, after storing rest positions and mirror flags """
+    positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", positions)
+    for name in (REST_LAYER, MIRROR_LAYER):
+        if name in mesh.attributes:
+            mesh.attributes.remove(mesh.attributes[name])
+    mesh.attributes.new(REST_LAYER, 'FLOAT_VECTOR', 'POINT').data.foreach_set("vector", positions)
+    mesh.attributes.new(MIRROR_LAYER, 'INT', 'FACE').data.foreach_set("value", mirror.keep_faces.astype(np.int32))
+
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    mirror.volume = bm.calc_volume()
+    bm.faces.ensure_lookup_table()
+    deleted = [bm.faces[f] for f in np.flatnonzero(mirror.delete_faces).tolist()]
+    edges = {e for f in deleted for e in f.edges}
+    bmesh.ops.delete(bm, geom=deleted, context='FACES')
+    # the seams to the deleted pieces are open edges now, nothing is sewn there
+    for e in edges:
+        if e.is_valid and e.is_boundary:
+            e.seam = False
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.update()
+
+
+def reflect_attributes(bm, kept_faces, new_faces, axis):
+    """ Reflects the UVs and grain of the mirrored copies, and moves their UVs to the right of the pattern.
+
+    Returns how much bigger a UV unit got when the layout was scaled back into 0..1.
+    """
+    uv_scale = 1.0
+    uv_layer = bm.loops.layers.uv.active
+    if uv_layer is not None and kept_faces:
+        right = max(l[uv_layer].uv.x for f in bm.faces for l in f.loops)
+        # the right edge of the kept pieces lands UV_MARGIN right of the pattern
+        shift = right + UV_MARGIN + max(l[uv_layer].uv.x for f in kept_faces for l in f.loops)
+        for f in new_faces:
+            for l in f.loops:
+                l[uv_layer].uv.x = shift - l[uv_layer].uv.x
+        # the exporter only shows UVs in 0..1 without nesting
+        uv_scale = max(1.0, max(max(l[uv_layer].uv) for f in bm.faces for l in f.loops))
+        for f in bm.faces:
+            for l in f.loops:
+                l[uv_layer].uv = l[uv_layer].uv / uv_scale
+    grain_layer = bm.faces.layers.float_vector.get("material_direction")
+    if grain_layer is not None:
+        for f in new_faces:
+            grain = f[grain_layer]
+            grain[axis] = -grain[axis]
+            f[grain_layer] = grain
+    # reflecting the UVs turns the grain by the same reflection, an angle
+    # (as a line, modulo 180°) becomes its negation
+    angle_layer = bm.faces.layers.float.get("S2S_grain_angle")
+    if angle_layer is not None:
+        for f in new_faces:
+            f[angle_layer] = -f[angle_layer]
+    return uv_scale
+
+
+def add_mirrored(mesh, mirror):
+    """ Adds the reflection of the kept pieces to the unfolded pattern, with their sewing edges, and removes the layers.
+
+    Returns the number of sewing edges added and the factor the UV to world scale has to grow by.
+    """
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    rest_layer = bm.verts.layers.float_vector.get(REST_LAYER)
+    mirror_layer = bm.faces.layers.int.get(MIRROR_LAYER)
+    if rest_layer is None or mirror_layer is None:
+        bm.free()
+        return 0, 1.0
+
+    kept_faces = [f for f in bm.faces if f[mirror_layer]]
+    kept_verts = {v for f in kept_faces for v in f.verts}
+    kept_wires = [e for e in bm.edges if e.is_wire and e.verts[0] in kept_verts and e.verts[1] in kept_verts]
+    # pieces that cross the plane, their mirrored sewing edges end on themselves
+    other_verts = [v for v in bm.verts if v not in kept_verts and not v.is_wire]
+    tree = KDTree(len(other_verts))
+    for i, v in enumerate(other_verts):
+        tree.insert(v[rest_layer], i)
+    tree.balance()
+    outside_wires = [e for e in bm.edges if e.is_wire and (e.verts[0] in kept_verts) != (e.verts[1] in kept_verts)]
+    on_plane = [v for v in kept_verts if v.is_boundary and abs(v[rest_layer][mirror.axis] - mirror.offset) < mirror.tolerance * 10]
+
+    duplicate = bmesh.ops.duplicate(bm, geom=kept_faces + kept_wires)
+    # the map goes both ways, from the originals to the copies and back
+    copies = duplicate["vert_map"]
+    new_faces = [f for f in duplicate["geom"] if isinstance(f, bmesh.types.BMFace)]
+    for original in kept_verts:
+        copy = copies[original]
+        copy.co = Vector(mirror.reflect(original.co))
+        copy[rest_layer] = Vector(mirror.reflect(original[rest_layer]))
+    uv_scale = reflect_attributes(bm, kept_faces, new_faces, mirror.axis)
+    # reflecting turns the faces inside out
+    bmesh.ops.reverse_faces(bm, faces=new_faces)
+
+    wires = 0
+    for wire in outside_wires:
+        inside, outside = wire.verts if wire.verts[0] in kept_verts else reversed(wire.verts)
+        location, index, distance = tree.find(Vector(mirror.reflect(outside[rest_layer])))
+        if index is None or distance > mirror.tolerance * 100:
+            continue
+        target = other_verts[index]
+        if bm.edges.get((copies[inside], target)) is None:
+            bm.edges.new((copies[inside], target)).seam = wire.seam
+            wires += 1
+    # the seam on the plane between a piece and its reflection
+    for v in on_plane:
+        if bm.edges.get((v, copies[v])) is None:
+            bm.edges.new((v, copies[v]))
+            wires += 1
+
+    bm.to_mesh(mesh)
+    bm.free()
+    for name in (REST_LAYER, MIRROR_LAYER):
+        if name in mesh.attributes:
+            mesh.attributes.remove(mesh.attributes[name])
+    mesh.update()
+    return wires, uv_scale
@@ -0,0 +1,232 @@
+"""Lightweight tracing for the add-on's operators.
+
+Operators wrap their stages in spans:
+
+    with tracing.span("island_detection") as span:
+        ...
+        span.count(islands=len(face_groups))
+
+Spans nest, and once the outermost span of an operator ends, the whole tree
+is written to the trace directory in two forms:
+- a Chrome trace (chrome://tracing, Perfetto) per operator run
+- one line per span appended to s2s-trace.jsonl, for aggregating across runs
+
+Tracing is off unless the S2S_TRACE environment variable names a directory,
+or it is switched on in the add-on preferences. S2S_TRACE_MEMORY=1 (or the
+preference) also records the tracemalloc peak of every span, which slows
+everything down considerably. While off, a span costs one function call.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+ENV_DIRECTORY = "S2S_TRACE"
+ENV_MEMORY = "S2S_TRACE_MEMORY"
+JSONL_FILE = "s2s-trace.jsonl"
+
+_preferences = {"enabled": False, "directory": "", "memory": False}
+_stack = []
+
+
+def configure(enabled, directory="", memory=False):
+    """ Called by the add-on preferences, the environment variables take precedence """
+    _preferences["enabled"] = enabled
+    _preferences["directory"] = directory
+    _preferences["memory"] = memory
+
+
+def directory():
+    """ Where traces go, None when tracing is off """
+    path = os.environ.get(ENV_DIRECTORY)
+    if path:
+        return path
+    if _preferences["enabled"]:
+        return _preferences["directory"] or tempfile.gettempdir()
+    return None
+
+
+def trace_memory():
+    return tracemalloc is not None and (os.environ.get(ENV_MEMORY, "") not in ("", "0") or _preferences["memory"])
+
+
+class _NoSpan:
+    """ Stands in for a span while tracing is off """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, **counts):
+        pass
+
+    def suspend(self):
+        pass
+
+    def resume(self):
+        pass
+
+    def end(self):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Span:
+    def __init__(self, name, counts):
+        self.name = name
+        self.counts = dict(counts)
+        self.children = []
+        self.parent = _stack[-1] if _stack else None
+        self.peak = 0
+        self.memory = trace_memory() if self.parent is None else self.parent.memory
+        self.error = None
+        if self.parent is not None:
+            self.parent.children.append(self)
+        else:
+            self.directory = directory()
+            self.started_memory_tracing = False
+            if self.memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_memory_tracing = True
+        if self.memory:
+            self._take_peak()
+        _stack.append(self)
+        self.start = time.perf_counter()
+        self.duration = None
+        self.suspended = []
+
+    def _take_peak(self):
+        # tracemalloc has one peak for everything, so it's handed up to the
+        # enclosing span and reset whenever a span starts or ends
+        current, peak = tracemalloc.get_traced_memory()
+        if _stack:
+            _stack[-1].peak = max(_stack[-1].peak, peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    def count(self, **counts):
+        """ Records element counts (faces, islands, ...) on this span """
+        self.counts.update(counts)
+
+    def suspend(self):
+        """ Takes this span and the ones open inside it off the stack, while a modal operator waits for events.
+
+        Spans started in between don't end up inside it, resume() puts them back.
+        """
+        if self in _stack:
+            index = _stack.index(self)
+            self.suspended = _stack[index:]
+            del _stack[index:]
+
+    def resume(self):
+        _stack.extend(self.suspended)
+        self.suspended = []
+
+    def end(self):
+        if self.duration is not None:
+            return
+        self.resume()
+        # close spans that were left open inside this one, for example by an early return
+        while _stack and _stack[-1] is not self:
+            _stack[-1].end()
+        self.duration = time.perf_counter() - self.start
+        if self.memory:
+            self._take_peak()
+        _stack.pop()
+        if self.parent is not None:
+            self.parent.peak = max(self.parent.peak, self.peak)
+            return
+        if self.memory and self.started_memory_tracing:
+            tracemalloc.stop()
+        _write(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self.end()
+        return False
+
+
+def span(name, **counts):
+    """ Starts a span, use it with `with` or call end() on it """
+    if not _stack and directory() is None:
+        return _NO_SPAN
+    return Span(name, counts)
+
+
+def _walk(root, depth=0, path=""):
+    path = path + "/" + root.name if path else root.name
+    yield root, depth, path
+    for child in root.children:
+        yield from _walk(child, depth + 1, path)
+
+
+def _write(root):
+    os.makedirs(root.directory, exist_ok=True)
+    pid = os.getpid()
+    wall_start = time.time() - (time.perf_counter() - root.start)
+    run = "%s-%d-%d" % (root.name, int(wall_start * 1000), pid)
+
+    events = []
+    lines = []
+    for s, depth, path in _walk(root):
+        args = dict(s.counts)
+        if s.memory:
+            args["peak_bytes"] = s.peak
+        if s.error:
+            args["error"] = s.error
+        events.append({
+            "name": s.name,
+            "ph": "X",
+            "ts": (s.start - root.start + wall_start) * 1e6,
+            "dur": s.duration * 1e6,
+            "pid": pid,
+            "tid": 0,
+            "args": args,
+        })
+        lines.append(json.dumps({
+            "run": run,
+            "span": path,
+            "depth": depth,
+            "start": s.start - root.start,
+            "seconds": s.duration,
+            "counts": s.counts,
+            "peak_bytes": s.peak if s.memory else None,
+            "error": s.error,
+        }))
+
+    with open(os.path.join(root.directory, "s2s-" + run + ".json"), "w") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+    with open(os.path.join(root.directory, JSONL_FILE), "a") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+def read_spans(path, offset=0):
+    """ Seconds per span path of everything appended to a JSON lines trace after offset.
+
+    Returns the seconds and the offset to continue from. Spans that occur
+    more than once (like remesh iterations) are added up.
+    """
+    if not os.path.exists(path):
+        return {}, offset
+    with open(path) as file:
+        file.seek(offset)
+        lines = file.readlines()
+        offset = file.tell()
+    seconds = dict()
+    for line in lines:
+        entry = json.loads(line)
+        seconds[entry["span"]] = seconds.get(entry["span"], 0.0) + entry["seconds"]
+    return seconds, offset
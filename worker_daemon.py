@@ -0,0 +1,294 @@
+"""Warm Blender workers for batches of sewing pattern jobs.
+
+Starting Blender and registering the add-on often takes longer than
+unfolding a small garment. The daemon starts a few Blender processes once and
+hands them jobs for as long as it runs:
+
+    python worker_daemon.py serve --workers 4 --port 8765 --addon seams_to_sewing_pattern
+    python worker_daemon.py submit job.json --port 8765
+
+Clients connect to 127.0.0.1 and send one JSON job per line:
+
+    {"id": "shirt-01", "input": "/garments/shirt.blend", "object": "Shirt",
+     "steps": [{"operator": "object.seams_to_sewingpattern", "params": {"use_remesh": false}},
+               {"operator": "object.export_sewingpattern", "params": {"filepath": "/out/shirt.svg"}}],
+     "save": "/out/shirt_pattern.blend"}
+
+Every job gets an answer line with its status, the seconds it took and the
+time of every operator stage (from tracing.py). Every job starts from a
+fresh scene, a .blend input is opened, while .obj/.ply/.stl files and
+patterns saved by Seams to Sewing Pattern (.npz or a pattern directory) are
+loaded into an empty file. Only the add-on's own operators can be run.
+
+The same file is the worker side, run by the daemon inside Blender:
+
+    blender -b --python worker_daemon.py -- work --addon seams_to_sewing_pattern
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import traceback
+
+# worker results are marked, Blender writes plenty of its own lines to stdout
+RESULT_PREFIX = "S2S-RESULT "
+READY = "ready"
+
+OPERATORS = {
+    "object.seams_to_sewingpattern",
+    "object.export_sewingpattern",
+    "object.quick_clothsim",
+    "remesh.boundary_aligned_remesh",
+    "mesh.clean_up_knife_cut",
+}
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Keeps Blender workers with the add-on loaded and runs sewing pattern jobs on them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the daemon")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="number of Blender processes")
+    serve.add_argument("--blender", default=os.environ.get("BLENDER", "blender"), help="Blender executable")
+    serve.add_argument("--addon", help="module name of the add-on, if it isn't enabled in the preferences")
+
+    submit = commands.add_parser("submit", help="send jobs to a running daemon and print the results")
+    submit.add_argument("jobs", help="JSON file with a job or a list of jobs")
+    submit.add_argument("--port", type=int, default=8765)
+
+    work = commands.add_parser("work", help="worker side, started by the daemon inside Blender")
+    work.add_argument("--addon")
+    return parser.parse_args(argv)
+
+
+# Worker, inside Blender
+
+def load_input(bpy, pattern_io, path):
+    """ Starts a fresh scene with the job's input in it """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".blend":
+        bpy.ops.wm.open_mainfile(filepath=path)
+        return
+    bpy.ops.wm.read_homefile(use_empty=True)
+    if extension == ".npz" or os.path.isdir(path):
+        pattern_io.load_object(path, bpy.context)
+        return
+    # the importers moved to wm in Blender 3.x/4.x
+    importers = {
+        ".obj": ("wm.obj_import", "import_scene.obj"),
+        ".ply": ("wm.ply_import", "import_mesh.ply"),
+        ".stl": ("wm.stl_import", "import_mesh.stl"),
+    }
+    for name in importers.get(extension, ()):
+        module, operator = name.split(".")
+        if hasattr(getattr(bpy.ops, module), operator):
+            getattr(getattr(bpy.ops, module), operator)(filepath=path)
+            return
+    raise ValueError("Can't load " + path)
+
+
+def run_job(bpy, tracing, pattern_io, job, trace_path, offset):
+    load_input(bpy, pattern_io, job["input"])
+    if not hasattr(bpy.types, "OBJECT_OT_seams_to_sewingpattern"):
+        raise RuntimeError("the add-on got unregistered by loading " + job["input"])
+
+    name = job.get("object")
+    obj = bpy.data.objects[name] if name else next(o for o in bpy.context.scene.objects if o.type == 'MESH')
+    for other in bpy.context.selected_objects:
+        other.select_set(False)
+    obj.select_set(True)
+    bpy.context.view_layer.objects.active = obj
+
+    steps = []
+    for step in job.get("steps", []):
+        if step["operator"] not in OPERATORS:
+            raise ValueError("Operator not allowed: " + step["operator"])
+        module, operator = step["operator"].split(".")
+        started = time.perf_counter()
+        result = getattr(getattr(bpy.ops, module), operator)(**step.get("params", {}))
+        stages, offset = tracing.read_spans(trace_path, offset)
+        steps.append({"operator": step["operator"], "result": sorted(result), "seconds": time.perf_counter() - started, "stages": stages})
+
+    if job.get("save"):
+        bpy.ops.wm.save_as_mainfile(filepath=job["save"])
+    return steps, offset
+
+
+def work(args):
+    import importlib
+    import bpy
+
+    if args.addon:
+        import addon_utils
+        addon_utils.enable(args.addon, default_set=False)
+    package = args.addon or bpy.types.OBJECT_OT_seams_to_sewingpattern.__module__.rpartition(".")[0]
+    tracing = importlib.import_module(package + ".tracing")
+    pattern_io = importlib.import_module(package + ".pattern_io")
+
+    trace_directory = tempfile.mkdtemp(prefix="s2s-worker-")
+    os.environ[tracing.ENV_DIRECTORY] = trace_directory
+    trace_path = os.path.join(trace_directory, tracing.JSONL_FILE)
+    offset = 0
+
+    def answer(message):
+        sys.stdout.write(RESULT_PREFIX + json.dumps(message) + "\n")
+        sys.stdout.flush()
+
+    answer({"status": READY, "pid": os.getpid()})
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        started = time.perf_counter()
+        try:
+            steps, offset = run_job(bpy, tracing, pattern_io, job, trace_path, offset)
+            answer({"id": job.get("id"), "status": "done", "seconds": time.perf_counter() - started, "steps": steps})
+        except Exception as error:
+            answer({"id": job.get("id"), "status": "failed", "seconds": time.perf_counter() - started, "error": str(error), "traceback": traceback.format_exc()})
+
+
+# Daemon, plain Python
+
+class Worker:
+    """ One Blender process, that runs one job at a time """
+    def __init__(self, args, number):
+        self.args = args
+        self.number = number
+        self.process = None
+
+    async def start(self):
+        command = [self.args.blender, "-b", "--python", os.path.abspath(__file__), "--", "work"]
+        if self.args.addon:
+            command += ["--addon", self.args.addon]
+        self.process = await asyncio.create_subprocess_exec(
+            *command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        message = await self.read()
+        if message is None or message.get("status") != READY:
+            raise RuntimeError("worker %d didn't start" % self.number)
+
+    async def read(self):
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                return None # the process is gone
+            line = line.decode(errors="replace")
+            if line.startswith(RESULT_PREFIX):
+                return json.loads(line[len(RESULT_PREFIX):])
+
+    async def run(self, job):
+        if self.process is None or self.process.returncode is not None:
+            await self.start()
+        self.process.stdin.write((json.dumps(job) + "\n").encode())
+        await self.process.stdin.drain()
+        message = await self.read()
+        if message is None:
+            # crashed, the next job gets a fresh process
+            self.process = None
+            return {"id": job.get("id"), "status": "failed", "error": "Blender worker %d exited" % self.number}
+        return message
+
+    async def stop(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.stdin.close()
+            await self.process.wait()
+
+
+async def serve(args):
+    queue = asyncio.Queue()
+    workers = [Worker(args, n) for n in range(args.workers)]
+    await asyncio.gather(*(w.start() for w in workers))
+
+    async def consume(worker):
+        while True:
+            job, reply, finished = await queue.get()
+            job_started = time.perf_counter()
+            try:
+                result = await worker.run(job)
+            except Exception as error:
+                result = {"id": job.get("id"), "status": "failed", "error": str(error)}
+            result["worker"] = worker.number
+            result["wall_seconds"] = time.perf_counter() - job_started
+            try:
+                await reply(result)
+            except ConnectionError:
+                pass # the client is gone, the job is done anyway
+            finished.set_result(None)
+
+    async def handle(reader, writer):
+        lock = asyncio.Lock()
+        pending = []
+
+        async def reply(message):
+            async with lock:
+                writer.write((json.dumps(message) + "\n").encode())
+                await writer.drain()
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                job = json.loads(line)
+            except ValueError as error:
+                await reply({"status": "failed", "error": "Not a JSON job: " + str(error)})
+                continue
+            finished = asyncio.get_running_loop().create_future()
+            pending.append(finished)
+            await queue.put((job, reply, finished))
+            await reply({"id": job.get("id"), "status": "queued", "position": queue.qsize()})
+        # answer everything this client queued before closing
+        await asyncio.gather(*pending)
+        writer.close()
+
+    consumers = [asyncio.ensure_future(consume(w)) for w in workers]
+    server = await asyncio.start_server(handle, "127.0.0.1", args.port)
+    print("Serving %d Blender workers on 127.0.0.1:%d" % (len(workers), args.port))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for consumer in consumers:
+            consumer.cancel()
+        await asyncio.gather(*(w.stop() for w in workers))
+
+
+async def submit(args):
+    with open(args.jobs) as file:
+        jobs = json.load(file)
+    if isinstance(jobs, dict):
+        jobs = [jobs]
+    reader, writer = await asyncio.open_connection("127.0.0.1", args.port)
+    for job in jobs:
+        writer.write((json.dumps(job) + "\n").encode())
+    await writer.drain()
+
+    remaining = len(jobs)
+    while remaining:
+        line = await reader.readline()
+        if not line:
+            break
+        message = json.loads(line)
+        print(json.dumps(message))
+        if message.get("status") in ("done", "failed"):
+            remaining -= 1
+    writer.close()
+
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parse_arguments(argv)
+    if args.command == "work":
+        work(args)
+    elif args.command == "serve":
+        asyncio.run(serve(args))
+    else:
+        asyncio.run(submit(args))
+
+
+if __name__ == "__main__":
+    main()